@@ -1,19 +1,196 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import json
+import os
 import sys
+import time
+# --startup-timing 的起点，放在所有导入之前
+_STARTUP_T0 = time.perf_counter()
+
+
+# 单实例：第一个进程在本地套接字上监听，之后的调用把文件路径交给它后立即退出。
+# 客户端只用标准库，并且在其余导入（尤其是 PyQt5）之前运行
+def instance_server_name() -> str:
+    if os.name == "nt":
+        return f"simplenotepad-{os.environ.get('USERNAME', 'user')}"
+    base = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    return os.path.join(base, f"simplenotepad-{os.getuid()}.sock")
+
+
+# 带参数的 Qt 命令行选项（QApplication/QGuiApplication 文档），其后的值不是要打开的文件
+QT_VALUE_OPTIONS = frozenset({
+    "-style", "-stylesheet", "-platform", "-platformpluginpath", "-platformtheme", "-plugin", "-qmljsdebugger",
+    "-qwindowgeometry", "-geometry", "-qwindowtitle", "-title", "-qwindowicon", "-display", "-session", "-name",
+    "-font", "-fn", "-background", "-bg", "-foreground", "-fg", "-button", "-btn", "-visual", "-ncols",
+    "-inputstyle", "-im", "-dialogs", "-graphicssystem",
+})
+
+
+def split_qt_args(args: list) -> tuple:
+    # 把带参数的 Qt 选项连同取值（"-style fusion"，也接受 "--style"）分出来，返回 (Qt 参数, 其余参数)
+    qt_args = []
+    rest = []
+    i = 0
+    while i < len(args):
+        if "-" + args[i].lstrip("-") in QT_VALUE_OPTIONS and args[i].startswith("-"):
+            qt_args += args[i:i + 2]
+            i += 2
+        else:
+            rest.append(args[i])
+            i += 1
+    return qt_args, rest
+
+
+def send_to_running_instance(files: list, timeout: float = 2.0) -> bool:
+    import json
+    payload = (json.dumps({"files": files}) + "\n").encode("utf-8")
+    name = instance_server_name()
+    try:
+        if os.name == "nt":
+            with open("\\\\.\\pipe\\" + name, "r+b", buffering=0) as pipe:
+                pipe.write(payload)
+                return pipe.readline().strip() == b"ok"
+        import socket
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(name)
+            sock.sendall(payload)
+            return sock.makefile("rb").readline().strip() == b"ok"
+    except OSError:
+        return False
+
+
+def forward_to_running_instance(args: list) -> bool:
+    if any(a in ("--new-instance", "--startup-timing", "-h", "--help") for a in args):
+        return False
+    files = []
+    missing = []
+    for name in split_qt_args(args)[1]:
+        if name.startswith("-"):
+            continue
+        path = os.path.abspath(os.path.expanduser(name))
+        (files if os.path.isfile(path) else missing).append(path)
+    if not send_to_running_instance(files):
+        return False
+    for name in missing:
+        print("main: file not found:", name, file=sys.stderr)
+    return True
+
+
+# 批量转换是纯命令行模式，在导入 PyQt5 之前分流。以 notepad_io 作为主模块运行：spawn 启动的工作进程
+# 会重新导入主模块，按模块名导入的是 notepad_io，而不是再执行一遍本文件（那样会导入 Qt）
+if __name__ == "__main__" and "--convert" in sys.argv[1:]:
+    import runpy
+    runpy.run_module("notepad_io", run_name="__main__", alter_sys=True)
+    raise SystemExit(0)
+
+if __name__ == "__main__" and forward_to_running_instance(sys.argv[1:]):
+    raise SystemExit(0)
+
+import argparse
+import bisect
+import codecs
+import concurrent.futures
+import contextlib
+import difflib
+import functools
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import queue
+import re
+import threading
+import uuid
+from array import array
+from collections import OrderedDict, deque
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Set, Tuple
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+from notepad_io import (
+    BOM_ENCODINGS, COMPRESSION_MAGIC_BYTES, DECOMPRESS_CACHE_MB, DEFAULT_ENCODING, ENCODING_SAMPLE_SIZE,
+    FALLBACK_ENCODINGS, DecompressedCache, FallbackDecoder, RawReadCounter,
+    atomic_write_chunks, compression_for_path, decode_chunks, decompressing_reader, detect_compression,
+    detect_encoding, disk_state, file_compression, file_digest, file_fingerprint, is_binary_sample,
+    iter_byte_chunks, iter_decoded_chunks, iter_search_files, iter_text_chunks, new_digest, save_text_file,
+)
+from notepad_buffer import PieceBuffer, snapshot_text
+
 APP_NAME = "简单记事本"
 CFG_FILENAME = Path.home() / ".simplenotepad_config.json"
-FILE_FILTER = "文本文件 (*.txt);;所有文件 (*)"
-DEFAULT_ENCODING = "utf-8"
-FALLBACK_ENCODINGS = ["utf-8", "gb18030", "gbk", "latin-1"]
+FILE_FILTER = "文本文件 (*.txt);;压缩文件 (*.gz *.bz2 *.xz *.zst);;所有文件 (*)"
 MAX_RECENT = 8
+# 后台加载时每批插入文档的字符数（读块大小见 notepad_io）
+LOAD_BATCH_CHARS = 4 * 1024 * 1024
+# 超过阈值的文件以只读分页模式打开（内存映射 + 稀疏行索引）
+LARGE_FILE_THRESHOLD_MB = 256
+LINE_INDEX_BLOCK = 1024 * 1024
+# 分页视图里超过这个字节数的行按块解码，只取可见的一段
+LARGE_VIEW_CHUNK_BYTES = 64 * 1024
+LARGE_VIEW_TAB_WIDTH = 8
+# 长行模式：加载时发现超过这么多字符的行就改用分页视图（不折行，只解码和排版可见的一段），0 表示不检测
+LONG_LINE_CHARS = 64 * 1024
+LONG_LINE_EDIT_HINT = "取消“查看 → 长行模式”可在编辑器里编辑（超长行排版较慢）"
+# 崩溃恢复日志
+JOURNAL_DIR = Path.home() / ".simplenotepad_journal"
+JOURNAL_COMPACT_MIN_BYTES = 4 * 1024 * 1024
+# 多标签：已加载文档的内存预算，超出时回收最久未使用的标签
+TAB_MEMORY_BUDGET_MB = 512
+TAB_BLOCK_OVERHEAD = 128
+# 查找：后台线程按行对齐的块扫描，界面只高亮可见区域内的匹配
+FIND_CHUNK_CHARS = 1024 * 1024
+FIND_HIGHLIGHT_LIMIT = 2000
+FIND_RESTART_DELAY_MS = 200
+# 超过这个大小的文档不在输入或编辑时自动重新查找（取快照本身就要数秒），按回车或“下一个”时再查
+FIND_LIVE_MAX_CHARS = 16 * 1024 * 1024
+# 在文件中查找：每批交给工作进程的文件数/字节数上限，单个文件与总计的结果上限
+FIND_IN_FILES_BATCH_FILES = 64
+FIND_IN_FILES_BATCH_BYTES = 16 * 1024 * 1024
+FIND_IN_FILES_MAX_PER_FILE = 1000
+FIND_IN_FILES_MAX_RESULTS = 20000
+FIND_IN_FILES_LINE_CHARS = 300
+FIND_IN_FILES_MAX_CARRY = 4 * 1024 * 1024
+# 跟随模式：文件监视之外再定时轮询（有些文件系统不发通知），每次最多读取的字节数，默认保留的行数
+FOLLOW_POLL_MS = 1000
+FOLLOW_READ_LIMIT = 4 * 1024 * 1024
+FOLLOW_MAX_LINES = 100000
+# 外部修改检测：监视通知合并的间隔；重新加载求差异时不超过这么多行的片段直接用 difflib，
+# 更大的片段先用两边都只出现一次的行做锚点切开（difflib 遇到大量重复行时接近平方复杂度）
+DISK_CHECK_DELAY_MS = 200
+RELOAD_DIFF_SMALL_LINES = 2000
+# 运行时计时：每种操作保留最近这么多个样本估计分位数
+PROFILE_SAMPLES = 1000
+# 语法高亮：超过这个大小的文档不高亮；只给可见区域及上下各这么多段落设置格式；确定起始状态时最多往前补算的行数，
+# 跨行状态的变化在可见区域之外最多传播的行数（超出部分滚动到时再算）；过长的行不高亮
+HIGHLIGHT_MAX_MB = 64
+HIGHLIGHT_MARGIN_BLOCKS = 50
+HIGHLIGHT_SYNC_LINES = 1000
+HIGHLIGHT_CARRY_LINES = 5000
+HIGHLIGHT_MAX_LINE_CHARS = 10000
+# 格式名 -> (颜色, 粗体, 斜体)；颜色在深色和浅色主题下都可读
+HIGHLIGHT_STYLES = {
+    "key": ("#3d8fd1", False, False),
+    "string": ("#3f9f4f", False, False),
+    "number": ("#d2691e", False, False),
+    "keyword": ("#a05cc8", False, False),
+    "comment": ("#808890", False, True),
+    "section": ("#3d8fd1", True, False),
+    "timestamp": ("#808890", False, False),
+    "error": ("#e0443e", True, False),
+    "warning": ("#e08e0b", True, False),
+    "info": ("#2e9e8f", False, False),
+    "debug": ("#808890", False, False),
+}
+# 配置改动停止一段时间后才写盘，连续调整字号时只写一次
+CONFIG_SAVE_DELAY_MS = 1000
+# 标题、状态栏和行列号在同一个定时器里合并刷新，每次击键不再逐个重绘；0 表示立即刷新
+UI_UPDATE_INTERVAL_MS = 40
+# 含这些记号的正则可能跨行匹配，不能按行切块，整段扫描
+_SPANNING_TOKENS = ("\\n", "\\r", "\\s", "\\S", "\\W", "\\D", "\\Z", "[^", "(?s")
+_ASTRAL_RE = re.compile("[\U00010000-\U0010ffff]")
 
 
 @dataclass
@@ -23,10 +200,21 @@ class AppConfig:
     font_size: int = 14
     encoding: str = DEFAULT_ENCODING
     recent_files: List[str] = None
+    large_file_threshold_mb: int = LARGE_FILE_THRESHOLD_MB
+    tab_memory_budget_mb: int = TAB_MEMORY_BUDGET_MB
+    open_tabs: List[str] = None
+    active_tab: int = 0
+    follow_max_lines: int = FOLLOW_MAX_LINES
+    syntax_highlight: bool = True
+    highlight_max_mb: int = HIGHLIGHT_MAX_MB
+    long_line_chars: int = LONG_LINE_CHARS
+    decompress_cache_mb: int = DECOMPRESS_CACHE_MB
 
     def __post_init__(self):
         if self.recent_files is None:
             self.recent_files = []
+        if self.open_tabs is None:
+            self.open_tabs = []
 
 
 def load_config() -> AppConfig:
@@ -40,39 +228,2153 @@ def load_config() -> AppConfig:
                 font_size=int(data.get("font_size", 14)) if data.get("font_size") is not None else 14,
                 encoding=data.get("encoding", DEFAULT_ENCODING),
                 recent_files=data.get("recent_files", []) or [],
+                large_file_threshold_mb=int(data.get("large_file_threshold_mb", LARGE_FILE_THRESHOLD_MB)),
+                tab_memory_budget_mb=int(data.get("tab_memory_budget_mb", TAB_MEMORY_BUDGET_MB)),
+                open_tabs=data.get("open_tabs", []) or [],
+                active_tab=int(data.get("active_tab", 0)),
+                follow_max_lines=int(data.get("follow_max_lines", FOLLOW_MAX_LINES)),
+                syntax_highlight=bool(data.get("syntax_highlight", True)),
+                highlight_max_mb=int(data.get("highlight_max_mb", HIGHLIGHT_MAX_MB)),
+                long_line_chars=int(data.get("long_line_chars", LONG_LINE_CHARS)),
+                decompress_cache_mb=int(data.get("decompress_cache_mb", DECOMPRESS_CACHE_MB)),
             )
     except Exception as exc:
         print("load_config error:", exc, file=sys.stderr)
     return AppConfig()
 
 
-def save_config(cfg: AppConfig) -> None:
-    try:
-        s = asdict(cfg)
-        with CFG_FILENAME.open("w", encoding="utf-8") as f:
-            json.dump(s, f, ensure_ascii=False, indent=2)
-    except Exception as exc:
-        print("save_config error:", exc, file=sys.stderr)
-def dark_palette() -> QtGui.QPalette:
-    p = QtGui.QPalette()
-    p.setColor(QtGui.QPalette.Window, QtGui.QColor("#0f1115"))
-    p.setColor(QtGui.QPalette.Base, QtGui.QColor("#0b0d10"))
-    p.setColor(QtGui.QPalette.Text, QtGui.QColor("#d7e0ea"))
-    p.setColor(QtGui.QPalette.ButtonText, QtGui.QColor("#d7e0ea"))
-    p.setColor(QtGui.QPalette.Highlight, QtGui.QColor("#4fc3f7"))
-    return p
+def config_json(cfg: AppConfig) -> str:
+    return json.dumps(asdict(cfg), ensure_ascii=False, indent=2)
+
+
+def save_config(cfg: AppConfig) -> bool:
+    # 临时文件 + 原子替换：写到一半崩溃也不会留下 load_config 读不了的配置
+    try:
+        atomic_write_chunks(CFG_FILENAME, [config_json(cfg)], "utf-8")
+        return True
+    except Exception as exc:
+        print("save_config error:", exc, file=sys.stderr)
+        return False
+
+
+class ConfigStore(QtCore.QObject):
+    # 改动先记在内存里，停止变化 CONFIG_SAVE_DELAY_MS 后或退出时再写盘；内容与上次写入相同就跳过
+    def __init__(self, config: AppConfig, parent: Optional[QtCore.QObject] = None,
+                 delay_ms: int = CONFIG_SAVE_DELAY_MS) -> None:
+        super().__init__(parent)
+        self.config = config
+        self.requests = 0
+        self.flushes = 0
+        self.skipped = 0
+        self._saved = config_json(config)
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def mark_dirty(self) -> None:
+        self.requests += 1
+        self._timer.start()
+
+    def flush(self) -> bool:
+        self._timer.stop()
+        text = config_json(self.config)
+        if text == self._saved:
+            self.skipped += 1
+            return False
+        if not save_config(self.config):
+            return False
+        self._saved = text
+        self.flushes += 1
+        return True
+def dark_palette() -> QtGui.QPalette:
+    p = QtGui.QPalette()
+    p.setColor(QtGui.QPalette.Window, QtGui.QColor("#0f1115"))
+    p.setColor(QtGui.QPalette.Base, QtGui.QColor("#0b0d10"))
+    p.setColor(QtGui.QPalette.Text, QtGui.QColor("#d7e0ea"))
+    p.setColor(QtGui.QPalette.ButtonText, QtGui.QColor("#d7e0ea"))
+    p.setColor(QtGui.QPalette.Highlight, QtGui.QColor("#4fc3f7"))
+    return p
+
+
+class OperationProfiler:
+    # 可选的运行时计时：按操作名累计次数和耗时，并保留最近的样本估计分位数，在“帮助 → 性能诊断”里查看。
+    # 默认关闭，关闭时 measure() 返回空的上下文管理器；启动前设置环境变量 NOTEPAD_PROFILE=1 或在诊断窗口里打开
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._ops: dict = {}
+        self._lock = threading.Lock()
+
+    def measure(self, name: str):
+        return _TimedOperation(self, name) if self.enabled else _UNTIMED
+
+    def record(self, name: str, seconds: float) -> None:
+        # 后台线程也会记录
+        with self._lock:
+            op = self._ops.get(name)
+            if op is None:
+                op = self._ops[name] = [0, 0.0, 0.0, deque(maxlen=PROFILE_SAMPLES)]
+            op[0] += 1
+            op[1] += seconds
+            op[2] = max(op[2], seconds)
+            op[3].append(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ops.clear()
+
+    def summary(self) -> List[dict]:
+        # 按总耗时从高到低，时间单位为毫秒
+        with self._lock:
+            ops = [(name, count, total, worst, sorted(samples)) for name, (count, total, worst, samples) in self._ops.items()]
+        rows = []
+        for name, count, total, worst, samples in sorted(ops, key=lambda op: -op[2]):
+            rows.append({
+                "name": name,
+                "count": count,
+                "total_ms": total * 1000,
+                "mean_ms": total / count * 1000,
+                "p50_ms": samples[len(samples) // 2] * 1000,
+                "p99_ms": samples[min(len(samples) - 1, len(samples) * 99 // 100)] * 1000,
+                "max_ms": worst * 1000,
+            })
+        return rows
+
+
+class _TimedOperation:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: OperationProfiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+_UNTIMED = contextlib.nullcontext()
+PROFILER = OperationProfiler(os.environ.get("NOTEPAD_PROFILE", "") not in ("", "0"))
+
+
+def profiled(name: str):
+    # 热点方法的计时装饰器；是否记录在调用时判断，诊断窗口里打开后立即生效
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return fn(*args, **kwargs)
+            with _TimedOperation(PROFILER, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class BackgroundTask(QtCore.QThread):
+    # 在工作线程里执行一个函数，结果或异常通过信号回到界面线程
+    succeeded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+
+    def __init__(self, fn, *args, parent=None) -> None:
+        super().__init__(parent)
+        self.fn = fn
+        self.args = args
+
+    def run(self) -> None:
+        try:
+            with PROFILER.measure(f"后台：{self.fn.__name__}"):
+                result = self.fn(*self.args)
+        except Exception as exc:
+            print("BackgroundTask error:", exc, file=sys.stderr)
+            self.failed.emit(exc)
+            return
+        self.succeeded.emit(result)
+
+
+def scan_long_line(text: str, run: int, limit: int) -> int:
+    # run 是上一块末尾尚未结束的那一行已有的字符数；返回本块末尾的 run，发现超过 limit 个字符的行时返回 -1。
+    # 按 limit/2 的步长取窗口找换行，超长行必定完整覆盖某个窗口；普通文本每个窗口只调用一次 find
+    first = text.find("\n")
+    if first == -1:
+        run += len(text)
+        return -1 if run > limit else run
+    if run + first > limit:
+        return -1
+    last = text.rfind("\n")
+    step = max(1, limit // 2)
+    for pos in range(first + 1, last, step):
+        if text.find("\n", pos, pos + step) == -1:
+            # 整个窗口里没有换行，量出所在行的实际长度
+            if text.find("\n", pos) - text.rfind("\n", 0, pos) - 1 > limit:
+                return -1
+    run = len(text) - last - 1
+    return -1 if run > limit else run
+
+
+class FileLoadThread(QtCore.QThread):
+    chunk_ready = QtCore.pyqtSignal(str)
+    progress = QtCore.pyqtSignal(int, int)
+    detected = QtCore.pyqtSignal(str, float)
+    restarted = QtCore.pyqtSignal(str)
+    loaded = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str)
+    # 发现超长行时发出（参数为编码）并停止加载，由界面改用长行模式打开
+    long_line = QtCore.pyqtSignal(str)
+
+    def __init__(self, path: Path, encoding: Optional[str] = None, long_line_chars: int = 0,
+                 cache: Optional[DecompressedCache] = None, parent=None) -> None:
+        super().__init__(parent)
+        self.path = path
+        # encoding 为 None 时自动探测
+        self.encoding = encoding
+        self.long_line_chars = long_line_chars
+        self.cache = cache
+        self.fingerprint: Optional[dict] = None
+        # 实际读到的字节数：加载期间文件还在增长时可能大于 fingerprint 里的大小，跟随模式从这里接着读。
+        # 压缩文件是解压后的字节数
+        self.bytes_read = 0
+        self.disk_state: Optional[dict] = None
+        self.digest: Optional[bytes] = None
+        # 按魔数识别的压缩格式，None 表示普通文件
+        self.compression: Optional[str] = None
+        self._counter: Optional[RawReadCounter] = None
+        self._cached: Optional[Tuple[bytes, bytes]] = None
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def _hashed(self, chunks, h):
+        for data in chunks:
+            h.update(data)
+            yield data
+
+    def _kept(self, chunks, kept: list):
+        # 解压出的内容留一份给缓存，超出缓存预算就不留
+        size = 0
+        for data in chunks:
+            size += len(data)
+            if size <= self.cache.budget:
+                kept.append(data)
+            elif kept:
+                kept.clear()
+            yield data
+
+    def _open_source(self, f):
+        # 从头读取文件内容的流：压缩文件边读边解压，命中缓存时直接读内存里解压好的内容
+        f.seek(0)
+        self._counter = None
+        if self.compression is None:
+            return f
+        if self._cached is not None:
+            return io.BytesIO(self._cached[0])
+        self._counter = RawReadCounter(f)
+        return decompressing_reader(self._counter, self.compression)
+
+    def _stream(self, src, prefix: bytes, decoder: FallbackDecoder, confidence: float, total: int) -> bool:
+        done = 0
+        index = decoder.index
+        run = 0
+        h = new_digest()
+        chunks = iter_byte_chunks(src, prefix)
+        if self.compression is None:
+            chunks = self._hashed(chunks, h)
+        kept = [] if self._counter is not None and self.cache is not None else None
+        if kept is not None:
+            chunks = self._kept(chunks, kept)
+        for text, nbytes in decode_chunks(chunks, decoder):
+            if self._cancelled:
+                return False
+            if decoder.index != index:
+                # 前面全是 ASCII，已就地换成下一个候选编码接着解码
+                index = decoder.index
+                if confidence >= 0:
+                    self.detected.emit(decoder.encoding, confidence / 2 ** index)
+            done += nbytes
+            if self.long_line_chars > 0:
+                run = scan_long_line(text, run, self.long_line_chars)
+                if run < 0:
+                    self.long_line.emit(decoder.encoding)
+                    return False
+            if text:
+                self.chunk_ready.emit(text)
+            # 压缩文件的进度按读过的压缩字节算
+            self.progress.emit(done if self._counter is None else self._counter.bytes_read, total)
+        self.bytes_read = done
+        if self._counter is not None:
+            # 摘要按磁盘上的压缩字节算，与外部修改检测和保存后的摘要一致
+            self._counter.drain()
+            self.digest = self._counter.digest.digest()
+            if kept:
+                self.cache.put(DecompressedCache.key(self.path, self.disk_state), b"".join(kept), self.digest)
+        elif self._cached is not None:
+            self.digest = self._cached[1]
+        else:
+            self.digest = h.digest()
+        return True
+
+    @profiled("后台：加载文件")
+    def run(self) -> None:
+        try:
+            with self.path.open("rb") as f:
+                st = os.fstat(f.fileno())
+                total = st.st_size
+                self.fingerprint = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+                self.disk_state = disk_state(st)
+                self.compression = detect_compression(f.read(COMPRESSION_MAGIC_BYTES))
+                if self.compression is not None and self.cache is not None:
+                    self._cached = self.cache.get(DecompressedCache.key(self.path, self.disk_state))
+                    if self._cached is not None:
+                        total = len(self._cached[0])
+                src = self._open_source(f)
+                if self.encoding is None:
+                    sample = src.read(ENCODING_SAMPLE_SIZE)
+                    candidates, confidence = detect_encoding(sample, len(sample) < ENCODING_SAMPLE_SIZE)
+                else:
+                    sample = b""
+                    candidates, confidence = [self.encoding], -1.0
+                last_exc = None
+                # 只用选中的编码解码一遍；样本之后出现非法字节时，此前全是 ASCII 就地换下一个候选编码接着解码，
+                # 否则已显示的内容在新编码下含义不同，丢掉后用下一个候选编码从头重读
+                start = 0
+                while start < len(candidates):
+                    if start > 0:
+                        src = self._open_source(f)
+                        sample = b""
+                        self.restarted.emit(candidates[start])
+                    if confidence >= 0:
+                        self.detected.emit(candidates[start], confidence)
+                    decoder = FallbackDecoder(candidates[start:])
+                    try:
+                        if self._stream(src, sample, decoder, confidence, total):
+                            self.loaded.emit(decoder.encoding)
+                        return
+                    except UnicodeDecodeError as exc:
+                        last_exc = exc
+                        start += decoder.index + 1
+                        confidence /= 2 ** (decoder.index + 1)
+                if self.encoding is not None:
+                    raise last_exc or IOError("无法读取文件")
+                src = self._open_source(f)
+                self.restarted.emit("latin-1")
+                self.detected.emit("latin-1", 0.0)
+                if self._stream(src, b"", FallbackDecoder(["latin-1"], "replace"), -1.0, total):
+                    self.loaded.emit("latin-1")
+        except Exception as exc:
+            print("FileLoadThread error:", exc, file=sys.stderr)
+            self.failed.emit(str(exc))
+
+
+def _split_lines(text: str) -> List[str]:
+    # 每行保留换行符，拼接后与原文相同；行数与 QTextDocument 的段落数一致
+    lines = text.split("\n")
+    for i in range(len(lines) - 1):
+        lines[i] += "\n"
+    return lines
+
+
+def _unique_anchors(a: List[str], b: List[str], alo: int, ahi: int, blo: int, bhi: int) -> List[Tuple[int, int]]:
+    # 两边都只出现一次的行按旧文本顺序排列，取新文本行号的最长递增子序列作为锚点
+    first_a = {}
+    for i in range(alo, ahi):
+        first_a[a[i]] = -1 if a[i] in first_a else i
+    first_b = {}
+    for j in range(blo, bhi):
+        first_b[b[j]] = -1 if b[j] in first_b else j
+    pairs = sorted((i, first_b[line]) for line, i in first_a.items()
+                   if i >= 0 and first_b.get(line, -1) >= 0)
+    tails: List[int] = []
+    tail_index: List[int] = []
+    prev = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        prev[k] = tail_index[pos - 1] if pos else -1
+    anchors = []
+    k = tail_index[-1] if tail_index else -1
+    while k >= 0:
+        anchors.append(pairs[k])
+        k = prev[k]
+    anchors.reverse()
+    return anchors
+
+
+def _diff_range(a: List[str], b: List[str], alo: int, ahi: int, blo: int, bhi: int, ops: list) -> None:
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    if alo == ahi and blo == bhi:
+        return
+    if alo == ahi or blo == bhi:
+        ops.append((alo, ahi, "".join(b[blo:bhi])))
+        return
+    if (ahi - alo) + (bhi - blo) <= RELOAD_DIFF_SMALL_LINES:
+        matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                ops.append((alo + i1, alo + i2, "".join(b[blo + j1:blo + j2])))
+        return
+    anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+    if not anchors:
+        ops.append((alo, ahi, "".join(b[blo:bhi])))
+        return
+    for i, j in anchors:
+        _diff_range(a, b, alo, i, blo, j, ops)
+        alo, blo = i + 1, j + 1
+    _diff_range(a, b, alo, ahi, blo, bhi, ops)
+
+
+def line_diff(old: str, new: str) -> List[Tuple[int, int, str]]:
+    # 返回按行号升序的替换操作 (旧文本起始行, 结束行(不含), 新内容)
+    a = _split_lines(old)
+    b = _split_lines(new)
+    ops: List[Tuple[int, int, str]] = []
+    _diff_range(a, b, 0, len(a), 0, len(b), ops)
+    return ops
+
+
+def reload_diff(path: Path, encoding: str, old_text):
+    # 在工作线程里按已知编码读取磁盘上的新内容，与内存中的文档（字符串或快照）求行级差异
+    old_text = snapshot_text(old_text)
+    with path.open("rb") as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    h = new_digest()
+    h.update(data)
+    compression = detect_compression(data[:COMPRESSION_MAGIC_BYTES])
+    if compression is not None:
+        data = decompressing_reader(io.BytesIO(data), compression).read()
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors="strict"), translate=True)
+    text = decoder.decode(data, final=True)
+    del data
+    fingerprint = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return line_diff(old_text, text), disk_state(st), h.digest(), fingerprint
+
+
+class FileFollower(QtCore.QObject):
+    # 跟随模式：监视文件，只读取上次偏移之后追加的字节并增量解码（多字节字符跨两次读取也能接上）；
+    # 文件变短或被换成另一个文件（日志轮转）时从头重读
+    appended = QtCore.pyqtSignal(str)
+    reset = QtCore.pyqtSignal()
+
+    def __init__(self, path: Path, encoding: str, offset: int, parent=None) -> None:
+        super().__init__(parent)
+        self.path = path
+        self.encoding = encoding
+        self.offset = offset
+        self._identity = None
+        self._decoder = self._make_decoder()
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(lambda _path: self._read_timer.start())
+        self._poll_timer = QtCore.QTimer(self)
+        self._poll_timer.setInterval(FOLLOW_POLL_MS)
+        self._poll_timer.timeout.connect(self.poll)
+        # 监视通知常常一次来好几个，合并到下一轮事件循环再读
+        self._read_timer = QtCore.QTimer(self)
+        self._read_timer.setSingleShot(True)
+        self._read_timer.setInterval(0)
+        self._read_timer.timeout.connect(self.poll)
+
+    def _make_decoder(self):
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        if self.offset:
+            # 从文件中间接着解码：先把开头的 BOM 喂给解码器，UTF-16 等编码才知道字节序
+            try:
+                with self.path.open("rb") as f:
+                    head = f.read(4)
+            except OSError:
+                head = b""
+            for bom, _ in BOM_ENCODINGS:
+                if head.startswith(bom):
+                    decoder.decode(bom)
+                    break
+        return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+    def start(self) -> None:
+        st = self.path.stat()
+        self._identity = (st.st_dev, st.st_ino)
+        self._watcher.addPath(str(self.path))
+        self._poll_timer.start()
+        self.poll()
+
+    def stop(self) -> None:
+        self._poll_timer.stop()
+        self._read_timer.stop()
+        if self._watcher.files():
+            self._watcher.removePaths(self._watcher.files())
+
+    def poll(self) -> None:
+        try:
+            st = self.path.stat()
+        except OSError:
+            # 轮转过程中文件可能暂时不存在，下次轮询再看
+            return
+        if str(self.path) not in self._watcher.files():
+            self._watcher.addPath(str(self.path))
+        if (st.st_dev, st.st_ino) != self._identity or st.st_size < self.offset:
+            self._identity = (st.st_dev, st.st_ino)
+            self.offset = 0
+            self._decoder = self._make_decoder()
+            self.reset.emit()
+        if st.st_size == self.offset:
+            return
+        try:
+            with self.path.open("rb") as f:
+                f.seek(self.offset)
+                data = f.read(FOLLOW_READ_LIMIT)
+        except OSError as exc:
+            print("FileFollower read error:", exc, file=sys.stderr)
+            return
+        self.offset += len(data)
+        text = self._decoder.decode(data)
+        if text:
+            self.appended.emit(text)
+        # 一次追加很多时分批读，中间让界面重绘
+        if len(data) == FOLLOW_READ_LIMIT:
+            self._read_timer.start()
+
+
+class JournalBaseChanged(Exception):
+    pass
+
+
+class _ReplayBuffer:
+    # 回放用的分块 UTF-16 缓冲区：编辑大多集中在相邻位置，从上次命中的块开始找，
+    # 每条记录的代价只和编辑大小及移动距离有关，而不是整个文档
+    CHUNK = 64 * 1024
+
+    def __init__(self, data: bytes) -> None:
+        self.chunks = [bytearray(data[i:i + self.CHUNK]) for i in range(0, len(data), self.CHUNK)] or [bytearray()]
+        self._hint = 0
+        self._hint_start = 0
+
+    def _locate(self, off: int):
+        i, start = self._hint, self._hint_start
+        while off < start:
+            i -= 1
+            start -= len(self.chunks[i])
+        while i < len(self.chunks) - 1 and off >= start + len(self.chunks[i]):
+            start += len(self.chunks[i])
+            i += 1
+        self._hint, self._hint_start = i, start
+        return i, start
+
+    def replace(self, off: int, n: int, data: bytes) -> None:
+        i, start = self._locate(off)
+        k = off - start
+        chunk = self.chunks[i]
+        chunk[k:k] = data
+        k += len(data)
+        # 删除可能跨越多个块
+        j = i
+        while n > 0:
+            cut = min(n, len(self.chunks[j]) - k)
+            del self.chunks[j][k:k + cut]
+            n -= cut
+            j += 1
+            k = 0
+        empty = [x for x in range(i + 1, j) if not self.chunks[x]]
+        for x in reversed(empty):
+            del self.chunks[x]
+        if len(chunk) > 2 * self.CHUNK:
+            self.chunks[i:i + 1] = [chunk[p:p + self.CHUNK] for p in range(0, len(chunk), self.CHUNK)]
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def _journal_base_text(header: dict, directory: Path) -> str:
+    base = header["base"]
+    if base["kind"] == "snapshot":
+        with (directory / base["file"]).open("r", encoding="utf-8", errors="surrogatepass", newline="") as f:
+            return f.read()
+    if base["kind"] == "file":
+        path = Path(header["path"])
+        if not path.exists() or file_fingerprint(path) != base["fingerprint"]:
+            raise JournalBaseChanged(str(path))
+        with path.open("rb") as f:
+            compression = detect_compression(f.read(COMPRESSION_MAGIC_BYTES))
+            f.seek(0)
+            src = decompressing_reader(f, compression)
+            return "".join(t for t, _ in iter_decoded_chunks(iter_byte_chunks(src), header["encoding"], "replace"))
+    return ""
+
+
+def _journal_decode_error(exc: UnicodeError):
+    # 日志按 surrogatepass 写入；崩溃时最后一行可能断在多字节字符中间，换成替换字符，该行因没有换行符被丢弃
+    try:
+        return codecs.lookup_error("surrogatepass")(exc)
+    except UnicodeDecodeError:
+        return "\ufffd", exc.end
+
+
+codecs.register_error("journal", _journal_decode_error)
+
+
+def read_journal(journal_file: Path):
+    # 返回 (头信息, 定位在第一条记录处的文件句柄)；每条记录占一行
+    f = journal_file.open("r", encoding="utf-8", errors="journal", newline="\n")
+    header = json.loads(f.readline())
+    return header, f
+
+
+def replay_journal(journal_file: Path):
+    header, f = read_journal(journal_file)
+    with f:
+        buf = _ReplayBuffer(_journal_base_text(header, journal_file.parent).encode("utf-16-le", "surrogatepass"))
+        for line in f:
+            # 进程崩溃时最后一行可能只写了一半
+            if not line.endswith("\n"):
+                break
+            pos, removed, text = json.loads(line)
+            buf.replace(2 * pos, 2 * removed, text.encode("utf-16-le", "surrogatepass"))
+    return header, buf.getvalue().decode("utf-16-le", "surrogatepass")
+
+
+class JournalWriter(threading.Thread):
+    # 所有日志的文件操作都在这一个后台线程里串行执行；队列暂时空闲时统一 flush
+    def __init__(self) -> None:
+        super().__init__(name="journal-writer", daemon=True)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._dirty = set()
+
+    def submit(self, fn, *args) -> None:
+        self._queue.put((fn, args))
+
+    def mark_dirty(self, journal: "AutosaveJournal") -> None:
+        self._dirty.add(journal)
+
+    def run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception as exc:
+                print("JournalWriter error:", exc, file=sys.stderr)
+            if self._queue.empty():
+                self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        for journal in self._dirty:
+            try:
+                journal._w_flush()
+            except Exception as exc:
+                print("JournalWriter flush error:", exc, file=sys.stderr)
+        self._dirty.clear()
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        self.join()
+
+
+class AutosaveJournal:
+    # 每个文档一份崩溃恢复日志：界面线程只把 (位置, 删除长度, 插入文本) 交给写入线程追加，
+    # 写入量与编辑量成正比；日志超过阈值后由写入线程回放并压缩成快照。位置以 UTF-16 单元计，与 Qt 一致
+    def __init__(self, writer: JournalWriter, path: Optional[Path], encoding: str, base: dict, base_size: int) -> None:
+        self.writer = writer
+        self.id = uuid.uuid4().hex
+        self.file = JOURNAL_DIR / f"{self.id}.journal"
+        self.header = {"v": 1, "path": str(path) if path else None, "encoding": encoding, "base": base, "created": time.time()}
+        self._records = 0
+        self._bytes = 0
+        self._base_size = base_size
+        self._hold = 0
+        # 以下只在写入线程中访问
+        self._fh = None
+        self._lock: Optional[QtCore.QLockFile] = None
+        self._snap_seq = 0
+
+    def record(self, pos: int, removed: int, text: str) -> None:
+        self._records += 1
+        self._bytes += len(text) + 24
+        self.writer.submit(self._w_append, [pos, removed, text])
+        if self._hold == 0 and self._bytes > max(JOURNAL_COMPACT_MIN_BYTES, self._base_size // 2):
+            self._records = 0
+            self._bytes = 0
+            self.writer.submit(self._w_compact)
+
+    def checkpoint(self) -> int:
+        # 开始保存时调用：保存完成前不压缩，完成后丢弃检查点之前的记录
+        self._hold += 1
+        return self._records
+
+    def rebase_to_file(self, path: Path, encoding: str, fingerprint: dict, mark: int) -> None:
+        self._hold -= 1
+        header = dict(self.header, path=str(path), encoding=encoding, base={"kind": "file", "fingerprint": fingerprint})
+        self._records -= mark
+        self._bytes = 0
+        self._base_size = fingerprint["size"]
+        self.writer.submit(self._w_rewrite, header, mark)
+
+    def release(self) -> None:
+        self._hold -= 1
+
+    def rebase_to_text(self, text: str) -> None:
+        self._records = 0
+        self._bytes = 0
+        self._base_size = len(text)
+        self.writer.submit(self._w_snapshot, text)
+
+    def discard(self) -> None:
+        self.writer.submit(self._w_discard)
+
+    # 写入线程
+    def _w_open(self) -> None:
+        if self._fh is not None:
+            return
+        JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+        if self._lock is None:
+            self._lock = QtCore.QLockFile(str(self.file) + ".lock")
+            self._lock.tryLock(0)
+        is_new = not self.file.exists()
+        self._fh = self.file.open("a", encoding="utf-8", errors="surrogatepass", newline="\n")
+        if is_new:
+            self._fh.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+
+    def _w_close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _w_append(self, rec: list) -> None:
+        self._w_open()
+        self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.writer.mark_dirty(self)
+
+    def _w_flush(self) -> None:
+        if self._fh is not None:
+            self._fh.flush()
+
+    def _w_write(self, header: dict, records) -> None:
+        # 临时文件 + 原子替换，任何时刻磁盘上都是一份完整可回放的日志
+        self._w_close()
+        JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+        lines = [json.dumps(header, ensure_ascii=False) + "\n"]
+        atomic_write_chunks(self.file, _chain_lines(lines, records), "utf-8", errors="surrogatepass")
+        old = self.header["base"]
+        self.header = header
+        if old.get("kind") == "snapshot" and old != header["base"]:
+            try:
+                (JOURNAL_DIR / old["file"]).unlink()
+            except OSError:
+                pass
+        self._w_open()
+
+    def _w_rewrite(self, header: dict, skip: int) -> None:
+        if not self.file.exists():
+            self.header = header
+            return
+        self._w_flush()
+        _, f = read_journal(self.file)
+        with f:
+            records = [line for i, line in enumerate(f) if i >= skip and line.endswith("\n")]
+        self._w_write(header, records)
+
+    def _w_snapshot(self, text: str) -> None:
+        self._snap_seq += 1
+        name = f"{self.id}.{self._snap_seq}.snap"
+        JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+        atomic_write_chunks(JOURNAL_DIR / name, iter_text_chunks(text), "utf-8", errors="surrogatepass")
+        self._base_size = len(text)
+        self._w_write(dict(self.header, base={"kind": "snapshot", "file": name}), [])
+
+    def _w_compact(self) -> None:
+        self._w_flush()
+        try:
+            _, text = replay_journal(self.file)
+        except JournalBaseChanged as exc:
+            # 原文件已被外部修改，只能继续追加，无法压缩
+            print("journal compaction skipped, base changed:", exc, file=sys.stderr)
+            return
+        self._w_snapshot(text)
+
+    def _w_discard(self) -> None:
+        self._w_close()
+        self.writer._dirty.discard(self)
+        base = self.header["base"]
+        for p in (self.file, JOURNAL_DIR / base["file"] if base.get("kind") == "snapshot" else None):
+            if p is not None:
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+        if self._lock is not None:
+            self._lock.unlock()
+            self._lock = None
+
+
+def _chain_lines(head, tail):
+    yield from head
+    yield from tail
+
+
+def find_orphan_journals():
+    # 没有被其它运行中实例锁住、且确实有内容可恢复的日志
+    found = []
+    if not JOURNAL_DIR.is_dir():
+        return found
+    for jf in sorted(JOURNAL_DIR.glob("*.journal"), key=lambda p: p.stat().st_mtime, reverse=True):
+        lock = QtCore.QLockFile(str(jf) + ".lock")
+        if not lock.tryLock(0):
+            continue
+        try:
+            header, f = read_journal(jf)
+            with f:
+                has_records = any(line.endswith("\n") for line in f)
+        except Exception as exc:
+            print("find_orphan_journals error:", jf, exc, file=sys.stderr)
+            lock.unlock()
+            continue
+        if not has_records and header["base"]["kind"] != "snapshot":
+            remove_journal(jf, header)
+            lock.unlock()
+            continue
+        found.append((jf, header, lock))
+    return found
+
+
+def remove_journal(jf: Path, header: dict) -> None:
+    base = header.get("base", {})
+    paths = [jf]
+    if base.get("kind") == "snapshot":
+        paths.append(jf.parent / base["file"])
+    for p in paths:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+class LineIndex:
+    # 稀疏行索引：每 LINE_INDEX_BLOCK 字节只记录块开头之前的换行数（C 层 count，速度接近磁盘带宽），
+    # 块内各行的偏移在需要时才扫描，并只缓存最近用到的几个块，所以内存占用与文件大小基本无关
+    def __init__(self, buf, size: int) -> None:
+        self.buf = buf
+        self.size = size
+        self.block_lines = array("Q", [0])
+        self.newlines = 0
+        self.indexed = 0
+        self._blocks: "OrderedDict[int, List[int]]" = OrderedDict()
+
+    @property
+    def complete(self) -> bool:
+        return self.indexed >= self.size
+
+    @property
+    def line_count(self) -> int:
+        # 索引未完成时只暴露已确认的完整行
+        return self.newlines + 1 if self.complete else max(1, self.newlines)
+
+    def build(self, should_stop, on_progress=None) -> None:
+        release = getattr(mmap, "MADV_DONTNEED", None) if isinstance(self.buf, mmap.mmap) else None
+        released = 0
+        while self.indexed < self.size:
+            if should_stop():
+                return
+            start = self.indexed
+            end = min(start + LINE_INDEX_BLOCK, self.size)
+            # mmap 没有 count()，切片复制 1MB 的代价可以忽略
+            self.newlines += self.buf[start:end].count(b"\n")
+            if end < self.size:
+                self.block_lines.append(self.newlines)
+            self.indexed = end
+            # 扫描过的页立即交还给系统，常驻内存不随文件增大
+            if release is not None and end - released >= 64 * LINE_INDEX_BLOCK:
+                self.buf.madvise(release, released, end - released)
+                released = end
+            if on_progress is not None and (end % (64 * LINE_INDEX_BLOCK) == 0 or end == self.size):
+                on_progress(end, self.size)
+
+    def _block_newlines(self, block: int) -> List[int]:
+        cached = self._blocks.get(block)
+        if cached is not None:
+            self._blocks.move_to_end(block)
+            return cached
+        start = block * LINE_INDEX_BLOCK
+        end = min(start + LINE_INDEX_BLOCK, self.size)
+        positions = []
+        find = self.buf.find
+        pos = find(b"\n", start, end)
+        while pos != -1:
+            positions.append(pos)
+            pos = find(b"\n", pos + 1, end)
+        self._blocks[block] = positions
+        if len(self._blocks) > 16:
+            self._blocks.popitem(last=False)
+        return positions
+
+    def line_start(self, line: int) -> int:
+        if line <= 0:
+            return 0
+        # 第 line 个换行所在的块
+        block = bisect.bisect_left(self.block_lines, line) - 1
+        positions = self._block_newlines(block)
+        return positions[line - self.block_lines[block] - 1] + 1
+
+    def line_span(self, line: int):
+        start = self.line_start(line)
+        end = self.buf.find(b"\n", start)
+        if end == -1:
+            end = self.size
+        return start, end
+
+
+class LineIndexThread(QtCore.QThread):
+    progress = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, index: LineIndex, parent=None) -> None:
+        super().__init__(parent)
+        self.index = index
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def run(self) -> None:
+        try:
+            self.index.build(lambda: self._cancelled, self.progress.emit)
+        except Exception as exc:
+            print("LineIndexThread error:", exc, file=sys.stderr)
+
+
+class LargeFileView(QtWidgets.QAbstractScrollArea):
+    # 只读分页视图：只解码和绘制可见的几十行，文件内容留在内存映射里。水平方向同样虚拟化：
+    # 滚动条的值是第一个可见列，超长的行按块解码，每次只排版可见的一段
+    cursor_moved = QtCore.pyqtSignal(int, int)
+    # 在只读视图里输入文字时发出，由界面提示如何切换到可编辑的模式
+    edit_attempted = QtCore.pyqtSignal()
+
+    def __init__(self, index: LineIndex, encoding: str, parent=None) -> None:
+        super().__init__(parent)
+        self.index = index
+        self.encoding = encoding
+        self.cursor_line = 0
+        self.cursor_col = 0
+        self._max_cols = 0
+        # 超长行的解码检查点：行号 -> (字节偏移, 偏移之前的字符数)，只缓存最近用到的几行
+        self._chunks: "OrderedDict[int, Tuple[List[int], List[int]]]" = OrderedDict()
+        self.viewport().setBackgroundRole(QtGui.QPalette.Base)
+        self.viewport().setAutoFillBackground(True)
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.verticalScrollBar().setSingleStep(1)
+        self.horizontalScrollBar().setSingleStep(LARGE_VIEW_TAB_WIDTH)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update)
+        self.update_range()
+
+    def _line_bytes(self, line: int) -> Tuple[int, int]:
+        start, end = self.index.line_span(line)
+        if end > start and self.index.buf[end - 1] == 13:
+            end -= 1
+        return start, end
+
+    def _line_chunks(self, start: int, end: int) -> Tuple[List[int], List[int]]:
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        offsets = [start]
+        chars = [0]
+        n = 0
+        for pos in range(start, end, LARGE_VIEW_CHUNK_BYTES):
+            stop = min(end, pos + LARGE_VIEW_CHUNK_BYTES)
+            n += len(decoder.decode(self.index.buf[pos:stop], stop == end))
+            # 块边界切开多字节字符时，检查点退到该字符的第一个字节
+            offsets.append(stop - len(decoder.getstate()[0]))
+            chars.append(n)
+        return offsets, chars
+
+    def line_slice(self, line: int, first: int, last: int) -> Tuple[str, int]:
+        # 返回第 line 行 [first, last) 列的文本和整行的字符数
+        cached = self._chunks.get(line)
+        if cached is None:
+            start, end = self._line_bytes(line)
+            if end - start <= LARGE_VIEW_CHUNK_BYTES:
+                text = self.index.buf[start:end].decode(self.encoding, errors="replace")
+                return text[first:last], len(text)
+            cached = self._chunks[line] = self._line_chunks(start, end)
+            if len(self._chunks) > 8:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(line)
+        offsets, chars = cached
+        total = chars[-1]
+        first = max(0, min(first, total))
+        last = max(first, min(last, total))
+        i = bisect.bisect_right(chars, first) - 1
+        j = bisect.bisect_left(chars, last)
+        text = self.index.buf[offsets[i]:offsets[j]].decode(self.encoding, errors="replace")
+        return text[first - chars[i]:last - chars[i]], total
+
+    def line_length(self, line: int) -> int:
+        return self.line_slice(line, 0, 0)[1]
+
+    def _line_height(self) -> int:
+        return self.fontMetrics().lineSpacing()
+
+    def visible_lines(self) -> int:
+        return max(1, self.viewport().height() // self._line_height())
+
+    def visible_columns(self) -> int:
+        # 按窄字符估计一屏最多能放下的列数，多取的部分由视口裁掉
+        return self.viewport().width() // max(1, self.fontMetrics().horizontalAdvance("i")) + 1
+
+    def _page_columns(self) -> int:
+        return max(1, self.viewport().width() // max(1, self.fontMetrics().averageCharWidth()))
+
+    def update_range(self) -> None:
+        vbar = self.verticalScrollBar()
+        vbar.setRange(0, max(0, self.index.line_count - self.visible_lines()))
+        vbar.setPageStep(self.visible_lines())
+        hbar = self.horizontalScrollBar()
+        hbar.setRange(0, max(0, self._max_cols - self._page_columns() + 2))
+        hbar.setPageStep(self._page_columns())
+        self.viewport().update()
+
+    def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
+        super().resizeEvent(event)
+        self.update_range()
+
+    def _display(self, text: str) -> str:
+        return text.expandtabs(LARGE_VIEW_TAB_WIDTH)
+
+    @profiled("分页视图：绘制")
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        painter = QtGui.QPainter(self.viewport())
+        fm = self.fontMetrics()
+        lh = self._line_height()
+        first = self.verticalScrollBar().value()
+        first_col = self.horizontalScrollBar().value()
+        cols = self.visible_columns()
+        pal = self.palette()
+        painter.setPen(pal.color(QtGui.QPalette.Text))
+        longest = self._max_cols
+        for i in range(self.visible_lines() + 1):
+            line = first + i
+            if line >= self.index.line_count:
+                break
+            y = i * lh
+            text, length = self.line_slice(line, first_col, first_col + cols)
+            if line == self.cursor_line:
+                hl = QtGui.QColor(pal.color(QtGui.QPalette.Highlight))
+                hl.setAlpha(40)
+                painter.fillRect(0, y, self.viewport().width(), lh, hl)
+                if first_col <= self.cursor_col <= first_col + len(text):
+                    cx = 4 + fm.horizontalAdvance(self._display(text[:self.cursor_col - first_col]))
+                    painter.drawLine(cx, y, cx, y + lh - 1)
+            painter.drawText(4, y + fm.ascent(), self._display(text))
+            longest = max(longest, length)
+        painter.end()
+        if longest > self._max_cols:
+            self._max_cols = longest
+            QtCore.QTimer.singleShot(0, self.update_range)
+
+    def _scroll_to_column(self, line: int, col: int) -> None:
+        hbar = self.horizontalScrollBar()
+        first_col = hbar.value()
+        if col < first_col:
+            hbar.setValue(max(0, col - self._page_columns() // 4))
+        elif col - first_col > self.visible_columns() or (
+                4 + self.fontMetrics().horizontalAdvance(self._display(self.line_slice(line, first_col, col)[0]))
+                > self.viewport().width() - 8):
+            hbar.setValue(max(0, col - self._page_columns() * 3 // 4))
+
+    def set_cursor(self, line: int, col: int) -> None:
+        line = max(0, min(line, self.index.line_count - 1))
+        length = self.line_length(line)
+        col = max(0, min(col, length))
+        self.cursor_line = line
+        self.cursor_col = col
+        vbar = self.verticalScrollBar()
+        if line < vbar.value():
+            vbar.setValue(line)
+        elif line >= vbar.value() + self.visible_lines():
+            vbar.setValue(line - self.visible_lines() + 1)
+        # 绘制时发现的更长的行要等下一轮事件循环才更新范围，这里先更新，保证能滚动到光标所在列
+        self._max_cols = max(self._max_cols, length)
+        self.update_range()
+        self._scroll_to_column(line, col)
+        self.viewport().update()
+        self.cursor_moved.emit(line + 1, col + 1)
+
+    def goto_line(self, line: int) -> None:
+        self.set_cursor(line - 1, 0)
+        self.verticalScrollBar().setValue(max(0, line - 1 - self.visible_lines() // 2))
+
+    def keyPressEvent(self, event: QtGui.QKeyEvent) -> None:
+        key = event.key()
+        ctrl = event.modifiers() & QtCore.Qt.ControlModifier
+        line, col = self.cursor_line, self.cursor_col
+        page = self.visible_lines()
+        if key == QtCore.Qt.Key_Up:
+            self.set_cursor(line - 1, col)
+        elif key == QtCore.Qt.Key_Down:
+            self.set_cursor(line + 1, col)
+        elif key == QtCore.Qt.Key_PageUp:
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - page)
+            self.set_cursor(line - page, col)
+        elif key == QtCore.Qt.Key_PageDown:
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() + page)
+            self.set_cursor(line + page, col)
+        elif key == QtCore.Qt.Key_Home:
+            self.set_cursor(0 if ctrl else line, 0)
+        elif key == QtCore.Qt.Key_End:
+            target = self.index.line_count - 1 if ctrl else line
+            self.set_cursor(target, self.line_length(target))
+        elif key == QtCore.Qt.Key_Left:
+            self.set_cursor(line, col - 1)
+        elif key == QtCore.Qt.Key_Right:
+            self.set_cursor(line, col + 1)
+        else:
+            text = event.text()
+            editing = key in (QtCore.Qt.Key_Backspace, QtCore.Qt.Key_Delete, QtCore.Qt.Key_Return,
+                              QtCore.Qt.Key_Enter) or (text and text.isprintable())
+            if editing and not ctrl:
+                self.edit_attempted.emit()
+            super().keyPressEvent(event)
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:
+        line = self.verticalScrollBar().value() + event.pos().y() // self._line_height()
+        line = min(line, self.index.line_count - 1)
+        first_col = self.horizontalScrollBar().value()
+        text, _ = self.line_slice(line, first_col, first_col + self.visible_columns())
+        x = event.pos().x() - 4
+        fm = self.fontMetrics()
+        col = 0
+        while col < len(text) and fm.horizontalAdvance(self._display(text[:col + 1])) <= x:
+            col += 1
+        self.set_cursor(line, first_col + col)
+
+
+@dataclass(frozen=True)
+class SearchOptions:
+    pattern: str
+    case_sensitive: bool = False
+    whole_word: bool = False
+    regex: bool = False
+
+
+def compile_search(opts: SearchOptions):
+    source = opts.pattern if opts.regex else re.escape(opts.pattern)
+    if opts.whole_word:
+        source = rf"\b(?:{source})\b"
+    flags = re.MULTILINE if opts.case_sensitive else re.MULTILINE | re.IGNORECASE
+    return re.compile(source, flags)
+
+
+def search_spans_lines(opts: SearchOptions) -> bool:
+    if not opts.regex:
+        return "\n" in opts.pattern
+    return "\n" in opts.pattern or any(tok in opts.pattern for tok in _SPANNING_TOKENS)
+
+
+def _astral_positions(text: str, pos: int, end: int) -> List[int]:
+    # BMP 以外的字符在 UTF-16 中占两个单位；绝大多数文本一个也没有，先用 isascii/编码长度快速排除
+    seg = text[pos:end]
+    if seg.isascii() or len(seg.encode("utf-16-le", "surrogatepass")) == 2 * len(seg):
+        return []
+    return [m.start() + pos for m in _ASTRAL_RE.finditer(seg)]
+
+
+def utf16_offset(text: str, index: int) -> int:
+    # Qt 的位置按 UTF-16 计数
+    units = index
+    for pos in range(0, index, FIND_CHUNK_CHARS):
+        units += len(_astral_positions(text, pos, min(index, pos + FIND_CHUNK_CHARS)))
+    return units
+
+
+def find_matches(text: str, pattern, spanning: bool, should_stop=None, chunk_chars: int = FIND_CHUNK_CHARS):
+    # 按行对齐切块扫描：块结束在换行符处（endpos 语义与真实行尾一致），下一块从换行符之后开始；
+    # 每块产出一批 (起点, 长度)，均为 UTF-16 单位。每块只持有 GIL 很短时间，界面线程不会被饿死
+    n = len(text)
+    pos = 0
+    extra = 0
+    while pos <= n:
+        if should_stop is not None and should_stop():
+            return
+        end = n
+        if not spanning and pos + chunk_chars < n:
+            end = text.find("\n", pos + chunk_chars)
+            if end < 0:
+                end = n
+        astral = _astral_positions(text, pos, end)
+        spans = [m.span() for m in pattern.finditer(text, pos, end)]
+        if astral:
+            spans = [(s + extra + bisect.bisect_left(astral, s), e + extra + bisect.bisect_left(astral, e)) for s, e in spans]
+        elif extra:
+            spans = [(s + extra, e + extra) for s, e in spans]
+        yield array("Q", [s for s, _ in spans]), array("Q", [e - s for s, e in spans])
+        extra += len(astral)
+        pos = end + 1
+
+
+def _common_suffix_length(a: str, a_start: int, b: str, block: int = 64 * 1024) -> int:
+    # 按块从尾部比较，只需精确到块；多插入几十 KB 未变化的内容不影响结果
+    limit = min(len(a) - a_start, len(b))
+    n = 0
+    while n < limit:
+        k = min(block, limit - n)
+        if a[len(a) - n - k:len(a) - n] != b[len(b) - n - k:len(b) - n]:
+            break
+        n += k
+    return n
+
+
+def replace_all_text(text, pattern, replacement: str, regex: bool, spanning: bool):
+    # 一次 subn 得到替换结果，再裁掉首尾不变的部分，界面只需做一次插入。
+    # 返回 (UTF-16 起点, UTF-16 终点, 新文本, 替换次数)，没有匹配时返回 None
+    text = snapshot_text(text)
+    first = pattern.search(text)
+    if first is None:
+        return None
+    # 从首个匹配所在行的行首开始替换，保证 ^、\b 和后顾断言看到的上下文不变
+    start = 0 if spanning else text.rfind("\n", 0, first.start()) + 1
+    template = replacement if regex else replacement.replace("\\", "\\\\")
+    new_tail, count = pattern.subn(template, text[start:])
+    suffix = _common_suffix_length(text, start, new_tail)
+    end = len(text) - suffix
+    new_mid = new_tail[:len(new_tail) - suffix]
+    del new_tail
+    return utf16_offset(text, start), utf16_offset(text, end), new_mid, count
+
+
+def _utf16_to_index(text: str, offset: int) -> int:
+    if not _ASTRAL_RE.search(text):
+        return offset
+    units = 0
+    for i, ch in enumerate(text):
+        if units >= offset:
+            return i
+        units += 2 if ord(ch) > 0xFFFF else 1
+    return len(text)
+
+
+class SearchThread(QtCore.QThread):
+    # 在文本快照上查找，匹配按块分批送回界面线程
+    found = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, text, pattern, spanning: bool, parent=None) -> None:
+        super().__init__(parent)
+        # 字符串或文档快照，快照在工作线程里才拼接成字符串
+        self.text = text
+        self.pattern = pattern
+        self.spanning = spanning
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def run(self) -> None:
+        try:
+            text = snapshot_text(self.text)
+            for starts, lengths in find_matches(text, self.pattern, self.spanning, lambda: self._cancelled):
+                if starts:
+                    self.found.emit(starts, lengths)
+        except Exception as exc:
+            print("SearchThread error:", exc, file=sys.stderr)
+        self.text = ""
+
+
+class FindBar(QtWidgets.QWidget):
+    # 窗口底部的查找/替换栏，逻辑在主窗口中
+    options_changed = QtCore.pyqtSignal()
+    closed = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.find_edit = QtWidgets.QLineEdit(self)
+        self.find_edit.setPlaceholderText("查找")
+        self.find_edit.setClearButtonEnabled(True)
+        self.replace_edit = QtWidgets.QLineEdit(self)
+        self.replace_edit.setPlaceholderText("替换为")
+        self.case_box = QtWidgets.QCheckBox("区分大小写", self)
+        self.word_box = QtWidgets.QCheckBox("全字匹配", self)
+        self.regex_box = QtWidgets.QCheckBox("正则表达式", self)
+        self.count_label = QtWidgets.QLabel("", self)
+        self.prev_button = QtWidgets.QPushButton("上一个", self)
+        self.next_button = QtWidgets.QPushButton("下一个", self)
+        self.replace_button = QtWidgets.QPushButton("替换", self)
+        self.replace_all_button = QtWidgets.QPushButton("全部替换", self)
+        close_button = QtWidgets.QToolButton(self)
+        close_button.setText("✕")
+        close_button.setAutoRaise(True)
+        close_button.clicked.connect(self.closed.emit)
+
+        grid = QtWidgets.QGridLayout(self)
+        grid.setContentsMargins(6, 4, 6, 4)
+        grid.addWidget(self.find_edit, 0, 0)
+        grid.addWidget(self.prev_button, 0, 1)
+        grid.addWidget(self.next_button, 0, 2)
+        grid.addWidget(self.case_box, 0, 3)
+        grid.addWidget(self.word_box, 0, 4)
+        grid.addWidget(self.regex_box, 0, 5)
+        grid.addWidget(self.count_label, 0, 6)
+        grid.addWidget(close_button, 0, 7)
+        grid.addWidget(self.replace_edit, 1, 0)
+        grid.addWidget(self.replace_button, 1, 1)
+        grid.addWidget(self.replace_all_button, 1, 2)
+        grid.setColumnStretch(0, 1)
+        grid.setColumnStretch(6, 1)
+
+        self.find_edit.textChanged.connect(self.options_changed.emit)
+        for box in (self.case_box, self.word_box, self.regex_box):
+            box.toggled.connect(self.options_changed.emit)
+        QtWidgets.QShortcut(QtGui.QKeySequence("Escape"), self, self.closed.emit,
+                            context=QtCore.Qt.WidgetWithChildrenShortcut)
+
+    def set_replace_visible(self, visible: bool) -> None:
+        for w in (self.replace_edit, self.replace_button, self.replace_all_button):
+            w.setVisible(visible)
+
+    def options(self) -> Optional[SearchOptions]:
+        pattern = self.find_edit.text()
+        if not pattern:
+            return None
+        return SearchOptions(pattern, self.case_box.isChecked(), self.word_box.isChecked(), self.regex_box.isChecked())
+
+
+def grep_chunks(chunks, pattern, spanning: bool, limit: int) -> Tuple[list, bool]:
+    # 在解码后的文本块上逐行查找，返回 [(行号, 列号, 行内容)] 和是否因达到上限而截断；同一行只报一次。
+    # 超过 FIND_IN_FILES_MAX_CARRY 的单行按这个长度分段查找：跨越分段处的匹配找不到，
+    # 列号仍从行首算起，行内容取自匹配所在的分段
+    if spanning:
+        chunks = ["".join(chunks)]
+    results = []
+    line_no = 1
+    last_line = 0
+    # 当前行在前面分段里已有的字符数
+    col_base = 0
+    carry = ""
+    for text in itertools.chain(chunks, [None]):
+        if text is None:
+            seg, carry = carry, ""
+        else:
+            buf = carry + text
+            # 按行对齐；超长的单行不再等换行，避免反复拼接
+            cut = len(buf) if len(buf) > FIND_IN_FILES_MAX_CARRY else buf.rfind("\n") + 1
+            seg, carry = buf[:cut], buf[cut:]
+        if not seg:
+            continue
+        last = 0
+        for m in pattern.finditer(seg):
+            s = m.start()
+            line_no += seg.count("\n", last, s)
+            last = s
+            if line_no == last_line:
+                continue
+            last_line = line_no
+            ls = seg.rfind("\n", 0, s) + 1
+            le = seg.find("\n", s)
+            if le < 0:
+                le = len(seg)
+            col = s - ls + 1 + (col_base if ls == 0 else 0)
+            results.append((line_no, col, seg[ls:min(le, ls + FIND_IN_FILES_LINE_CHARS)]))
+            if len(results) >= limit:
+                return results, True
+        line_no += seg.count("\n", last)
+        nl = seg.rfind("\n")
+        col_base = len(seg) - nl - 1 if nl >= 0 else col_base + len(seg)
+    return results, False
+
+
+def grep_file(path: str, opts: SearchOptions, limit: int = FIND_IN_FILES_MAX_PER_FILE):
+    # 返回 (路径, 字节数, 编码, 结果, 是否截断)；二进制文件的编码为 None。编码探测与 FileLoadThread 相同
+    pattern = _worker_pattern(opts)
+    spanning = search_spans_lines(opts)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+        if is_binary_sample(sample):
+            return path, size, None, [], False
+        candidates, _ = detect_encoding(sample, len(sample) < ENCODING_SAMPLE_SIZE)
+        start = 0
+        while start < len(candidates):
+            decoder = FallbackDecoder(candidates[start:])
+            try:
+                chunks = (t for t, _ in decode_chunks(iter_byte_chunks(f, sample), decoder))
+                found = grep_chunks(chunks, pattern, spanning, limit)
+                # 读完才知道最终用的编码（中途可能换过）
+                return (path, size, decoder.encoding) + found
+            except UnicodeDecodeError:
+                f.seek(0)
+                sample = b""
+                start += decoder.index + 1
+        f.seek(0)
+        chunks = (t for t, _ in iter_decoded_chunks(iter_byte_chunks(f), "latin-1", "replace"))
+        return (path, size, "latin-1") + grep_chunks(chunks, pattern, spanning, limit)
+
+
+_WORKER_PATTERNS = {}
+
+
+def _worker_pattern(opts: SearchOptions):
+    pattern = _WORKER_PATTERNS.get(opts)
+    if pattern is None:
+        pattern = _WORKER_PATTERNS[opts] = compile_search(opts)
+    return pattern
+
+
+def grep_files(paths: List[str], opts: SearchOptions) -> list:
+    # 进程池中执行：一批文件一次往返，减少进程间通信次数
+    out = []
+    for path in paths:
+        try:
+            out.append(grep_file(path, opts))
+        except OSError as exc:
+            print("grep_files error:", exc, file=sys.stderr)
+            out.append((path, 0, None, [], False))
+    return out
+
+
+class FindInFilesThread(QtCore.QThread):
+    # 遍历目录并把文件分批交给进程池；Qt 进程里不能 fork，用 forkserver/spawn 启动工作进程
+    file_matched = QtCore.pyqtSignal(str, str, object, bool)
+    progress = QtCore.pyqtSignal(int, int, int, int)
+
+    def __init__(self, root: Path, globs: List[str], opts: SearchOptions, parent=None) -> None:
+        super().__init__(parent)
+        self.root = root
+        self.globs = globs or ["*"]
+        self.opts = opts
+        self._cancelled = False
+        self.files = 0
+        self.bytes = 0
+        self.matches = 0
+        self.skipped = 0
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def _batches(self):
+        batch = []
+        size = 0
+        for path, n in iter_search_files(self.root, self.globs, lambda: self._cancelled):
+            batch.append(path)
+            size += n
+            if len(batch) >= FIND_IN_FILES_BATCH_FILES or size >= FIND_IN_FILES_BATCH_BYTES:
+                yield batch
+                batch = []
+                size = 0
+        if batch:
+            yield batch
+
+    def _collect(self, futures) -> None:
+        for fut in futures:
+            try:
+                results = fut.result()
+            except Exception as exc:
+                print("FindInFilesThread worker error:", exc, file=sys.stderr)
+                continue
+            for path, size, enc, lines, truncated in results:
+                self.files += 1
+                self.bytes += size
+                if enc is None:
+                    self.skipped += 1
+                elif lines:
+                    self.matches += len(lines)
+                    self.file_matched.emit(path, enc, lines, truncated)
+        self.progress.emit(self.files, self.bytes, self.matches, self.skipped)
+
+    def run(self) -> None:
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        workers = os.cpu_count() or 1
+        pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=ctx)
+        pending = set()
+        try:
+            for batch in self._batches():
+                pending.add(pool.submit(grep_files, batch, self.opts))
+                # 控制在途任务数：遍历不会远远跑在查找前面，取消时也没有大量积压
+                while len(pending) >= workers * 2 and not self._cancelled:
+                    done, pending = concurrent.futures.wait(pending, 0.1, concurrent.futures.FIRST_COMPLETED)
+                    self._collect(done)
+                if self._cancelled:
+                    break
+            while pending and not self._cancelled:
+                done, pending = concurrent.futures.wait(pending, 0.1, concurrent.futures.FIRST_COMPLETED)
+                self._collect(done)
+        except Exception as exc:
+            print("FindInFilesThread error:", exc, file=sys.stderr)
+        finally:
+            pool.shutdown(wait=not self._cancelled, cancel_futures=True)
+            self.progress.emit(self.files, self.bytes, self.matches, self.skipped)
+
+
+class FindInFilesPanel(QtWidgets.QDockWidget):
+    # “在文件中查找”停靠面板：结果按文件分组，双击或回车打开文件并跳到对应行
+    open_requested = QtCore.pyqtSignal(str, int)
+
+    def __init__(self, parent=None) -> None:
+        super().__init__("在文件中查找", parent)
+        self.setObjectName("find_in_files")
+        self._thread: Optional[FindInFilesThread] = None
+        self._started = 0.0
+        self._stopped = False
+        self._shown = 0
+
+        body = QtWidgets.QWidget(self)
+        self.dir_edit = QtWidgets.QLineEdit(body)
+        self.dir_edit.setPlaceholderText("目录")
+        browse = QtWidgets.QToolButton(body)
+        browse.setText("...")
+        browse.clicked.connect(self._browse)
+        self.glob_edit = QtWidgets.QLineEdit("*", body)
+        self.glob_edit.setToolTip("文件名通配符，多个用分号分隔，例如 *.txt;*.log")
+        self.glob_edit.setMaximumWidth(160)
+        self.pattern_edit = QtWidgets.QLineEdit(body)
+        self.pattern_edit.setPlaceholderText("查找")
+        self.pattern_edit.setClearButtonEnabled(True)
+        self.case_box = QtWidgets.QCheckBox("区分大小写", body)
+        self.word_box = QtWidgets.QCheckBox("全字匹配", body)
+        self.regex_box = QtWidgets.QCheckBox("正则表达式", body)
+        self.start_button = QtWidgets.QPushButton("查找", body)
+        self.start_button.clicked.connect(self._toggle)
+        self.pattern_edit.returnPressed.connect(self.start)
+        self.status_label = QtWidgets.QLabel("", body)
+        self.results = QtWidgets.QTreeWidget(body)
+        self.results.setHeaderLabels(["位置", "内容"])
+        self.results.setUniformRowHeights(True)
+        self.results.itemActivated.connect(self._on_item_activated)
+
+        grid = QtWidgets.QGridLayout(body)
+        grid.setContentsMargins(6, 4, 6, 4)
+        grid.addWidget(self.pattern_edit, 0, 0, 1, 2)
+        grid.addWidget(self.case_box, 0, 2)
+        grid.addWidget(self.word_box, 0, 3)
+        grid.addWidget(self.regex_box, 0, 4)
+        grid.addWidget(self.start_button, 0, 5)
+        grid.addWidget(self.dir_edit, 1, 0)
+        grid.addWidget(browse, 1, 1)
+        grid.addWidget(self.glob_edit, 1, 2, 1, 2)
+        grid.addWidget(self.status_label, 1, 4, 1, 2)
+        grid.addWidget(self.results, 2, 0, 1, 6)
+        grid.setColumnStretch(0, 1)
+        self.setWidget(body)
+
+    def _browse(self) -> None:
+        d = QtWidgets.QFileDialog.getExistingDirectory(self, "选择目录", self.dir_edit.text() or str(Path.home()))
+        if d:
+            self.dir_edit.setText(d)
+
+    def _toggle(self) -> None:
+        if self._thread is not None:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self) -> None:
+        self.stop()
+        root = Path(self.dir_edit.text()).expanduser()
+        pattern = self.pattern_edit.text()
+        if not pattern:
+            return
+        if not root.is_dir():
+            self.status_label.setText("目录不存在")
+            return
+        opts = SearchOptions(pattern, self.case_box.isChecked(), self.word_box.isChecked(), self.regex_box.isChecked())
+        try:
+            compile_search(opts)
+        except re.error as exc:
+            self.status_label.setText(f"正则表达式错误：{exc}")
+            return
+        globs = [g.strip() for g in self.glob_edit.text().split(";") if g.strip()]
+        self.results.clear()
+        self._shown = 0
+        thread = FindInFilesThread(root, globs, opts, self)
+        thread.file_matched.connect(lambda path, enc, lines, truncated, th=thread: self._on_file_matched(th, path, enc, lines, truncated))
+        thread.progress.connect(lambda *args, th=thread: self._on_progress(th, *args))
+        thread.finished.connect(lambda th=thread: self._on_finished(th))
+        thread.finished.connect(thread.deleteLater)
+        self._thread = thread
+        self._stopped = False
+        self._started = time.monotonic()
+        self.start_button.setText("停止")
+        self.status_label.setText("正在查找…")
+        thread.start()
+
+    def stop(self, wait: bool = False) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopped = True
+        thread.cancel()
+        if wait:
+            thread.wait()
+
+    def _on_file_matched(self, thread: FindInFilesThread, path: str, enc: str, lines: list, truncated: bool) -> None:
+        if thread is not self._thread or self._shown >= FIND_IN_FILES_MAX_RESULTS:
+            return
+        more = "+" if truncated else ""
+        top = QtWidgets.QTreeWidgetItem([path, f"{len(lines)}{more} 处 · {enc}"])
+        top.setData(0, QtCore.Qt.UserRole, (path, 0))
+        children = []
+        for line_no, col, text in lines[:FIND_IN_FILES_MAX_RESULTS - self._shown]:
+            item = QtWidgets.QTreeWidgetItem([f"{line_no}:{col}", text.strip()])
+            item.setData(0, QtCore.Qt.UserRole, (path, line_no))
+            children.append(item)
+        top.addChildren(children)
+        self._shown += len(children)
+        self.results.addTopLevelItem(top)
+        top.setExpanded(True)
+
+    def _on_progress(self, thread: FindInFilesThread, files: int, nbytes: int, matches: int, skipped: int) -> None:
+        if thread is not self._thread:
+            return
+        elapsed = max(1e-6, time.monotonic() - self._started)
+        text = (f"{files} 个文件 · {files / elapsed:.0f} 文件/秒 · {nbytes / elapsed / (1024 * 1024):.1f} MB/秒"
+                f" · {matches} 处匹配")
+        if skipped:
+            text += f" · 跳过 {skipped} 个二进制文件"
+        if self._shown >= FIND_IN_FILES_MAX_RESULTS:
+            text += f" · 只显示前 {FIND_IN_FILES_MAX_RESULTS} 条"
+        self.status_label.setText(text)
+
+    def _on_finished(self, thread: FindInFilesThread) -> None:
+        if thread is not self._thread:
+            return
+        self._thread = None
+        self.start_button.setText("查找")
+        prefix = "已停止：" if self._stopped else "完成："
+        self.status_label.setText(prefix + self.status_label.text())
+
+    def _on_item_activated(self, item: QtWidgets.QTreeWidgetItem, column: int) -> None:
+        data = item.data(0, QtCore.Qt.UserRole)
+        if data:
+            self.open_requested.emit(data[0], data[1])
+
+
+class HighlightLanguage:
+    # 一种语言的高亮规则：rules 是 (格式名, 正则) 列表，合并成一个带命名分组的正则，第一次用到时才编译；
+    # block 是跨行结构 (起始记号, 结束记号, 格式名)，行尾状态 1 表示仍在结构内部
+    def __init__(self, name: str, suffixes: Tuple[str, ...], rules: List[Tuple[str, str]],
+                 block: Optional[Tuple[str, str, str]] = None) -> None:
+        self.name = name
+        self.suffixes = suffixes
+        self.rules = rules
+        self.block = block
+        self._pattern = None
+        self._block_end = None
+
+    @property
+    def stateful(self) -> bool:
+        return self.block is not None
+
+    def pattern(self):
+        if self._pattern is None:
+            parts = [f"(?P<g{i}>{rx})" for i, (_, rx) in enumerate(self.rules)]
+            if self.block is not None:
+                parts.append(f"(?P<open>{re.escape(self.block[0])})")
+                self._block_end = re.compile(re.escape(self.block[1]))
+            self._pattern = re.compile("|".join(parts))
+        return self._pattern
+
+    def highlight(self, text: str, state: int) -> Tuple[List[Tuple[int, int, str]], int]:
+        # 返回 ([(起点, 终点, 格式名)], 行尾状态)；下标按 Python 字符计
+        pattern = self.pattern()
+        spans = []
+        pos = 0
+        if state:
+            m = self._block_end.search(text)
+            if m is None:
+                return ([(0, len(text), self.block[2])] if text else []), state
+            spans.append((0, m.end(), self.block[2]))
+            pos = m.end()
+        while True:
+            m = pattern.search(text, pos)
+            if m is None:
+                return spans, 0
+            if m.lastgroup == "open":
+                end = self._block_end.search(text, m.end())
+                if end is None:
+                    spans.append((m.start(), len(text), self.block[2]))
+                    return spans, 1
+                spans.append((m.start(), end.end(), self.block[2]))
+                pos = end.end()
+            else:
+                spans.append((m.start(), m.end(), self.rules[int(m.lastgroup[1:])][0]))
+                pos = max(m.end(), m.start() + 1)
+
+    def next_state(self, text: str, state: int) -> int:
+        # 只求行尾状态（可见区域之外的段落）：行里没有相应记号时不必逐个匹配
+        if self.block is None or self.block[1 if state else 0] not in text:
+            return state if self.block is not None else 0
+        return self.highlight(text, state)[1]
+
+
+class YamlLanguage(HighlightLanguage):
+    # 块标量（| 或 >）之后缩进更深的行都是字符串；行尾状态为引出它的那一行的缩进 + 1
+    _BLOCK_SCALAR_RE = re.compile(r"^( *)(?:[^#]*?:\s+|-\s+)?[|>][-+0-9]*\s*(?:#.*)?$")
+
+    @property
+    def stateful(self) -> bool:
+        return True
+
+    def highlight(self, text: str, state: int) -> Tuple[List[Tuple[int, int, str]], int]:
+        if state and self._in_scalar(text, state):
+            return ([(0, len(text), "string")] if text else []), state
+        return super().highlight(text, 0)[0], self._scalar_state(text)
+
+    def next_state(self, text: str, state: int) -> int:
+        if state and self._in_scalar(text, state):
+            return state
+        return self._scalar_state(text)
+
+    def _in_scalar(self, text: str, state: int) -> bool:
+        body = text.lstrip(" ")
+        return not body or len(text) - len(body) >= state
+
+    def _scalar_state(self, text: str) -> int:
+        if "|" not in text and ">" not in text:
+            return 0
+        m = self._BLOCK_SCALAR_RE.match(text)
+        return len(m.group(1)) + 1 if m else 0
+
+
+HIGHLIGHT_LANGUAGES = [
+    HighlightLanguage("JSON", (".json", ".jsonc", ".geojson"), [
+        ("key", r'"(?:[^"\\]|\\.)*"(?=\s*:)'),
+        ("string", r'"(?:[^"\\]|\\.)*"?'),
+        ("number", r"-?\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b"),
+        ("keyword", r"\b(?:true|false|null)\b"),
+        ("comment", r"//.*"),
+    ], block=("/*", "*/", "comment")),
+    YamlLanguage("YAML", (".yaml", ".yml"), [
+        ("comment", r"(?:^|(?<=\s))#.*"),
+        ("string", r'"(?:[^"\\]|\\.)*"?|\'(?:[^\']|\'\')*\'?'),
+        ("keyword", r"^(?:---|\.\.\.)(?=\s|$)|(?<!\S)(?:[&*][\w-]+|!\S*)"),
+        ("key", r"[^\s#'\"{}\[\],&*!|>-][^#:{}\[\],]*?(?=\s*:(?:\s|$))"),
+        ("keyword", r"\b(?:true|false|null|yes|no|on|off|True|False|Null)\b"),
+        ("number", r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w.])"),
+    ]),
+    HighlightLanguage("INI", (".ini", ".cfg", ".conf", ".toml", ".properties"), [
+        ("comment", r"^\s*[;#].*"),
+        ("section", r"^\s*\[[^\]]*\]"),
+        ("key", r"^\s*[^=:\s;#\[][^=:]*?(?=\s*[=:])"),
+        ("string", r'"[^"]*"?|\'[^\']*\'?'),
+        ("keyword", r"\b(?:true|false|yes|no|on|off|True|False|TRUE|FALSE)\b"),
+        ("number", r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?![\w.])"),
+    ]),
+    HighlightLanguage("日志", (".log",), [
+        ("timestamp", r"^\[?\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?\]?"
+                      r"|^[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}"),
+        ("error", r"\b(?:FATAL|CRITICAL|ERROR|SEVERE|Traceback|Exception)\b"),
+        ("warning", r"\b(?:WARN|WARNING)\b"),
+        ("info", r"\b(?:INFO|NOTICE)\b"),
+        ("debug", r"\b(?:DEBUG|TRACE)\b"),
+        ("string", r'"[^"]*"'),
+        ("keyword", r"\[[^\]]*\]"),
+    ]),
+]
+
+
+def language_for_path(path: Optional[Path]) -> Optional[HighlightLanguage]:
+    if path is None:
+        return None
+    suffix = path.suffix.lower()
+    for language in HIGHLIGHT_LANGUAGES:
+        if suffix in language.suffixes:
+            return language
+    return None
+
+
+class SyntaxHighlighter(QtCore.QObject):
+    # 按需高亮：QSyntaxHighlighter 挂上时和每次跨行状态变化时都会一直处理到文末，这里只给可见区域附近的段落设置格式。
+    # 段落的 userState：-1 表示未处理，否则为 行尾状态 * 2 + (已设置格式 ? 1 : 0)。
+    # 格式用 QTextLayout.setFormats 设置，不改动文档内容，不产生撤销步骤，也不触发 contentsChange
+    _formats: Optional[dict] = None
+
+    def __init__(self, editor: QtWidgets.QPlainTextEdit, language: HighlightLanguage) -> None:
+        super().__init__(editor)
+        self.editor = editor
+        self.doc = editor.document()
+        self.language = language
+        self._block_count = self.doc.blockCount()
+        # 上次处理时可见范围的末段；上次处理过的范围，之后没有增删段落、范围也没变时不必再逐段检查
+        self._last_visible = -1
+        self._window: Optional[Tuple[int, int]] = None
+        # 中断点（升序的段落号）：前一段的行尾状态变了但传播因超出上限停在这里，从这里往后的状态不可信
+        self._breaks: List[int] = []
+        # contentsChange 里记下的编辑首段，等 contentsChanged（布局已更新、尚未绘制）再处理，不在 Qt 通知改动的过程中改布局
+        self._pending: Optional[int] = None
+        self._timer = QtCore.QTimer(self, singleShot=True, interval=0)
+        self._timer.timeout.connect(self.update_visible)
+        self.doc.contentsChange.connect(self._on_contents_change)
+        self.doc.contentsChanged.connect(self._on_contents_changed)
+        editor.updateRequest.connect(self._on_update_request)
+        self._timer.start()
+
+    @classmethod
+    def formats(cls) -> dict:
+        if cls._formats is None:
+            cls._formats = {}
+            for kind, (color, bold, italic) in HIGHLIGHT_STYLES.items():
+                fmt = QtGui.QTextCharFormat()
+                fmt.setForeground(QtGui.QColor(color))
+                if bold:
+                    fmt.setFontWeight(QtGui.QFont.Bold)
+                fmt.setFontItalic(italic)
+                cls._formats[kind] = fmt
+        return cls._formats
+
+    def schedule(self) -> None:
+        self._timer.start()
+
+    def detach(self, clear: bool) -> None:
+        # clear 为 False 时文档马上会被清空，不必逐段去掉格式
+        self._timer.stop()
+        self.doc.contentsChange.disconnect(self._on_contents_change)
+        self.doc.contentsChanged.disconnect(self._on_contents_changed)
+        self.editor.updateRequest.disconnect(self._on_update_request)
+        if clear:
+            block = self.doc.begin()
+            while block.isValid():
+                state = block.userState()
+                if state != -1:
+                    if state & 1:
+                        block.layout().setFormats([])
+                        self.doc.markContentsDirty(block.position(), block.length())
+                    block.setUserState(-1)
+                block = block.next()
+        self.deleteLater()
+
+    def _on_update_request(self, rect: QtCore.QRect, dy: int) -> None:
+        self._timer.start()
+
+    def _visible_range(self) -> Tuple[int, int]:
+        # 每段至少占一行，按视口高度能放下的行数估计末段，不必做坐标查找
+        editor = self.editor
+        top = editor.firstVisibleBlock().blockNumber()
+        rows = editor.viewport().height() // max(1, editor.fontMetrics().lineSpacing()) + 1
+        return max(0, top - HIGHLIGHT_MARGIN_BLOCKS), top + rows + HIGHLIGHT_MARGIN_BLOCKS
+
+    @profiled("语法高亮：可见区域")
+    def update_visible(self) -> None:
+        first, last = self._visible_range()
+        self._last_visible = last
+        if (first, last) == self._window and not self._breaks:
+            return
+        self._window = (first, last)
+        block = self.doc.findBlockByNumber(first)
+        n = first
+        # 可见范围内第一个没有格式的段落；它之前如有中断点，从中断点（或范围开头）重新处理
+        while block.isValid() and n <= last:
+            state = block.userState()
+            if state < 0 or not state & 1:
+                break
+            block = block.next()
+            n += 1
+        if self._breaks and self._breaks[0] < n:
+            n = max(first, self._breaks[0])
+            block = self.doc.findBlockByNumber(n)
+        if not block.isValid() or n > last:
+            return
+        self._run(block, n, last, self._state_before(block, n))
+
+    def _on_contents_change(self, pos: int, removed: int, added: int) -> None:
+        doc = self.doc
+        count = doc.blockCount()
+        delta = count - self._block_count
+        self._block_count = count
+        block = doc.findBlock(pos)
+        first = block.blockNumber()
+        last = doc.findBlock(pos + added).blockNumber()
+        # 编辑范围之后的中断点随段落号平移，范围内的作废（那些段落都要重新处理）
+        self._breaks = [b if b <= first else b + delta for b in self._breaks if b <= first or b > last - delta]
+        # 只有首段保留了旧的格式和状态，新插入的段落都是 -1；跨行的编辑之后，原来接在后面的段落前驱变了
+        if self.language.stateful and (last > first or delta) and last + 1 < count:
+            bisect.insort(self._breaks, last + 1)
+        if self._last_visible >= first:
+            self._last_visible += delta
+        if delta or last > first:
+            self._window = None
+        self._pending = first if self._pending is None else min(self._pending, first)
+
+    @profiled("语法高亮：编辑")
+    def _on_contents_changed(self) -> None:
+        # 首段在绘制之前同步处理，输入时不会闪烁；新插入的段落和可见区域留给定时器
+        first, self._pending = self._pending, None
+        if first is None:
+            return
+        block = self.doc.findBlockByNumber(first)
+        if block.isValid():
+            visible = self._last_visible if first <= self._last_visible else -1
+            self._run(block, first, visible, self._state_before(block, first))
+        self._timer.start()
+
+    def _state_before(self, block: QtGui.QTextBlock, n: int) -> int:
+        # 前一段的行尾状态；前一段未处理或在中断点之后时往前找可信的段落，中间的段落只算状态不设格式
+        if not self.language.stateful:
+            return 0
+        limit = self._breaks[0] if self._breaks else n
+        chain = []
+        prev = block.previous()
+        m = n - 1
+        state = 0
+        while prev.isValid():
+            value = prev.userState()
+            if value >= 0 and m < limit:
+                state = value >> 1
+                break
+            if len(chain) >= HIGHLIGHT_SYNC_LINES:
+                # 太远就从这里按记下的状态（没有则按 0）开始，更早的中断点不再追究
+                state = max(value, 0) >> 1
+                del self._breaks[:bisect.bisect_right(self._breaks, m)]
+                break
+            chain.append(prev)
+            prev = prev.previous()
+            m -= 1
+        for prev in reversed(chain):
+            state = self._highlight_block(prev, state, False)
+        if chain:
+            self._drop_breaks(m + 1, n - 1)
+        return state
+
+    def _drop_breaks(self, lo: int, hi: int) -> None:
+        i = bisect.bisect_left(self._breaks, lo)
+        j = bisect.bisect_right(self._breaks, hi)
+        del self._breaks[i:j]
+
+    def _run(self, block: QtGui.QTextBlock, n: int, last: int, state: int) -> None:
+        # 从 block（段落号 n）开始处理：last 之前的段落设置格式；之后只在状态变化时往下传播，
+        # 直到新旧状态一致、遇到未处理的段落或超出上限
+        start = n
+        changed = True
+        carried = 0
+        breaks = self._breaks
+        k = bisect.bisect_left(breaks, n)
+        while block.isValid():
+            old = block.userState()
+            at_break = k < len(breaks) and breaks[k] == n
+            if at_break:
+                k += 1
+            visible = n <= last
+            if visible:
+                need = changed or at_break or old < 0 or not old & 1
+            else:
+                need = (changed or at_break) and old >= 0
+            if not need:
+                if not visible:
+                    break
+                state = old >> 1
+            else:
+                if not visible:
+                    carried += 1
+                    if carried > HIGHLIGHT_CARRY_LINES:
+                        self._drop_breaks(start, n - 1)
+                        if not at_break:
+                            bisect.insort(breaks, n)
+                        return
+                new = self._highlight_block(block, state, visible)
+                changed = self.language.stateful and (old < 0 or old >> 1 != new)
+                state = new
+            block = block.next()
+            n += 1
+        self._drop_breaks(start, n - 1)
+
+    def _highlight_block(self, block: QtGui.QTextBlock, state: int, apply: bool) -> int:
+        text = block.text()
+        if len(text) > HIGHLIGHT_MAX_LINE_CHARS:
+            spans, new = [], state
+        elif not apply:
+            spans, new = [], self.language.next_state(text, state)
+        else:
+            spans, new = self.language.highlight(text, state)
+        old = block.userState()
+        if apply:
+            if spans or old != -1:
+                # 与现有格式相同时不再设置：设置格式后 Qt 会重新布局并重绘整个视口
+                layout = block.layout()
+                ranges = self._format_ranges(text, spans)
+                current = layout.formats()
+                if len(current) != len(ranges) or any(
+                        a.start != b.start or a.length != b.length or a.format != b.format
+                        for a, b in zip(current, ranges)):
+                    layout.setFormats(ranges)
+                    self.doc.markContentsDirty(block.position(), block.length())
+            block.setUserState(new * 2 + 1)
+        else:
+            block.setUserState(new * 2)
+        return new
+
+    def _format_ranges(self, text: str, spans: List[Tuple[int, int, str]]) -> list:
+        formats = self.formats()
+        # Qt 的位置按 UTF-16 计数
+        astral = _astral_positions(text, 0, len(text))
+        ranges = []
+        for start, end, kind in spans:
+            if astral:
+                start += bisect.bisect_left(astral, start)
+                end += bisect.bisect_left(astral, end)
+            r = QtGui.QTextLayout.FormatRange()
+            r.start = start
+            r.length = end - start
+            r.format = formats[kind]
+            ranges.append(r)
+        return ranges
+
+
+class DocumentTab:
+    # 一个标签页的文档状态；未加载或已被回收的标签只保留路径、编码和光标位置，激活时再读取内容
+    def __init__(self, path: Optional[Path], encoding: Optional[str], parent: QtWidgets.QWidget) -> None:
+        self.path = path
+        # encoding 为 None 表示尚未探测，加载时自动识别
+        self.encoding = encoding
+        self.confidence: Optional[float] = None
+        self.is_modified = False
+        self.loaded = path is None
+        self.cursor_pos = 0
+        self.scroll_value = 0
+        # 加载完成后要跳转到的行（在文件中查找的结果），0 表示不跳转
+        self.pending_line = 0
+        self.last_active = 0
+        # 普通编辑器与大文件分页视图共用标签页区域
+        self.page = QtWidgets.QStackedWidget(parent)
+        self.editor = QtWidgets.QPlainTextEdit(self.page)
+        self.editor.setLineWrapMode(QtWidgets.QPlainTextEdit.WidgetWidth)
+        self.page.addWidget(self.editor)
+        # 文档内容的片段表镜像，后台任务从它取快照；与文档对不上时为 None，退回 toPlainText()
+        self.buffer: Optional[PieceBuffer] = PieceBuffer()
+        self.loader: Optional[FileLoadThread] = None
+        self.load_pending: deque = deque()
+        self.load_result: Optional[str] = None
+        self.load_first_batch = False
+        self.load_timer = QtCore.QTimer(self.page)
+        self.load_timer.setInterval(0)
+        self.large_view: Optional[LargeFileView] = None
+        self.large_index_thread: Optional[LineIndexThread] = None
+        self.large_mmap: Optional[mmap.mmap] = None
+        self.large_file_obj = None
+        # 分页视图是否因超长行而打开（长行模式）；long_lines 为用户在菜单里指定的模式，None 表示加载时自动检测
+        self.long_line_mode = False
+        self.long_lines: Optional[bool] = None
+        self.save_task: Optional[BackgroundTask] = None
+        self.save_again = False
+        self.last_save_ok = True
+        # doc_serial 在打开/新建文档时递增，edit_generation 在每次编辑时递增，用于判断保存完成时快照是否仍是最新内容
+        self.doc_serial = 0
+        self.edit_generation = 0
+        # 文档长度（UTF-16 单位，不含末尾段落分隔符），用来校正 contentsChange 报告的删除长度
+        self.doc_length = 0
+        self.journal: Optional[AutosaveJournal] = None
+        # 文档内容对应文件开头多少字节（刚加载或刚保存且未再修改时有效），跟随模式从这里接着读
+        self.loaded_bytes: Optional[int] = None
+        # 文件的压缩格式（gzip/bz2/xz/zstd），保存时按同一格式重新压缩；压缩文件不能跟随、分页或按长行模式打开
+        self.compression: Optional[str] = None
+        self.follower: Optional[FileFollower] = None
+        # 跟随期间是否因超出行数上限丢弃过开头的内容
+        self.follow_trimmed = False
+        # 最近一次读取或保存时磁盘上文件的状态和内容摘要；None 表示未知，不做外部修改检测
+        self.disk_state: Optional[dict] = None
+        self.disk_digest: Optional[bytes] = None
+        self.reload_task: Optional[BackgroundTask] = None
+        self.highlighter: Optional[SyntaxHighlighter] = None
+
+    @property
+    def display_name(self) -> str:
+        return self.path.name if self.path else "未命名"
+
+    def is_pristine(self) -> bool:
+        # 未命名、未修改的空白文档，打开文件时直接复用
+        return (self.path is None and not self.is_modified and self.loader is None
+                and self.save_task is None and self.editor.document().isEmpty())
+
+    def memory_estimate(self) -> int:
+        # 粗略估计：QTextDocument 按 UTF-16 存储文本，另加每个段落的固定开销和片段表里的一份副本
+        if not self.loaded or self.large_view is not None:
+            return 0
+        doc = self.editor.document()
+        mirror = self.buffer.units * 2 if self.buffer is not None else 0
+        return doc.characterCount() * 2 + doc.blockCount() * TAB_BLOCK_OVERHEAD + mirror
+
+    def text_snapshot(self):
+        # 交给后台任务的文档内容：有片段表时是 O(1) 快照，否则在界面线程上复制全文
+        if self.buffer is not None:
+            return self.buffer.snapshot()
+        return self.editor.toPlainText()
+
+
 class NotepadMainWindow(QtWidgets.QMainWindow):
-    def __init__(self, config: AppConfig) -> None:
+    save_finished = QtCore.pyqtSignal(bool)
+    # 首次绘制后补建的界面完成时发出
+    startup_finished = QtCore.pyqtSignal()
+
+    def __init__(self, config: AppConfig, files: Optional[List[Path]] = None,
+                 startup_timing: Optional["StartupTiming"] = None) -> None:
         super().__init__()
         self.config = config
-        self._current_file: Optional[Path] = None
-        self._is_modified: bool = False
-        self._current_encoding: str = config.encoding
+        self.config_store = ConfigStore(config, self)
+        self.startup_timing = startup_timing
+        self._startup_pending = True
+        self._recent_menu_stale = True
+        self._tabs: List[DocumentTab] = []
+        self._tab: Optional[DocumentTab] = None
+        self._activation_counter = 0
+        self._search_tab: Optional[DocumentTab] = None
+        self._search_thread: Optional[SearchThread] = None
+        self._search_key = None
+        self._search_complete = False
+        self._search_pending_step = 0
+        self._match_starts = array("Q")
+        self._match_lengths = array("Q")
+        self._replace_task: Optional[BackgroundTask] = None
+        self._find_in_files: Optional[FindInFilesPanel] = None
+        self._diagnostics: Optional[DiagnosticsDialog] = None
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(FIND_RESTART_DELAY_MS)
+        self._search_timer.timeout.connect(self._restart_search)
+        self._highlight_timer = QtCore.QTimer(self)
+        self._highlight_timer.setSingleShot(True)
+        self._highlight_timer.setInterval(30)
+        self._highlight_timer.timeout.connect(self._update_highlights)
+        self._ui_dirty: Set[str] = set()
+        self._ui_dirty_tabs: Set[DocumentTab] = set()
+        self._ui_timer = QtCore.QTimer(self)
+        self._ui_timer.setSingleShot(True)
+        self._ui_timer.setInterval(UI_UPDATE_INTERVAL_MS)
+        self._ui_timer.timeout.connect(self._flush_ui_updates)
+        # 外部修改检测：监视已打开的文件，通知合并后再逐个检查
+        self._closing = False
+        self._disk_pending: Set[str] = set()
+        self._disk_watcher = QtCore.QFileSystemWatcher(self)
+        self._disk_watcher.fileChanged.connect(self._on_disk_file_changed)
+        self._disk_timer = QtCore.QTimer(self)
+        self._disk_timer.setSingleShot(True)
+        self._disk_timer.setInterval(DISK_CHECK_DELAY_MS)
+        self._disk_timer.timeout.connect(self._check_pending_disk_changes)
+        self._match_format = QtGui.QTextCharFormat()
+        self._match_format.setBackground(QtGui.QColor(255, 200, 0, 110))
+        self._journal_writer = JournalWriter()
+        self._decompressed = DecompressedCache(self.config.decompress_cache_mb * 1024 * 1024)
+        self._journal_writer.start()
         self._init_ui()
         self._connect_actions()
-        self._update_title()
+        # 命令行指定了文件时会话中的标签只建立不加载，先显示并读取指定的文件
+        self._restore_session(activate=not files)
+        for path in files or []:
+            self.open_file(path)
+        if not self._tabs:
+            self.file_new()
+        elif self._tab is None:
+            self._on_current_tab_changed(self.tab_widget.currentIndex())
         self._apply_config_to_widgets()
 
+    @property
+    def text_edit(self) -> QtWidgets.QPlainTextEdit:
+        return self._tab.editor
+
     def _init_ui(self) -> None:
         QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
         QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps, True)
@@ -80,9 +2382,19 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         self.resize(1000, 700)
         self.setWindowIcon(self.style().standardIcon(QtWidgets.QStyle.SP_FileIcon))
 
-        self.text_edit = QtWidgets.QPlainTextEdit(self)
-        self.text_edit.setLineWrapMode(QtWidgets.QPlainTextEdit.WidgetWidth)
-        self.setCentralWidget(self.text_edit)
+        self.tab_widget = QtWidgets.QTabWidget(self)
+        self.tab_widget.setDocumentMode(True)
+        self.tab_widget.setTabsClosable(True)
+        self.tab_widget.setMovable(True)
+        self.find_bar = FindBar(self)
+        self.find_bar.setVisible(False)
+        central = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(central)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.tab_widget)
+        layout.addWidget(self.find_bar)
+        self.setCentralWidget(central)
 
         self.status = self.statusBar()
         self.status_label = QtWidgets.QLabel("")
@@ -91,11 +2403,19 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         self.status.addPermanentWidget(self.enc_label)
         self.status.addPermanentWidget(self.pos_label)
         self.status.addPermanentWidget(self.status_label)
+        self.load_progress = QtWidgets.QProgressBar()
+        self.load_progress.setRange(0, 100)
+        self.load_progress.setMaximumWidth(160)
+        self.load_progress.setVisible(False)
+        self.cancel_load_button = QtWidgets.QToolButton()
+        self.cancel_load_button.setVisible(False)
+        self.status.addPermanentWidget(self.load_progress)
+        self.status.addPermanentWidget(self.cancel_load_button)
 
         self._create_actions()
+        self.cancel_load_button.setDefaultAction(self.action_cancel_load)
         self._create_menus()
         self._create_toolbars()
-        self._create_context_menu()
 
         self.setAcceptDrops(True)
 
@@ -104,21 +2424,39 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
     def _create_actions(self) -> None:
         self.action_new = QtWidgets.QAction("新建", self, shortcut=QtGui.QKeySequence.New, triggered=self.file_new)
         self.action_open = QtWidgets.QAction("打开...", self, shortcut=QtGui.QKeySequence.Open, triggered=self.file_open)
-        self.action_save = QtWidgets.QAction("保存", self, shortcut=QtGui.QKeySequence.Save, triggered=self.file_save)
-        self.action_save_as = QtWidgets.QAction("另存为...", self, shortcut=QtGui.QKeySequence("Ctrl+Shift+S"), triggered=self.file_save_as)
+        self.action_save = QtWidgets.QAction("保存", self, shortcut=QtGui.QKeySequence.Save, triggered=lambda: self.file_save())
+        self.action_save_as = QtWidgets.QAction("另存为...", self, shortcut=QtGui.QKeySequence("Ctrl+Shift+S"), triggered=lambda: self.file_save_as())
+        self.action_close_tab = QtWidgets.QAction("关闭标签页", self, shortcut=QtGui.QKeySequence.Close, triggered=lambda: self.close_tab(self._tab))
+        self.action_open_all_recent = QtWidgets.QAction("在标签页中打开全部", self, triggered=self._open_all_recent)
+        self.action_cancel_load = QtWidgets.QAction("取消加载", self, triggered=lambda: self._cancel_load(self._tab), enabled=False)
         self.action_exit = QtWidgets.QAction("退出", self, shortcut=QtGui.QKeySequence.Quit, triggered=self.close)
-        self.action_undo = QtWidgets.QAction("撤销", self, shortcut=QtGui.QKeySequence.Undo, triggered=self.text_edit.undo)
-        self.action_redo = QtWidgets.QAction("重做", self, shortcut=QtGui.QKeySequence.Redo, triggered=self.text_edit.redo)
-        self.action_cut = QtWidgets.QAction("剪切", self, shortcut=QtGui.QKeySequence.Cut, triggered=self.text_edit.cut)
-        self.action_copy = QtWidgets.QAction("复制", self, shortcut=QtGui.QKeySequence.Copy, triggered=self.text_edit.copy)
-        self.action_paste = QtWidgets.QAction("粘贴", self, shortcut=QtGui.QKeySequence.Paste, triggered=self.text_edit.paste)
-        self.action_select_all = QtWidgets.QAction("全选", self, shortcut=QtGui.QKeySequence.SelectAll, triggered=self.text_edit.selectAll)
+        # 编辑动作总是作用于当前标签页的编辑器
+        self.action_undo = QtWidgets.QAction("撤销", self, shortcut=QtGui.QKeySequence.Undo, triggered=lambda: self.text_edit.undo())
+        self.action_redo = QtWidgets.QAction("重做", self, shortcut=QtGui.QKeySequence.Redo, triggered=lambda: self.text_edit.redo())
+        self.action_cut = QtWidgets.QAction("剪切", self, shortcut=QtGui.QKeySequence.Cut, triggered=lambda: self.text_edit.cut())
+        self.action_copy = QtWidgets.QAction("复制", self, shortcut=QtGui.QKeySequence.Copy, triggered=lambda: self.text_edit.copy())
+        self.action_paste = QtWidgets.QAction("粘贴", self, shortcut=QtGui.QKeySequence.Paste, triggered=lambda: self.text_edit.paste())
+        self.action_select_all = QtWidgets.QAction("全选", self, shortcut=QtGui.QKeySequence.SelectAll, triggered=lambda: self.text_edit.selectAll())
+        self.action_goto_line = QtWidgets.QAction("转到行...", self, shortcut=QtGui.QKeySequence("Ctrl+G"), triggered=self.goto_line_dialog)
+        self.action_find = QtWidgets.QAction("查找...", self, shortcut=QtGui.QKeySequence.Find, triggered=lambda: self.show_find_bar(False))
+        self.action_replace = QtWidgets.QAction("替换...", self, shortcut=QtGui.QKeySequence("Ctrl+H"), triggered=lambda: self.show_find_bar(True))
+        self.action_find_next = QtWidgets.QAction("查找下一个", self, shortcut=QtGui.QKeySequence.FindNext, triggered=lambda: self._find_step(1))
+        self.action_find_prev = QtWidgets.QAction("查找上一个", self, shortcut=QtGui.QKeySequence.FindPrevious, triggered=lambda: self._find_step(-1))
+        self.action_find_in_files = QtWidgets.QAction("在文件中查找...", self, shortcut=QtGui.QKeySequence("Ctrl+Shift+F"), triggered=self.show_find_in_files)
+        self.action_next_tab = QtWidgets.QAction("下一个标签页", self, shortcut=QtGui.QKeySequence.NextChild, triggered=lambda: self._cycle_tab(1))
+        self.action_prev_tab = QtWidgets.QAction("上一个标签页", self, shortcut=QtGui.QKeySequence.PreviousChild, triggered=lambda: self._cycle_tab(-1))
         self.action_increase_font = QtWidgets.QAction("放大字体", self, shortcut=QtGui.QKeySequence.ZoomIn, triggered=self.increase_font_size)
         self.action_decrease_font = QtWidgets.QAction("缩小字体", self, shortcut=QtGui.QKeySequence.ZoomOut, triggered=self.decrease_font_size)
         self.action_choose_font = QtWidgets.QAction("字体设置...", self, triggered=self.choose_font_dialog)
         self.action_toggle_theme = QtWidgets.QAction("切换主题", self, triggered=self.toggle_theme)
         self.action_choose_encoding = QtWidgets.QAction("选择默认编码...", self, triggered=self.choose_encoding_dialog)
+        self.action_follow = QtWidgets.QAction("跟随文件末尾", self, checkable=True, triggered=self.toggle_follow)
+        self.action_syntax_highlight = QtWidgets.QAction("语法高亮", self, checkable=True,
+                                                         checked=self.config.syntax_highlight,
+                                                         triggered=self.toggle_syntax_highlight)
+        self.action_long_lines = QtWidgets.QAction("长行模式", self, checkable=True, triggered=self.toggle_long_lines)
         self.action_clear_recent = QtWidgets.QAction("清除最近文件", self, triggered=self._clear_recent)
+        self.action_diagnostics = QtWidgets.QAction("性能诊断...", self, triggered=self.show_diagnostics)
         self.action_about = QtWidgets.QAction("关于", self, triggered=self._show_about_dialog)
     def _create_menus(self) -> None:
         mb = self.menuBar()
@@ -127,9 +2465,11 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         file_menu.addAction(self.action_open)
         file_menu.addAction(self.action_save)
         file_menu.addAction(self.action_save_as)
+        file_menu.addAction(self.action_close_tab)
         self.recent_menu = file_menu.addMenu("最近文件")
-        self._rebuild_recent_menu()
+        self.recent_menu.aboutToShow.connect(self._populate_recent_menu)
         file_menu.addAction(self.action_clear_recent)
+        file_menu.addAction(self.action_cancel_load)
         file_menu.addSeparator()
         file_menu.addAction(self.action_exit)
 
@@ -142,16 +2482,31 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         edit_menu.addAction(self.action_paste)
         edit_menu.addSeparator()
         edit_menu.addAction(self.action_select_all)
+        edit_menu.addAction(self.action_goto_line)
+        edit_menu.addSeparator()
+        edit_menu.addAction(self.action_find)
+        edit_menu.addAction(self.action_replace)
+        edit_menu.addAction(self.action_find_next)
+        edit_menu.addAction(self.action_find_prev)
+        edit_menu.addAction(self.action_find_in_files)
         view_menu = mb.addMenu("查看")
         view_menu.addAction(self.action_increase_font)
         view_menu.addAction(self.action_decrease_font)
         view_menu.addAction(self.action_choose_font)
         view_menu.addAction(self.action_toggle_theme)
+        view_menu.addAction(self.action_syntax_highlight)
+        view_menu.addAction(self.action_long_lines)
         view_menu.addAction(self.action_choose_encoding)
+        view_menu.addAction(self.action_follow)
+        view_menu.addSeparator()
+        view_menu.addAction(self.action_next_tab)
+        view_menu.addAction(self.action_prev_tab)
         help_menu = mb.addMenu("帮助")
+        help_menu.addAction(self.action_diagnostics)
         help_menu.addAction(self.action_about)
     def _create_toolbars(self) -> None:
         tb = self.addToolBar("主工具栏")
+        self._main_toolbar = tb
         tb.setMovable(False)
         tb.setIconSize(QtCore.QSize(18, 18))
         tb.addAction(self.action_new)
@@ -166,7 +2521,24 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         tb.addAction(self.action_paste)
         tb.addSeparator()
 
-        # 字体选择控件
+    # 启动：QFontComboBox 构造时要同步枚举全部已安装字体，放到首次绘制之后再建
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        super().paintEvent(event)
+        if self._startup_pending:
+            self._startup_pending = False
+            if self.startup_timing is not None:
+                self.startup_timing.mark("首次绘制")
+            QtCore.QTimer.singleShot(0, self._finish_startup)
+
+    def _finish_startup(self) -> None:
+        self._create_font_widgets()
+        self._apply_config_to_widgets()
+        if self.startup_timing is not None:
+            self.startup_timing.mark("延迟界面")
+        self.startup_finished.emit()
+
+    def _create_font_widgets(self) -> None:
+        tb = self._main_toolbar
         font_combo = QtWidgets.QFontComboBox(self)
         try:
             font_combo.setCurrentFont(QtGui.QFont(self.config.font_family))
@@ -187,9 +2559,6 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         tb.addWidget(size_combo)
         self._font_combo = font_combo
         self._size_combo = size_combo
-    def _create_context_menu(self) -> None:
-        self.text_edit.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
-        self.text_edit.customContextMenuRequested.connect(self._show_context_menu)
     def _show_context_menu(self, pos):
         menu = QtWidgets.QMenu(self)
         menu.addAction(self.action_undo)
@@ -202,14 +2571,254 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         menu.addAction(self.action_select_all)
         menu.exec_(self.text_edit.mapToGlobal(pos))
     def _connect_actions(self) -> None:
-        self.text_edit.textChanged.connect(self._on_text_changed)
-        self.text_edit.copyAvailable.connect(self._on_copy_available)
-        self.text_edit.cursorPositionChanged.connect(self._on_cursor_position_changed)
-        self.text_edit.modificationChanged.connect(self._on_modification_changed)
+        self.tab_widget.currentChanged.connect(self._on_current_tab_changed)
+        self.tab_widget.tabCloseRequested.connect(lambda index: self.close_tab(self._tab_at(index)))
+        bar = self.find_bar
+        bar.options_changed.connect(self._schedule_search)
+        bar.closed.connect(self.hide_find_bar)
+        bar.find_edit.returnPressed.connect(
+            lambda: self._find_step(-1 if QtWidgets.QApplication.keyboardModifiers() & QtCore.Qt.ShiftModifier else 1))
+        bar.prev_button.clicked.connect(lambda: self._find_step(-1))
+        bar.next_button.clicked.connect(lambda: self._find_step(1))
+        bar.replace_button.clicked.connect(self.replace_current)
+        bar.replace_all_button.clicked.connect(self.replace_all)
         self._on_copy_available(False)
-        self._on_cursor_position_changed()
-    # 最近文件
-    def _rebuild_recent_menu(self) -> None:
+
+    # 标签页
+    def _new_tab(self, path: Optional[Path] = None, encoding: Optional[str] = None, activate: bool = True) -> DocumentTab:
+        tab = DocumentTab(path, encoding, self.tab_widget)
+        editor = tab.editor
+        try:
+            editor.setFont(QtGui.QFont(self.config.font_family, max(6, int(self.config.font_size))))
+        except Exception as exc:
+            print("_new_tab setFont error:", exc, file=sys.stderr)
+        editor.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        editor.customContextMenuRequested.connect(self._show_context_menu)
+        editor.copyAvailable.connect(lambda available, t=tab: t is self._tab and self._on_copy_available(available))
+        editor.cursorPositionChanged.connect(lambda t=tab: t is self._tab and self._schedule_ui_update("pos"))
+        editor.modificationChanged.connect(lambda changed, t=tab: self._on_modification_changed(t, changed))
+        # 滚动后只为新露出的区域补上匹配高亮
+        editor.verticalScrollBar().valueChanged.connect(lambda value, t=tab: t is self._search_tab and self._highlight_timer.start())
+        editor.verticalScrollBar().rangeChanged.connect(lambda lo, hi, t=tab: t is self._search_tab and self._highlight_timer.start())
+        doc = editor.document()
+        doc.contentsChanged.connect(lambda t=tab: self._on_contents_changed(t))
+        doc.contentsChange.connect(lambda pos, removed, added, t=tab: self._on_contents_change(t, pos, removed, added))
+        tab.load_timer.timeout.connect(lambda t=tab: self._drain_load_queue(t))
+        self._tabs.append(tab)
+        index = self.tab_widget.addTab(tab.page, tab.display_name)
+        self._update_tab_label(tab)
+        if activate:
+            self.tab_widget.setCurrentIndex(index)
+        return tab
+
+    def _tab_at(self, index: int) -> Optional[DocumentTab]:
+        page = self.tab_widget.widget(index)
+        for tab in self._tabs:
+            if tab.page is page:
+                return tab
+        return None
+
+    def _find_tab(self, path: Path) -> Optional[DocumentTab]:
+        for tab in self._tabs:
+            if tab.path is not None and tab.path == path:
+                return tab
+        return None
+
+    def _activate_tab(self, tab: DocumentTab) -> None:
+        # 恢复会话时可能已经是当前页却还没激活过，此时不会再收到 currentChanged
+        if self.tab_widget.currentWidget() is tab.page and self._tab is not tab:
+            self._on_current_tab_changed(self.tab_widget.currentIndex())
+        else:
+            self.tab_widget.setCurrentWidget(tab.page)
+
+    def _cycle_tab(self, step: int) -> None:
+        count = self.tab_widget.count()
+        if count:
+            self.tab_widget.setCurrentIndex((self.tab_widget.currentIndex() + step) % count)
+
+    def _on_current_tab_changed(self, index: int) -> None:
+        tab = self._tab_at(index)
+        if tab is None:
+            return
+        self._tab = tab
+        self._activation_counter += 1
+        tab.last_active = self._activation_counter
+        # 首次激活或被回收过的标签在这里才读取内容
+        if not tab.loaded and tab.loader is None and tab.large_view is None:
+            self._load_tab(tab)
+        if tab.highlighter is not None:
+            tab.highlighter.schedule()
+        self._sync_tab_ui()
+        self._on_copy_available(tab.editor.textCursor().hasSelection())
+        self._schedule_ui_update("pos", "title", "status")
+        # 后台标签的外部修改在切换过来时再处理（已修改的文档需要询问）
+        QtCore.QTimer.singleShot(0, lambda t=tab: t is self._tab and self._check_disk_change(t))
+        self._enforce_memory_budget()
+        if self.find_bar.isVisible():
+            self._schedule_search()
+
+    def _sync_tab_ui(self) -> None:
+        tab = self._tab
+        loading = tab.loader is not None
+        large = tab.large_view is not None
+        indexing = large and not tab.large_view.index.complete
+        self.load_progress.setVisible(loading or indexing)
+        self.cancel_load_button.setVisible(loading)
+        self.action_cancel_load.setEnabled(loading)
+        following = tab.follower is not None
+        self.action_save.setEnabled(not loading and not large and not following)
+        self.action_save_as.setEnabled(not loading and not large and not following)
+        for act in (self.action_undo, self.action_redo, self.action_paste, self.action_select_all,
+                    self.action_find, self.action_replace, self.action_find_next, self.action_find_prev):
+            act.setEnabled(not large)
+        for act in (self.action_undo, self.action_redo, self.action_paste, self.action_replace):
+            if following:
+                act.setEnabled(False)
+        # 查找栏上的替换按钮与“替换”菜单项一致
+        for button in (self.find_bar.replace_button, self.find_bar.replace_all_button):
+            button.setEnabled(self.action_replace.isEnabled())
+        compressed = tab.compression is not None
+        self.action_follow.setEnabled(tab.path is not None and not large and not loading and not compressed)
+        self.action_follow.setChecked(following)
+        self.action_long_lines.setEnabled(tab.path is not None and not loading and not following
+                                          and not compressed and (tab.long_line_mode or not large))
+        self.action_long_lines.setChecked(tab.long_line_mode)
+        if large and self.find_bar.isVisible():
+            self.hide_find_bar()
+
+    def close_tab(self, tab: Optional[DocumentTab]) -> bool:
+        if tab is None:
+            return False
+        self._wait_for_save(tab)
+        if not self._maybe_save(tab):
+            return False
+        self._dispose_tab(tab)
+        if not self._tabs:
+            self.file_new()
+        return True
+
+    def _dispose_tab(self, tab: DocumentTab) -> None:
+        loader = tab.loader
+        self._cancel_load(tab)
+        if loader is not None:
+            try:
+                loader.wait()
+            except RuntimeError:
+                pass
+        self._close_large_file(tab)
+        self._teardown_follow(tab)
+        if tab.reload_task is not None:
+            tab.reload_task.wait()
+        self._stop_journal(tab)
+        tab.load_timer.stop()
+        if tab is self._search_tab:
+            self._clear_search()
+        self._tabs.remove(tab)
+        self._ui_dirty_tabs.discard(tab)
+        self._sync_disk_watch()
+        if tab is self._tab:
+            self._tab = None
+        self.tab_widget.removeTab(self.tab_widget.indexOf(tab.page))
+        tab.page.deleteLater()
+
+    def _update_tab_label(self, tab: DocumentTab) -> None:
+        index = self.tab_widget.indexOf(tab.page)
+        if index < 0:
+            return
+        mark = "*" if tab.is_modified else ""
+        self.tab_widget.setTabText(index, f"{tab.display_name}{mark}")
+        self.tab_widget.setTabToolTip(index, str(tab.path) if tab.path else "未保存")
+
+    def _refresh(self, tab: DocumentTab) -> None:
+        self._ui_dirty_tabs.add(tab)
+        if tab is self._tab:
+            self._schedule_ui_update("title", "status")
+        else:
+            self._schedule_ui_update()
+
+    def _schedule_ui_update(self, *parts: str) -> None:
+        self._ui_dirty.update(parts)
+        if self._ui_timer.interval() <= 0:
+            self._flush_ui_updates()
+        elif not self._ui_timer.isActive():
+            self._ui_timer.start()
+
+    @profiled("界面刷新：标题、状态栏、光标位置")
+    def _flush_ui_updates(self) -> None:
+        dirty, self._ui_dirty = self._ui_dirty, set()
+        tabs, self._ui_dirty_tabs = self._ui_dirty_tabs, set()
+        for tab in tabs:
+            self._update_tab_label(tab)
+        if self._tab is None:
+            return
+        if "title" in dirty:
+            self._update_title()
+        if "status" in dirty:
+            self._update_status()
+        if "pos" in dirty:
+            self._update_position_label()
+
+    # 内存预算：超出时按最近最少使用的顺序回收未激活、未修改且有文件的标签，再次激活时按已知编码重新读取
+    def _enforce_memory_budget(self) -> None:
+        budget = self.config.tab_memory_budget_mb * 1024 * 1024
+        loaded = [t for t in self._tabs if t.loaded]
+        total = sum(t.memory_estimate() for t in loaded)
+        for tab in sorted(loaded, key=lambda t: t.last_active):
+            if total <= budget:
+                break
+            if tab is self._tab or not self._can_evict(tab):
+                continue
+            total -= tab.memory_estimate()
+            self._evict_tab(tab)
+
+    def _can_evict(self, tab: DocumentTab) -> bool:
+        # 全部替换进行中不回收，结果回来时文档还在
+        return (tab.path is not None and not tab.is_modified and tab.loader is None and self._replace_task is None
+                and tab.save_task is None and tab.large_view is None and tab.follower is None)
+
+    def _evict_tab(self, tab: DocumentTab) -> None:
+        editor = tab.editor
+        tab.cursor_pos = editor.textCursor().position()
+        tab.scroll_value = editor.verticalScrollBar().value()
+        tab.loaded = False
+        tab.doc_serial += 1
+        self._stop_journal(tab)
+        self._sync_highlighter(tab)
+        doc = editor.document()
+        # 关闭撤销栈再清空，连同撤销历史一起释放
+        doc.setUndoRedoEnabled(False)
+        editor.clear()
+        doc.setUndoRedoEnabled(True)
+        doc.setModified(False)
+        tab.is_modified = False
+
+    # 会话：退出时记录打开的文件，下次启动时恢复为未加载的标签
+    def _restore_session(self, activate: bool = True) -> None:
+        paths = [Path(p) for p in self.config.open_tabs if Path(p).is_file()]
+        if not paths:
+            return
+        self.tab_widget.blockSignals(True)
+        for p in paths:
+            self._new_tab(p, activate=False)
+        self.tab_widget.setCurrentIndex(min(max(0, self.config.active_tab), len(paths) - 1))
+        self.tab_widget.blockSignals(False)
+        if activate:
+            self._on_current_tab_changed(self.tab_widget.currentIndex())
+
+    def _record_session(self) -> None:
+        tabs = [self._tab_at(i) for i in range(self.tab_widget.count())]
+        with_path = [t for t in tabs if t is not None and t.path is not None]
+        self.config.open_tabs = [str(t.path) for t in with_path]
+        self.config.active_tab = with_path.index(self._tab) if self._tab in with_path else 0
+
+    # 最近文件：菜单在弹出前才重建
+    def _invalidate_recent_menu(self) -> None:
+        self._recent_menu_stale = True
+
+    def _populate_recent_menu(self) -> None:
+        if not self._recent_menu_stale:
+            return
+        self._recent_menu_stale = False
         self.recent_menu.clear()
         if not self.config.recent_files:
             self.recent_menu.addAction(QtWidgets.QAction("（无）", self, enabled=False))
@@ -218,6 +2827,8 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
             act = QtWidgets.QAction(path, self)
             act.triggered.connect(lambda checked=False, p=path: self._open_recent(p))
             self.recent_menu.addAction(act)
+        self.recent_menu.addSeparator()
+        self.recent_menu.addAction(self.action_open_all_recent)
     def _add_to_recent(self, p: Path) -> None:
         s = str(p)
         if s in self.config.recent_files:
@@ -227,157 +2838,1244 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
                 pass
         self.config.recent_files.insert(0, s)
         self.config.recent_files = self.config.recent_files[:MAX_RECENT]
-        self._rebuild_recent_menu()
+        self._invalidate_recent_menu()
     def _open_recent(self, path_str: str) -> None:
         p = Path(path_str)
         if p.exists():
-            if not self._maybe_save():
-                return
-            self._load_file_with_encoding(p, try_auto=True)
+            self.open_file(p)
+
+    def _open_all_recent(self) -> None:
+        # 只建立标签，内容在切换到该标签时才加载
+        for path_str in self.config.recent_files[:MAX_RECENT]:
+            p = Path(path_str)
+            if p.is_file() and self._find_tab(p) is None:
+                self._new_tab(p, activate=False)
 
     def _clear_recent(self) -> None:
         self.config.recent_files = []
-        self._rebuild_recent_menu()
-        save_config(self.config)
+        self._invalidate_recent_menu()
+        self.config_store.mark_dirty()
 
     # 状态回调
-    def _on_text_changed(self) -> None:
-        modified = self.text_edit.document().isModified()
-        if modified != self._is_modified:
-            self._is_modified = modified
-            self._update_title()
-            self._update_status()
-
-    def _on_modification_changed(self, changed: bool) -> None:
-        self._is_modified = changed
-        self._update_title()
-        self._update_status()
+    def _on_modification_changed(self, tab: DocumentTab, changed: bool) -> None:
+        if changed == tab.is_modified:
+            return
+        tab.is_modified = changed
+        self._refresh(tab)
     def _on_copy_available(self, available: bool) -> None:
         self.action_cut.setEnabled(available)
         self.action_copy.setEnabled(available)
-    def _on_cursor_position_changed(self) -> None:
-        cursor = self.text_edit.textCursor()
-        line = cursor.blockNumber() + 1
-        col = cursor.columnNumber() + 1
-        self.pos_label.setText(f"行 {line}, 列 {col}")
+    def _update_position_label(self) -> None:
+        # blockNumber() 在 Qt 的段落树上是 O(log n)，合并后每个刷新周期只取一次
+        view = self._tab.large_view
+        if view is not None:
+            line, col = view.cursor_line, view.cursor_col
+        else:
+            cursor = self.text_edit.textCursor()
+            line, col = cursor.blockNumber(), cursor.columnNumber()
+        self.pos_label.setText(f"行 {line + 1}, 列 {col + 1}")
     def _update_title(self) -> None:
-        name = self._current_file.name if self._current_file else "未命名"
-        mark = "*" if self._is_modified else ""
-        self.setWindowTitle(f"{name}{mark} — {APP_NAME}")
+        tab = self._tab
+        mark = "*" if tab.is_modified else ""
+        ro = " [只读]" if tab.large_view is not None else ""
+        self.setWindowTitle(f"{tab.display_name}{mark}{ro} — {APP_NAME}")
     def _update_status(self) -> None:
-        path = str(self._current_file) if self._current_file else "未保存"
-        mark = "已修改" if self._is_modified else "已保存"
+        tab = self._tab
+        path = str(tab.path) if tab.path else "未保存"
+        mark = "已修改" if tab.is_modified else "已保存"
+        if tab.save_task is not None:
+            mark = "正在保存…"
+        if tab.follower is not None:
+            mark = "跟随文件末尾（只读）"
+        if tab.large_view is not None:
+            index = tab.large_view.index
+            mark = "长行模式（只读）· 取消“查看 → 长行模式”可编辑" if tab.long_line_mode else "大文件只读模式"
+            if not index.complete:
+                mark += f" — 正在建立行索引 {index.indexed * 100 // max(1, index.size)}%"
         self.status_label.setText(f"{path} — {mark}")
-        self.enc_label.setText(f"编码: {self._current_encoding}")
-    # 文件读取（简化稳定版）：只尝试常用编码并返回第一个成功
-    def _try_read_with_encodings(self, path: Path):
-        last_exc = None
-        for e in FALLBACK_ENCODINGS:
-            try:
-                with path.open("r", encoding=e, errors="strict") as f:
-                    return f.read(), e
-            except Exception as exc:
-                last_exc = exc
-        try:
-            with path.open("r", encoding="latin-1", errors="replace") as f:
-                return f.read(), "latin-1"
-        except Exception as exc:
-            print("_try_read_with_encodings final error:", exc, file=sys.stderr)
-            raise last_exc or IOError("无法读取文件")
-    def _load_file_with_encoding(self, path: Path, try_auto: bool = True) -> None:
-        try:
-            if try_auto:
-                text, enc_used = self._try_read_with_encodings(path)
+        conf = "" if tab.confidence is None else f" · 置信度 {tab.confidence:.0%}"
+        packed = "" if tab.compression is None else f" · {tab.compression} 压缩"
+        self.enc_label.setText(f"编码: {tab.encoding or self.config.encoding}{conf}{packed}")
+    def open_file(self, path: Path, line: int = 0) -> None:
+        tab = self._find_tab(path)
+        if tab is not None:
+            self._activate_tab(tab)
+        elif self._tab is not None and self._tab.is_pristine():
+            tab = self._tab
+            self._stop_journal(tab)
+            tab.path = path
+            tab.encoding = None
+            tab.long_lines = None
+            self._load_tab(tab)
+        else:
+            tab = self._new_tab(path)
+        if line:
+            if tab.loader is not None or not tab.loaded:
+                tab.pending_line = line
             else:
-                with path.open("r", encoding=self.config.encoding, errors="strict") as f:
-                    text = f.read()
-                enc_used = self.config.encoding
+                self._goto_line_in(tab, line)
+
+    # 文件读取：后台线程分块读取解码，界面按批追加，避免大文件冻结窗口
+    def _load_tab(self, tab: DocumentTab) -> None:
+        self._cancel_load(tab)
+        self._close_large_file(tab)
+        self._teardown_follow(tab)
+        path = tab.path
+        try:
+            with path.open("rb") as f:
+                head = f.read(COMPRESSION_MAGIC_BYTES)
+            size = path.stat().st_size
         except Exception as exc:
-            print("_load_file_with_encoding error:", exc, file=sys.stderr)
+            print("_load_tab error:", exc, file=sys.stderr)
+            self._reset_after_load(tab, None)
             QtWidgets.QMessageBox.critical(self, "错误", f"打开文件失败：\n{exc}")
             return
-        self._current_file = path
-        self._current_encoding = enc_used
-        self.text_edit.setPlainText(text)
-        self.text_edit.document().setModified(False)
-        self._is_modified = False
-        self._add_to_recent(path)
-        self._update_title()
-        self._update_status()
+        tab.doc_serial += 1
+        tab.compression = detect_compression(head)
+        # 压缩文件只能顺序解压，不能内存映射分页显示，也不检测超长行
+        large = size >= self.config.large_file_threshold_mb * 1024 * 1024
+        if tab.compression is None and (large or tab.long_lines):
+            if self._open_large_file(tab, path, tab.encoding, long_lines=not large):
+                return
+        # 被回收后重新加载时沿用已识别的编码，不再重新探测；用户关掉长行模式后不再检测超长行
+        long_line_chars = 0 if tab.long_lines is False or tab.compression is not None else self.config.long_line_chars
+        loader = FileLoadThread(path, tab.encoding, long_line_chars, self._decompressed, self)
+        tab.loader = loader
+        tab.load_pending.clear()
+        tab.load_result = None
+        tab.load_first_batch = True
+        tab.encoding = loader.encoding or self.config.encoding
+        if loader.encoding is None:
+            tab.confidence = None
+        self._sync_highlighter(tab)
+        doc = tab.editor.document()
+        doc.setUndoRedoEnabled(False)
+        tab.editor.clear()
+        tab.buffer = PieceBuffer()
+        tab.editor.setReadOnly(True)
+        loader.chunk_ready.connect(lambda text, ld=loader, t=tab: self._on_load_chunk(t, ld, text))
+        loader.progress.connect(lambda done, total, ld=loader, t=tab: self._on_load_progress(t, ld, done, total))
+        loader.detected.connect(lambda enc, conf, ld=loader, t=tab: self._on_load_detected(t, ld, enc, conf))
+        loader.restarted.connect(lambda enc, ld=loader, t=tab: self._on_load_restarted(t, ld, enc))
+        loader.loaded.connect(lambda enc, ld=loader, t=tab: self._on_load_finished(t, ld, enc))
+        loader.failed.connect(lambda msg, ld=loader, t=tab: self._on_load_failed(t, ld, msg))
+        loader.long_line.connect(lambda enc, ld=loader, t=tab: self._on_load_long_line(t, ld, enc))
+        loader.finished.connect(loader.deleteLater)
+        if tab is self._tab:
+            self.load_progress.setValue(0)
+            self._sync_tab_ui()
+        self._refresh(tab)
+        loader.start()
 
-    def file_new(self) -> None:
-        if not self._maybe_save():
+    def _on_load_chunk(self, tab: DocumentTab, loader: FileLoadThread, text: str) -> None:
+        if loader is not tab.loader:
             return
-        self.text_edit.clear()
-        self._current_file = None
-        self._current_encoding = self.config.encoding
-        self.text_edit.document().setModified(False)
-        self._is_modified = False
-        self._update_title()
-        self._update_status()
+        tab.load_pending.append(text)
+        if not tab.load_timer.isActive():
+            tab.load_timer.start()
 
-    def file_open(self) -> None:
-        if not self._maybe_save():
+    def _on_load_progress(self, tab: DocumentTab, loader: FileLoadThread, done: int, total: int) -> None:
+        if loader is not tab.loader or tab is not self._tab:
             return
-        path_str, _ = QtWidgets.QFileDialog.getOpenFileName(self, "打开文件", str(Path.home()), FILE_FILTER)
-        if not path_str:
+        pct = int(done * 100 / total) if total else 100
+        self.load_progress.setValue(pct)
+        self.status_label.setText(f"正在加载 {tab.display_name} — {pct}%")
+
+    def _on_load_detected(self, tab: DocumentTab, loader: FileLoadThread, enc: str, confidence: float) -> None:
+        if loader is not tab.loader:
             return
-        path = Path(path_str)
-        self._load_file_with_encoding(path, try_auto=True)
-    def _write_file(self, path: Path, text: str, encoding: str) -> bool:
+        tab.encoding = enc
+        tab.confidence = confidence
+        self._refresh(tab)
+
+    def _on_load_restarted(self, tab: DocumentTab, loader: FileLoadThread, enc: str) -> None:
+        if loader is not tab.loader:
+            return
+        tab.load_pending.clear()
+        tab.load_first_batch = True
+        tab.encoding = enc
+        tab.editor.clear()
+        tab.buffer = PieceBuffer()
+
+    def _on_load_finished(self, tab: DocumentTab, loader: FileLoadThread, enc: str) -> None:
+        if loader is not tab.loader:
+            return
+        tab.load_result = enc
+        if not tab.load_timer.isActive():
+            tab.load_timer.start()
+
+    def _on_load_failed(self, tab: DocumentTab, loader: FileLoadThread, msg: str) -> None:
+        if loader is not tab.loader:
+            return
+        self._reset_after_load(tab, None)
+        QtWidgets.QMessageBox.critical(self, "错误", f"打开文件失败：\n{msg}")
+
+    def _on_load_long_line(self, tab: DocumentTab, loader: FileLoadThread, enc: str) -> None:
+        if loader is not tab.loader:
+            return
+        # 加载线程已经停止；丢掉已经插入的部分，改用不折行、只解码可见片段的分页视图
+        tab.loader = None
+        tab.load_timer.stop()
+        tab.load_pending.clear()
+        tab.load_result = None
+        tab.editor.clear()
+        tab.buffer = PieceBuffer()
+        tab.editor.document().setUndoRedoEnabled(True)
+        if not self._open_large_file(tab, tab.path, enc, long_lines=True):
+            # UTF-16/32 不能按字节找换行，仍用普通编辑器打开
+            tab.long_lines = False
+            self._load_tab(tab)
+        elif tab is self._tab:
+            # 原本可以（很慢地）编辑的文件现在只读打开，明确告诉用户以及怎样切回编辑器
+            self.status.showMessage(f"{tab.display_name} 含超长行，已按长行模式只读打开；{LONG_LINE_EDIT_HINT}", 10000)
+
+    def _on_read_only_edit(self, tab: DocumentTab) -> None:
+        if tab is not self._tab:
+            return
+        if tab.long_line_mode:
+            self.status.showMessage(f"长行模式是只读的；{LONG_LINE_EDIT_HINT}", 5000)
+        else:
+            self.status.showMessage("大文件以只读分页模式打开，不能编辑", 5000)
+
+    @profiled("加载：插入文档")
+    def _drain_load_queue(self, tab: DocumentTab) -> None:
+        # 每个定时器周期最多追加 LOAD_BATCH_CHARS 个字符，其余留到下一周期，保证界面可以重绘和响应；
+        # 第一批只取首块，先把第一屏画出来
+        doc = tab.editor.document()
+        parts = []
+        n = 0
+        limit = 1 if tab.load_first_batch else LOAD_BATCH_CHARS
+        while tab.load_pending and n < limit:
+            t = tab.load_pending.popleft()
+            parts.append(t)
+            n += len(t)
+        if parts:
+            cursor = QtGui.QTextCursor(doc)
+            cursor.movePosition(QtGui.QTextCursor.End)
+            text = "".join(parts)
+            cursor.insertText(text)
+            # 加载期间不经 contentsChange 镜像，直接把读入的文本作为只读片段追加
+            if tab.buffer is not None:
+                tab.buffer.append(text)
+            del text
+            doc.setModified(False)
+            if tab.load_first_batch:
+                tab.load_first_batch = False
+                tab.editor.moveCursor(QtGui.QTextCursor.Start)
+                if self.startup_timing is not None and tab is self._tab:
+                    self.startup_timing.mark("文件首屏")
+        if not tab.load_pending:
+            tab.load_timer.stop()
+            if tab.load_result is not None:
+                self._reset_after_load(tab, tab.load_result)
+
+    def _reset_after_load(self, tab: DocumentTab, enc: Optional[str]) -> None:
+        tab.load_timer.stop()
+        tab.load_pending.clear()
+        editor = tab.editor
+        doc = editor.document()
+        loader = tab.loader
+        if enc is None:
+            editor.clear()
+        tab.loader = None
+        tab.loaded = True
+        # 压缩文件不能从某个字节偏移接着读，没有 loaded_bytes
+        tab.loaded_bytes = None if enc is None or loader.compression is not None else loader.bytes_read
+        tab.compression = None if enc is None else loader.compression
+        tab.disk_state = None if enc is None else loader.disk_state
+        tab.disk_digest = None if enc is None else loader.digest
+        if enc is None:
+            tab.buffer = PieceBuffer()
+            tab.pending_line = 0
+            tab.path = None
+            tab.encoding = self.config.encoding
+            tab.confidence = None
+            tab.long_lines = None
+            tab.cursor_pos = tab.scroll_value = 0
+            self._start_journal(tab, None, tab.encoding, {"kind": "empty"}, 0)
+        else:
+            tab.encoding = enc
+            self._add_to_recent(tab.path)
+            fp = loader.fingerprint
+            self._start_journal(tab, tab.path, enc, {"kind": "file", "fingerprint": fp}, fp["size"])
+            if tab.pending_line:
+                self._goto_line_in(tab, tab.pending_line)
+            elif tab.cursor_pos:
+                # 回收后重新加载：恢复离开时的光标和滚动位置
+                cursor = editor.textCursor()
+                cursor.setPosition(min(tab.cursor_pos, doc.characterCount() - 1))
+                editor.setTextCursor(cursor)
+                editor.verticalScrollBar().setValue(tab.scroll_value)
+                tab.cursor_pos = tab.scroll_value = 0
+        doc.setUndoRedoEnabled(True)
+        doc.setModified(False)
+        tab.is_modified = False
+        editor.setReadOnly(False)
+        self._check_buffer(tab)
+        self._sync_highlighter(tab)
+        if tab is self._tab:
+            self._sync_tab_ui()
+        self._refresh(tab)
+        if enc is not None:
+            self._enforce_memory_budget()
+        if self.startup_timing is not None and tab is self._tab:
+            self.startup_timing.mark("文件加载")
+        self._sync_disk_watch()
+
+    def _cancel_load(self, tab: DocumentTab) -> None:
+        loader = tab.loader
+        if loader is None:
+            return
+        loader.cancel()
+        self._reset_after_load(tab, None)
+        if tab is self._tab:
+            self.status_label.setText("已取消加载")
+
+    # 大文件只读分页模式；long_lines 为真时是因超长行打开的长行模式，两者共用分页视图
+    def _open_large_file(self, tab: DocumentTab, path: Path, encoding: Optional[str] = None,
+                         long_lines: bool = False) -> bool:
         try:
-            with path.open("w", encoding=encoding, newline="\n", errors="strict") as f:
-                f.write(text)
-            return True
+            f = path.open("rb")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         except Exception as exc:
-            print("_write_file primary error:", exc, file=sys.stderr)
+            print("_open_large_file mmap error:", exc, file=sys.stderr)
+            return False
+        if encoding is None:
+            candidates, confidence = detect_encoding(mm[:ENCODING_SAMPLE_SIZE], len(mm) <= ENCODING_SAMPLE_SIZE)
+            enc = candidates[0] if candidates else "latin-1"
+        else:
+            enc, confidence = encoding, tab.confidence
+        # 按字节找换行要求编码与 ASCII 兼容，UTF-16/32 仍走普通加载
+        if codecs.lookup(enc).name.startswith(("utf-16", "utf-32")):
+            mm.close()
+            f.close()
+            return False
+        index = LineIndex(mm, len(mm))
+        view = LargeFileView(index, enc, tab.page)
+        view.setFont(tab.editor.font())
+        view.cursor_moved.connect(lambda line, col, t=tab: t is self._tab and self._schedule_ui_update("pos"))
+        view.edit_attempted.connect(lambda t=tab: self._on_read_only_edit(t))
+        thread = LineIndexThread(index, self)
+        thread.progress.connect(lambda done, total, t=tab: self._on_index_progress(t, done, total))
+        tab.large_file_obj = f
+        tab.large_mmap = mm
+        tab.large_view = view
+        tab.large_index_thread = thread
+        tab.long_line_mode = long_lines
+        self._stop_journal(tab)
+        self._sync_highlighter(tab)
+        tab.editor.clear()
+        tab.editor.document().setModified(False)
+        tab.editor.setReadOnly(True)
+        tab.page.addWidget(view)
+        tab.page.setCurrentWidget(view)
+        tab.path = path
+        tab.encoding = enc
+        tab.confidence = confidence
+        tab.is_modified = False
+        tab.loaded = True
+        self._add_to_recent(path)
+        if tab is self._tab:
+            view.setFocus()
+            self.load_progress.setValue(0)
+            self._sync_tab_ui()
+            self._schedule_ui_update("pos")
+        self._refresh(tab)
+        thread.start()
+        if self.startup_timing is not None and tab is self._tab:
+            self.startup_timing.mark("文件加载")
+        return True
+
+    def _close_large_file(self, tab: DocumentTab) -> None:
+        view = tab.large_view
+        if view is None:
+            return
+        tab.large_index_thread.cancel()
+        tab.large_index_thread.wait()
+        tab.large_index_thread.deleteLater()
+        tab.page.removeWidget(view)
+        view.deleteLater()
+        tab.large_mmap.close()
+        tab.large_file_obj.close()
+        tab.large_view = None
+        tab.large_index_thread = None
+        tab.large_mmap = None
+        tab.large_file_obj = None
+        tab.long_line_mode = False
+        tab.page.setCurrentWidget(tab.editor)
+        tab.editor.setReadOnly(False)
+        if tab is self._tab:
+            self._sync_tab_ui()
+
+    def _on_index_progress(self, tab: DocumentTab, done: int, total: int) -> None:
+        if tab.large_view is None:
+            return
+        tab.large_view.update_range()
+        if tab is not self._tab:
+            return
+        self.load_progress.setValue(int(done * 100 / total) if total else 100)
+        if done >= total:
+            self.load_progress.setVisible(False)
+        self._schedule_ui_update("status")
+
+    # 外部修改：stat 信息没变就认为没变；大小相同而时间戳或 inode 变了时比对摘要
+    def _disk_changed(self, tab: DocumentTab) -> Optional[dict]:
+        if tab.path is None or tab.disk_state is None:
+            return None
+        try:
+            state = disk_state(tab.path.stat())
+        except OSError:
+            return None
+        if state == tab.disk_state:
+            return None
+        if state["size"] == tab.disk_state["size"] and tab.disk_digest is not None:
             try:
-                with path.open("w", encoding="utf-8", newline="\n", errors="replace") as f:
-                    f.write(text)
+                same = file_digest(tab.path) == tab.disk_digest
+            except OSError as exc:
+                print("_disk_changed digest error:", exc, file=sys.stderr)
+                same = False
+            if same:
+                tab.disk_state = state
+                return None
+        return state
+
+    def _sync_disk_watch(self) -> None:
+        wanted = {str(t.path) for t in self._tabs
+                  if t.path is not None and t.loaded and t.large_view is None and t.path.exists()}
+        watched = set(self._disk_watcher.files())
+        if watched - wanted:
+            self._disk_watcher.removePaths(list(watched - wanted))
+        if wanted - watched:
+            self._disk_watcher.addPaths(list(wanted - watched))
+
+    def _on_disk_file_changed(self, path: str) -> None:
+        self._disk_pending.add(path)
+        self._disk_timer.start()
+
+    def _check_pending_disk_changes(self) -> None:
+        paths, self._disk_pending = self._disk_pending, set()
+        for tab in list(self._tabs):
+            if tab.path is not None and str(tab.path) in paths:
+                self._check_disk_change(tab)
+        # 原子替换（重命名）后监视会丢失，重新加上
+        self._sync_disk_watch()
+
+    def _check_disk_change(self, tab: DocumentTab) -> None:
+        # 全部替换进行中先不重新加载，替换结束后再检查
+        if (self._closing or not tab.loaded or tab.loader is not None or tab.save_task is not None
+                or tab.reload_task is not None or tab.large_view is not None or tab.follower is not None
+                or self._replace_task is not None):
+            return
+        state = self._disk_changed(tab)
+        if state is None:
+            return
+        if tab.is_modified:
+            # 已修改的后台标签等切换过来再问
+            if tab is not self._tab:
+                return
+            # 不管选哪一项都把当前状态记为已知，避免同一次修改反复询问
+            tab.disk_state = state
+            tab.disk_digest = None
+            reply = QtWidgets.QMessageBox.question(
+                self,
+                "文件已被修改",
+                f"{tab.path} 已被其他程序修改。\n\n是否重新加载？未保存的修改会被替换（可以撤销找回）。",
+                QtWidgets.QMessageBox.StandardButton.Yes | QtWidgets.QMessageBox.StandardButton.No,
+                QtWidgets.QMessageBox.StandardButton.No,
+            )
+            if reply != QtWidgets.QMessageBox.StandardButton.Yes or tab not in self._tabs:
+                return
+        self._reload_from_disk(tab)
+
+    def _reload_from_disk(self, tab: DocumentTab) -> None:
+        # 后台读取新内容并求行级差异，界面线程只替换变化的行：光标、滚动位置和撤销历史都保留
+        task = BackgroundTask(reload_diff, tab.path, tab.encoding, tab.text_snapshot(), parent=self)
+        serial = tab.doc_serial
+        generation = tab.edit_generation
+        task.succeeded.connect(lambda result, t=task: self._on_reload_ready(tab, t, serial, generation, result))
+        task.failed.connect(lambda exc, t=task: self._on_reload_failed(tab, t, exc))
+        task.finished.connect(task.deleteLater)
+        tab.reload_task = task
+        task.start()
+
+    def _on_reload_ready(self, tab: DocumentTab, task: BackgroundTask, serial: int, generation: int, result) -> None:
+        task.args = ()
+        tab.reload_task = None
+        if tab not in self._tabs or serial != tab.doc_serial:
+            return
+        if generation != tab.edit_generation:
+            # 求差异期间文档又被编辑：差异已失效，重新检查
+            self._check_disk_change(tab)
+            return
+        ops, state, digest, fingerprint = result
+        editor = tab.editor
+        doc = editor.document()
+        scroll = editor.verticalScrollBar().value()
+        self._stop_journal(tab)
+        if ops:
+            blocks = doc.blockCount()
+            cursor = QtGui.QTextCursor(doc)
+            cursor.beginEditBlock()
+            # 从后往前替换，前面的行号不受影响
+            for first, last, text in reversed(ops):
+                start = doc.findBlockByNumber(first).position()
+                end = doc.findBlockByNumber(last).position() if last < blocks else doc.characterCount() - 1
+                cursor.setPosition(start)
+                cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+                cursor.insertText(text)
+            cursor.endEditBlock()
+            editor.verticalScrollBar().setValue(scroll)
+        doc.setModified(False)
+        tab.is_modified = False
+        tab.disk_state = state
+        tab.disk_digest = digest
+        tab.loaded_bytes = fingerprint["size"]
+        self._start_journal(tab, tab.path, tab.encoding, {"kind": "file", "fingerprint": fingerprint}, fingerprint["size"])
+        self._refresh(tab)
+        if tab is self._tab:
+            self.status.showMessage(f"已从磁盘重新加载 {tab.display_name}（{len(ops)} 处改动）", 5000)
+
+    def _on_reload_failed(self, tab: DocumentTab, task: BackgroundTask, exc: Exception) -> None:
+        task.args = ()
+        tab.reload_task = None
+        if tab not in self._tabs:
+            return
+        print("_reload_from_disk error:", exc, file=sys.stderr)
+        if isinstance(exc, UnicodeDecodeError):
+            # 新内容无法按原编码解码：整份重新读取并重新探测编码
+            tab.encoding = None
+            self._load_tab(tab)
+            return
+        QtWidgets.QMessageBox.critical(self, "错误", f"重新加载文件失败：\n{exc}")
+
+    # 跟随模式：只读，新追加的内容接到文档末尾，超出行数上限时丢弃开头的行
+    def toggle_follow(self, checked: bool) -> None:
+        tab = self._tab
+        if checked:
+            self._start_follow(tab)
+        else:
+            self._stop_follow(tab)
+        self._sync_tab_ui()
+        self._refresh(tab)
+
+    def _start_follow(self, tab: DocumentTab) -> None:
+        if (tab.follower is not None or tab.path is None or tab.large_view is not None or tab.loader is not None
+                or self._replace_task is not None):
+            return
+        if tab.is_modified or tab.save_task is not None or tab.loaded_bytes is None:
+            QtWidgets.QMessageBox.information(self, "跟随文件末尾", "文档有未保存的修改，请先保存或重新打开文件。")
+            return
+        follower = FileFollower(tab.path, tab.encoding, tab.loaded_bytes, self)
+        follower.appended.connect(lambda text, t=tab: self._on_follow_appended(t, text))
+        follower.reset.connect(lambda t=tab: self._on_follow_reset(t))
+        # 跟随期间不记录崩溃恢复日志，也不保留撤销历史，内存只随保留的行数增长
+        self._stop_journal(tab)
+        doc = tab.editor.document()
+        doc.setUndoRedoEnabled(False)
+        tab.editor.setReadOnly(True)
+        tab.follower = follower
+        tab.follow_trimmed = False
+        try:
+            follower.start()
+        except OSError as exc:
+            print("_start_follow error:", exc, file=sys.stderr)
+            self._teardown_follow(tab)
+            QtWidgets.QMessageBox.critical(self, "错误", f"无法跟随文件：\n{exc}")
+
+    def _teardown_follow(self, tab: DocumentTab) -> None:
+        follower = tab.follower
+        if follower is None:
+            return
+        follower.stop()
+        follower.deleteLater()
+        tab.follower = None
+        tab.editor.setReadOnly(False)
+        tab.editor.document().setUndoRedoEnabled(True)
+        if tab is self._tab:
+            self._sync_tab_ui()
+
+    def _stop_follow(self, tab: DocumentTab) -> None:
+        follower = tab.follower
+        if follower is None:
+            return
+        follower.poll()
+        offset = follower.offset
+        self._teardown_follow(tab)
+        # 丢弃过开头的行或文件仍在增长时文档已不等于文件，重新读取；否则从当前文件接着记录恢复日志
+        try:
+            fp = file_fingerprint(tab.path)
+        except OSError as exc:
+            print("_stop_follow fingerprint error:", exc, file=sys.stderr)
+            fp = None
+        if tab.follow_trimmed or fp is None or fp["size"] != offset:
+            tab.cursor_pos = tab.editor.textCursor().position()
+            tab.scroll_value = tab.editor.verticalScrollBar().value()
+            self._load_tab(tab)
+            return
+        tab.loaded_bytes = offset
+        try:
+            tab.disk_state = disk_state(tab.path.stat())
+        except OSError:
+            tab.disk_state = None
+        tab.disk_digest = None
+        self._start_journal(tab, tab.path, tab.encoding, {"kind": "file", "fingerprint": fp}, fp["size"])
+
+    def _on_follow_appended(self, tab: DocumentTab, text: str) -> None:
+        editor = tab.editor
+        doc = editor.document()
+        bar = editor.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum()
+        cursor = QtGui.QTextCursor(doc)
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText(text)
+        limit = max(1, self.config.follow_max_lines)
+        excess = doc.blockCount() - limit
+        # 超出上限一成以上才裁剪，把删除开头段落的开销分摊到多次追加上
+        if excess > limit // 10:
+            cursor.setPosition(0)
+            cursor.setPosition(doc.findBlockByNumber(excess).position(), QtGui.QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+            tab.follow_trimmed = True
+        doc.setModified(False)
+        if at_bottom:
+            bar.setValue(bar.maximum())
+
+    def _on_follow_reset(self, tab: DocumentTab) -> None:
+        # 日志轮转或被截断：清空后从新文件开头重读
+        tab.editor.clear()
+        tab.editor.document().setModified(False)
+        tab.follow_trimmed = False
+        if tab is self._tab:
+            self.status.showMessage("文件已被截断或替换，从头重新读取", 5000)
+
+    def goto_line_dialog(self) -> None:
+        if self._tab.large_view is not None:
+            maximum = self._tab.large_view.index.line_count
+        else:
+            maximum = self.text_edit.document().blockCount()
+        line, ok = QtWidgets.QInputDialog.getInt(self, "转到行", f"行号 (1 - {maximum})：", 1, 1, max(1, maximum))
+        if ok:
+            self.goto_line(line)
+
+    def goto_line(self, line: int) -> None:
+        self._goto_line_in(self._tab, line)
+
+    def _goto_line_in(self, tab: DocumentTab, line: int) -> None:
+        tab.pending_line = 0
+        if tab.large_view is not None:
+            tab.large_view.goto_line(line)
+            return
+        block = tab.editor.document().findBlockByNumber(line - 1)
+        if block.isValid():
+            tab.editor.setTextCursor(QtGui.QTextCursor(block))
+            tab.editor.centerCursor()
+
+    def file_new(self) -> None:
+        tab = self._new_tab(None, self.config.encoding)
+        self._start_journal(tab, None, tab.encoding, {"kind": "empty"}, 0)
+        tab.editor.setFocus()
+
+    def file_open(self) -> None:
+        paths, _ = QtWidgets.QFileDialog.getOpenFileNames(self, "打开文件", str(Path.home()), FILE_FILTER)
+        for path_str in paths:
+            self.open_file(Path(path_str))
+    # 保存：界面线程只取一份文本快照，编码和磁盘写入放到后台线程
+    def _write_file(self, tab: DocumentTab, path: Path, encoding: str, compression: Optional[str]) -> bool:
+        if tab.save_task is not None:
+            if path == tab.save_task.args[0]:
+                # 同一文件正在保存：完成后再用最新内容保存一次
+                tab.save_again = True
                 return True
-            except Exception as exc2:
-                print("_write_file fallback error:", exc2, file=sys.stderr)
-                QtWidgets.QMessageBox.critical(self, "错误", f"保存文件失败：\n{exc2}")
+            self._wait_for_save(tab)
+        task = BackgroundTask(save_text_file, path, tab.text_snapshot(), encoding, compression, parent=self)
+        serial = tab.doc_serial
+        generation = tab.edit_generation
+        journal = tab.journal
+        mark = journal.checkpoint() if journal is not None else 0
+        task.succeeded.connect(lambda result, t=task: self._on_save_finished(tab, t, serial, generation, result, journal, mark))
+        task.failed.connect(lambda exc, t=task: self._on_save_failed(tab, t, exc, journal))
+        task.finished.connect(task.deleteLater)
+        tab.save_task = task
+        self._refresh(tab)
+        task.start()
+        return True
+
+    def _on_save_finished(self, tab: DocumentTab, task: BackgroundTask, serial: int, generation: int, result,
+                          journal: Optional[AutosaveJournal], mark: int) -> None:
+        enc, state, digest = result
+        path = task.args[0]
+        compression = task.args[3]
+        task.args = ()
+        tab.save_task = None
+        tab.last_save_ok = True
+        if journal is not None:
+            # 已保存的部分不再需要日志，只保留保存期间的新编辑
+            try:
+                journal.rebase_to_file(path, enc, file_fingerprint(path), mark)
+            except OSError as exc:
+                print("_on_save_finished fingerprint error:", exc, file=sys.stderr)
+                journal.release()
+        if serial == tab.doc_serial:
+            tab.path = path
+            tab.compression = compression
+            if enc != tab.encoding:
+                tab.encoding = enc
+                tab.confidence = None
+            # 保存期间又有编辑时保留“已修改”状态
+            if generation == tab.edit_generation:
+                tab.editor.document().setModified(False)
+                tab.is_modified = False
+                tab.loaded_bytes = state["size"] if compression is None else None
+            else:
+                tab.loaded_bytes = None
+            # 磁盘上现在是自己刚写入的内容，之后的变化才算外部修改
+            tab.disk_state = state
+            tab.disk_digest = digest
+            self._sync_disk_watch()
+            self._sync_highlighter(tab)
+        self._add_to_recent(path)
+        self._refresh(tab)
+        self.save_finished.emit(True)
+        if tab.save_again:
+            tab.save_again = False
+            if serial == tab.doc_serial and tab in self._tabs:
+                self.file_save(tab)
+
+    def _on_save_failed(self, tab: DocumentTab, task: BackgroundTask, exc: Exception,
+                        journal: Optional[AutosaveJournal]) -> None:
+        task.args = ()
+        if journal is not None:
+            journal.release()
+        tab.save_task = None
+        tab.save_again = False
+        tab.last_save_ok = False
+        self._refresh(tab)
+        self.save_finished.emit(False)
+        QtWidgets.QMessageBox.critical(self, "错误", f"保存文件失败：\n{exc}")
+
+    def _wait_for_save(self, tab: DocumentTab) -> bool:
+        # 等待进行中的保存完成；期间继续处理绘制等事件但不接受用户输入
+        while tab.save_task is not None:
+            loop = QtCore.QEventLoop()
+            self.save_finished.connect(loop.quit)
+            loop.exec_(QtCore.QEventLoop.ExcludeUserInputEvents)
+            self.save_finished.disconnect(loop.quit)
+        return tab.last_save_ok
+
+    @profiled("编辑：修改计数与查找失效")
+    def _on_contents_changed(self, tab: DocumentTab) -> None:
+        tab.edit_generation += 1
+        if tab is self._search_tab or (tab is self._tab and self._search_timer.isActive()):
+            # 位置已经失效，清掉旧结果，停止输入后再重新查找
+            self._schedule_search()
+
+    # 查找与替换
+    def show_find_bar(self, replace: bool = False) -> None:
+        if self._tab.large_view is not None:
+            return
+        bar = self.find_bar
+        bar.set_replace_visible(replace)
+        selected = self.text_edit.textCursor().selectedText()
+        bar.find_edit.blockSignals(True)
+        if selected and "\u2029" not in selected:
+            bar.find_edit.setText(selected)
+        bar.find_edit.blockSignals(False)
+        bar.setVisible(True)
+        bar.find_edit.setFocus()
+        bar.find_edit.selectAll()
+        self._restart_search()
+
+    def hide_find_bar(self) -> None:
+        self.find_bar.setVisible(False)
+        self._clear_search()
+        self._search_key = None
+        self._search_pending_step = 0
+        if self._tab is not None:
+            self.text_edit.setFocus()
+
+    def show_find_in_files(self) -> None:
+        panel = self._find_in_files
+        if panel is None:
+            panel = self._find_in_files = FindInFilesPanel(self)
+            panel.open_requested.connect(self._open_find_in_files_result)
+            self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, panel)
+        if not panel.dir_edit.text():
+            panel.dir_edit.setText(str(self._tab.path.parent if self._tab.path else Path.home()))
+        selected = self.text_edit.textCursor().selectedText()
+        if selected and "\u2029" not in selected:
+            panel.pattern_edit.setText(selected)
+        panel.show()
+        panel.raise_()
+        panel.pattern_edit.setFocus()
+        panel.pattern_edit.selectAll()
+
+    def _open_find_in_files_result(self, path: str, line: int) -> None:
+        self.open_file(Path(path), line)
+        if self._tab.large_view is not None:
+            self._tab.large_view.setFocus()
+        else:
+            self.text_edit.setFocus()
+
+    def _clear_search(self) -> None:
+        self._search_timer.stop()
+        if self._search_thread is not None:
+            self._search_thread.cancel()
+            self._search_thread = None
+        if self._search_tab is not None and self._search_tab in self._tabs:
+            self._search_tab.editor.setExtraSelections([])
+        self._search_tab = None
+        self._search_complete = False
+        self._match_starts = array("Q")
+        self._match_lengths = array("Q")
+
+    def _schedule_search(self) -> None:
+        self._clear_search()
+        if not self.find_bar.isVisible():
+            return
+        if self._tab.editor.document().characterCount() > FIND_LIVE_MAX_CHARS:
+            self.find_bar.count_label.setText("按回车查找")
+            return
+        self._search_timer.start()
+
+    def _restart_search(self) -> None:
+        self._clear_search()
+        tab = self._tab
+        opts = self.find_bar.options() if self.find_bar.isVisible() else None
+        if opts is None or tab is None or tab.large_view is not None or tab.loader is not None:
+            self.find_bar.count_label.setText("")
+            self._search_pending_step = 0
+            return
+        try:
+            pattern = compile_search(opts)
+        except re.error as exc:
+            self.find_bar.count_label.setText(f"正则表达式错误：{exc}")
+            self._search_pending_step = 0
+            return
+        thread = SearchThread(tab.text_snapshot(), pattern, search_spans_lines(opts), self)
+        thread.found.connect(lambda starts, lengths, th=thread: self._on_search_found(th, starts, lengths))
+        thread.finished.connect(lambda th=thread: self._on_search_finished(th))
+        thread.finished.connect(thread.deleteLater)
+        self._search_thread = thread
+        self._search_tab = tab
+        self._search_key = (tab, tab.edit_generation, opts)
+        self.find_bar.count_label.setText("正在查找…")
+        thread.start()
+
+    def _on_search_found(self, thread: SearchThread, starts: array, lengths: array) -> None:
+        if thread is not self._search_thread:
+            return
+        self._match_starts.extend(starts)
+        self._match_lengths.extend(lengths)
+        self.find_bar.count_label.setText(f"{len(self._match_starts)} 个匹配…")
+        self._highlight_timer.start()
+        if self._search_pending_step:
+            self._find_step(self._search_pending_step)
+
+    def _on_search_finished(self, thread: SearchThread) -> None:
+        if thread is not self._search_thread:
+            return
+        self._search_thread = None
+        self._search_complete = True
+        n = len(self._match_starts)
+        self.find_bar.count_label.setText(f"{n} 个匹配" if n else "未找到")
+        self._highlight_timer.start()
+        if self._search_pending_step:
+            self._find_step(self._search_pending_step)
+
+    @profiled("查找：高亮可见匹配")
+    def _update_highlights(self) -> None:
+        tab = self._search_tab
+        if tab is None or tab is not self._tab:
+            return
+        editor = tab.editor
+        first = editor.firstVisibleBlock().position()
+        vp = editor.viewport()
+        last = editor.cursorForPosition(QtCore.QPoint(vp.width() - 1, vp.height() - 1)).block()
+        end = last.position() + last.length()
+        starts = self._match_starts
+        lengths = self._match_lengths
+        i = bisect.bisect_left(starts, first)
+        j = min(bisect.bisect_right(starts, end), i + FIND_HIGHLIGHT_LIMIT)
+        doc = editor.document()
+        selections = []
+        for k in range(i, j):
+            cursor = QtGui.QTextCursor(doc)
+            cursor.setPosition(starts[k])
+            cursor.setPosition(starts[k] + lengths[k], QtGui.QTextCursor.KeepAnchor)
+            sel = QtWidgets.QTextEdit.ExtraSelection()
+            sel.format = self._match_format
+            sel.cursor = cursor
+            selections.append(sel)
+        editor.setExtraSelections(selections)
+
+    def _find_step(self, step: int) -> None:
+        tab = self._tab
+        if tab.large_view is not None:
+            return
+        if not self.find_bar.isVisible():
+            self.show_find_bar(self.find_bar.replace_edit.isVisible())
+        opts = self.find_bar.options()
+        if opts is None:
+            return
+        if self._search_key != (tab, tab.edit_generation, opts) or self._search_tab is not tab:
+            # 结果已过期：重新查找，找到后再跳转
+            self._restart_search()
+            if self._search_thread is not None:
+                self._search_pending_step = step
+            return
+        self._search_pending_step = 0
+        starts = self._match_starts
+        cursor = tab.editor.textCursor()
+        if step > 0:
+            i = bisect.bisect_left(starts, cursor.selectionEnd())
+            if i >= len(starts):
+                if not self._search_complete:
+                    self._search_pending_step = step
+                    return
+                i = 0
+        else:
+            i = bisect.bisect_left(starts, cursor.selectionStart()) - 1
+            if i < 0:
+                if not self._search_complete:
+                    self._search_pending_step = step
+                    return
+                i = len(starts) - 1
+        if not starts:
+            self.find_bar.count_label.setText("未找到")
+            return
+        self._select_match(i)
+
+    def _select_match(self, i: int) -> None:
+        editor = self._tab.editor
+        start = self._match_starts[i]
+        cursor = QtGui.QTextCursor(editor.document())
+        cursor.setPosition(start)
+        cursor.setPosition(start + self._match_lengths[i], QtGui.QTextCursor.KeepAnchor)
+        editor.setTextCursor(cursor)
+        editor.ensureCursorVisible()
+        more = "" if self._search_complete else "+"
+        self.find_bar.count_label.setText(f"第 {i + 1} / {len(self._match_starts)}{more} 个")
+
+    def replace_current(self) -> None:
+        tab = self._tab
+        opts = self.find_bar.options()
+        if opts is None or tab.large_view is not None or tab.editor.isReadOnly():
+            return
+        cursor = tab.editor.textCursor()
+        s, e = cursor.selectionStart(), cursor.selectionEnd()
+        i = bisect.bisect_left(self._match_starts, s)
+        current = (self._search_key == (tab, tab.edit_generation, opts) and cursor.hasSelection()
+                   and i < len(self._match_starts) and self._match_starts[i] == s and self._match_lengths[i] == e - s)
+        if not current:
+            # 当前没有选中匹配：先跳到下一个，再按一次才替换
+            self._find_step(1)
+            return
+        replacement = self.find_bar.replace_edit.text()
+        if opts.regex:
+            # 只取匹配所在的几行作为上下文来展开 \1、\g<name> 等引用
+            doc = tab.editor.document()
+            first = doc.findBlock(s)
+            last = doc.findBlock(e)
+            ctx_cursor = QtGui.QTextCursor(doc)
+            ctx_cursor.setPosition(first.position())
+            ctx_cursor.setPosition(last.position() + last.length() - 1, QtGui.QTextCursor.KeepAnchor)
+            ctx = ctx_cursor.selectedText().replace("\u2029", "\n")
+            m = compile_search(opts).match(ctx, _utf16_to_index(ctx, s - first.position()))
+            if m is None or m.end() != _utf16_to_index(ctx, e - first.position()):
+                self._find_step(1)
+                return
+            try:
+                replacement = m.expand(replacement)
+            except re.error as exc:
+                self.find_bar.count_label.setText(f"替换模板错误：{exc}")
+                return
+        cursor.insertText(replacement)
+        self._find_step(1)
+
+    def replace_all(self) -> None:
+        tab = self._tab
+        opts = self.find_bar.options()
+        # 跟随、长行模式等只读状态下不替换，与 replace_current 一致；重新加载求差异期间也不替换
+        if (opts is None or tab.large_view is not None or tab.loader is not None or tab.editor.isReadOnly()
+                or tab.reload_task is not None or self._replace_task is not None):
+            return
+        try:
+            pattern = compile_search(opts)
+        except re.error as exc:
+            self.find_bar.count_label.setText(f"正则表达式错误：{exc}")
+            return
+        args = (pattern, self.find_bar.replace_edit.text(), opts.regex, search_spans_lines(opts))
+        self._start_replace_all(tab, args, tab.editor.isReadOnly())
+
+    def _start_replace_all(self, tab: DocumentTab, args: tuple, read_only: bool) -> None:
+        # 替换在后台计算，期间编辑器只读，结束后恢复原来的只读状态。只读挡不住撤销等通过接口的改动，
+        # 所以记下开始时的序号和编辑计数，结果回来时对不上就作废或按当前内容重新计算
+        tab.editor.setReadOnly(True)
+        serial = tab.doc_serial
+        generation = tab.edit_generation
+        task = BackgroundTask(replace_all_text, tab.text_snapshot(), *args, parent=self)
+        task.succeeded.connect(
+            lambda result, t=task: self._on_replace_all_finished(tab, t, serial, generation, args, read_only, result))
+        task.failed.connect(lambda exc, t=task: self._on_replace_all_failed(tab, t, serial, read_only, exc))
+        task.finished.connect(task.deleteLater)
+        self._replace_task = task
+        self.find_bar.count_label.setText("正在替换…")
+        task.start()
+
+    def _on_replace_all_finished(self, tab: DocumentTab, task: BackgroundTask, serial: int, generation: int,
+                                 args: tuple, read_only: bool, result) -> None:
+        task.args = ()
+        self._replace_task = None
+        if tab not in self._tabs:
+            return
+        if serial != tab.doc_serial:
+            # 文档已被重新加载或回收：结果作废，只读状态由新的加载过程决定
+            self.find_bar.count_label.setText("")
+            return
+        if generation != tab.edit_generation:
+            # 计算期间文档被撤销或按外部修改更新过：结果的位置已失效，按当前内容重新计算
+            self._start_replace_all(tab, args, read_only)
+            return
+        tab.editor.setReadOnly(read_only)
+        # 替换期间推迟的外部修改检查
+        QtCore.QTimer.singleShot(0, lambda t=tab: t in self._tabs and self._check_disk_change(t))
+        if result is None:
+            self.find_bar.count_label.setText("未找到")
+            return
+        start, end, text, count = result
+        # 所有替换合成一次插入：只产生一个撤销步骤，版面也只重排一次。
+        # 插入的文本已经在手里，直接记入日志和片段表，不必再从文档里读回
+        journal, buffer = tab.journal, tab.buffer
+        tab.journal = tab.buffer = None
+        cursor = QtGui.QTextCursor(tab.editor.document())
+        cursor.beginEditBlock()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+        cursor.insertText(text)
+        cursor.endEditBlock()
+        tab.journal, tab.buffer = journal, buffer
+        self._mirror_edit(tab, start, end - start, text)
+        self.status.showMessage(f"已替换 {count} 处", 5000)
+
+    def _on_replace_all_failed(self, tab: DocumentTab, task: BackgroundTask, serial: int, read_only: bool,
+                               exc: Exception) -> None:
+        task.args = ()
+        self._replace_task = None
+        if tab in self._tabs and serial == tab.doc_serial:
+            tab.editor.setReadOnly(read_only)
+        self.find_bar.count_label.setText("")
+        QtWidgets.QMessageBox.critical(self, "错误", f"替换失败：\n{exc}")
+
+    # 崩溃恢复日志
+    def _start_journal(self, tab: DocumentTab, path: Optional[Path], encoding: str, base: dict, base_size: int) -> None:
+        self._stop_journal(tab)
+        tab.journal = AutosaveJournal(self._journal_writer, path, encoding, base, base_size)
+
+    def _stop_journal(self, tab: DocumentTab) -> None:
+        if tab.journal is not None:
+            tab.journal.discard()
+            tab.journal = None
+
+    @profiled("编辑：同步日志与片段表")
+    def _on_contents_change(self, tab: DocumentTab, pos: int, removed: int, added: int) -> None:
+        doc = tab.editor.document()
+        # 改动涉及文档末尾时 Qt 会把最后的段落分隔符也算进去（空文档上甚至只报删除），
+        # 所以插入长度按文档末尾截断，删除长度由改动前后的文档长度推出
+        end = doc.characterCount() - 1
+        old_end = tab.doc_length
+        tab.doc_length = end
+        if (tab.journal is None and tab.buffer is None) or tab.loader is not None:
+            return
+        added = min(added, end - pos)
+        removed = added + old_end - end
+        text = ""
+        if added > 0:
+            cursor = QtGui.QTextCursor(doc)
+            cursor.setPosition(pos)
+            cursor.setPosition(pos + added, QtGui.QTextCursor.KeepAnchor)
+            text = cursor.selectedText().replace("\u2029", "\n")
+        if removed > 0 or text:
+            self._mirror_edit(tab, pos, max(0, removed), text)
+
+    def _mirror_edit(self, tab: DocumentTab, pos: int, removed: int, text: str) -> None:
+        if tab.journal is not None:
+            tab.journal.record(pos, removed, text)
+        if tab.buffer is not None:
+            try:
+                tab.buffer.replace(pos, removed, text)
+            except ValueError as exc:
+                print("_mirror_edit error:", exc, file=sys.stderr)
+                tab.buffer = None
+            self._check_buffer(tab)
+
+    def toggle_syntax_highlight(self, checked: bool) -> None:
+        self.config.syntax_highlight = checked
+        self.config_store.mark_dirty()
+        for tab in self._tabs:
+            self._sync_highlighter(tab)
+
+    def toggle_long_lines(self, checked: bool) -> None:
+        tab = self._tab
+        if checked == tab.long_line_mode or tab.path is None:
+            return
+        # 长行模式是只读分页视图，切换时从文件重新读取
+        if checked and not self._maybe_save(tab):
+            self._sync_tab_ui()
+            return
+        tab.long_lines = checked
+        tab.cursor_pos = tab.scroll_value = 0
+        self._load_tab(tab)
+
+    def _sync_highlighter(self, tab: DocumentTab) -> None:
+        # 按设置和文件类型挂上或去掉语法高亮；加载中、分页视图和超过大小上限的文档不高亮
+        kept = tab.loaded and tab.loader is None and tab.large_view is None
+        language = language_for_path(tab.path) if kept and self.config.syntax_highlight else None
+        doc = tab.editor.document()
+        if language is not None and doc.characterCount() > self.config.highlight_max_mb * 1024 * 1024:
+            language = None
+        current = tab.highlighter
+        if current is not None and current.language is language:
+            return
+        if current is not None:
+            # 文档内容保留时要逐段去掉格式；马上清空或替换的文档不必
+            current.detach(kept)
+            tab.highlighter = None
+        if language is not None:
+            tab.highlighter = SyntaxHighlighter(tab.editor, language)
+
+    def _check_buffer(self, tab: DocumentTab) -> None:
+        # 长度和段落数都是 O(1) 的；对不上（例如文件里有 Qt 当作分段符的字符）就停用镜像，
+        # 之后的后台任务退回 toPlainText()，直到重新加载
+        buffer = tab.buffer
+        if buffer is None:
+            return
+        doc = tab.editor.document()
+        if buffer.units != doc.characterCount() - 1 or buffer.newlines + 1 != doc.blockCount():
+            print("_check_buffer: piece buffer out of sync, falling back to toPlainText", file=sys.stderr)
+            tab.buffer = None
+
+    def offer_recovery(self) -> None:
+        # 启动时检查上次异常退出留下的日志，每份恢复的内容放在单独的标签页里
+        for jf, header, lock in find_orphan_journals():
+            name = header.get("path") or "未命名"
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(jf.stat().st_mtime))
+            reply = QtWidgets.QMessageBox.question(
+                self,
+                "恢复未保存的内容",
+                f"发现上次未正常退出时的未保存内容：\n{name}\n（最后修改于 {when}）\n\n是否恢复？",
+                QtWidgets.QMessageBox.StandardButton.Yes | QtWidgets.QMessageBox.StandardButton.No,
+                QtWidgets.QMessageBox.StandardButton.Yes,
+            )
+            if reply == QtWidgets.QMessageBox.StandardButton.Yes:
+                try:
+                    header, text = replay_journal(jf)
+                except JournalBaseChanged:
+                    QtWidgets.QMessageBox.warning(self, "无法恢复", f"原文件已被修改，无法恢复：\n{name}")
+                except Exception as exc:
+                    print("offer_recovery error:", exc, file=sys.stderr)
+                    QtWidgets.QMessageBox.critical(self, "错误", f"恢复失败：\n{exc}")
+                else:
+                    self._restore_recovered(header, text)
+            remove_journal(jf, header)
+            lock.unlock()
+
+    def _restore_recovered(self, header: dict, text: str) -> None:
+        path = Path(header["path"]) if header.get("path") else None
+        encoding = header.get("encoding") or self.config.encoding
+        tab = self._tab if self._tab is not None and self._tab.is_pristine() else None
+        if tab is None and path is not None:
+            # 会话里已有同一文件的标签时直接在该标签中恢复，避免同一文件出现两个标签
+            existing = self._find_tab(path)
+            if existing is not None and not existing.is_modified and existing.save_task is None:
+                tab = existing
+        if tab is None:
+            tab = self._new_tab(None, encoding)
+        else:
+            self._activate_tab(tab)
+        self._cancel_load(tab)
+        self._close_large_file(tab)
+        self._stop_journal(tab)
+        tab.doc_serial += 1
+        tab.editor.setPlainText(text)
+        tab.path = path
+        tab.encoding = encoding
+        tab.confidence = None
+        tab.compression = file_compression(path) if path is not None else None
+        tab.loaded = True
+        tab.cursor_pos = tab.scroll_value = 0
+        self._start_journal(tab, path, encoding, {"kind": "empty"}, 0)
+        tab.journal.rebase_to_text(text)
+        tab.editor.document().setModified(True)
+        tab.is_modified = True
+        self._sync_highlighter(tab)
+        self._refresh(tab)
+
+    def file_save(self, tab: Optional[DocumentTab] = None) -> bool:
+        tab = tab or self._tab
+        if tab.path is None:
+            return self.file_save_as(tab)
+        if tab.save_task is None and self._disk_changed(tab) is not None:
+            reply = QtWidgets.QMessageBox.warning(
+                self,
+                "文件已被修改",
+                f"{tab.path} 已被其他程序修改。\n\n保存会覆盖其他程序写入的内容，仍要保存吗？",
+                QtWidgets.QMessageBox.StandardButton.Save | QtWidgets.QMessageBox.StandardButton.Cancel,
+                QtWidgets.QMessageBox.StandardButton.Cancel,
+            )
+            if reply != QtWidgets.QMessageBox.StandardButton.Save:
                 return False
-    def file_save(self) -> bool:
-        if self._current_file is None:
-            return self.file_save_as()
-        text = self.text_edit.toPlainText()
-        enc = self._current_encoding or self.config.encoding
-        success = self._write_file(self._current_file, text, enc)
-        if success:
-            self.text_edit.document().setModified(False)
-            self._is_modified = False
-            self._update_title()
-            self._update_status()
-            self._add_to_recent(self._current_file)
-        return success
-    def file_save_as(self) -> bool:
-        path_str, _ = QtWidgets.QFileDialog.getSaveFileName(self, "另存为", str(Path.home() / "untitled.txt"), FILE_FILTER)
+        enc = tab.encoding or self.config.encoding
+        return self._write_file(tab, tab.path, enc, tab.compression)
+    def file_save_as(self, tab: Optional[DocumentTab] = None) -> bool:
+        tab = tab or self._tab
+        default = tab.path or Path.home() / "untitled.txt"
+        path_str, _ = QtWidgets.QFileDialog.getSaveFileName(self, "另存为", str(default), FILE_FILTER)
         if not path_str:
             return False
         path = Path(path_str)
         enc, ok = QtWidgets.QInputDialog.getItem(self, "选择编码", "编码：", FALLBACK_ENCODINGS, editable=True)
         if not ok or not enc:
-            enc = self._current_encoding or self.config.encoding
-        text = self.text_edit.toPlainText()
-        success = self._write_file(path, text, enc)
-        if success:
-            self._current_file = path
-            self._current_encoding = enc
-            self.text_edit.document().setModified(False)
-            self._is_modified = False
-            self._add_to_recent(path)
-            self._update_title()
-            self._update_status()
-        return success
+            enc = tab.encoding or self.config.encoding
+        # 另存为其他文件时按扩展名决定是否压缩
+        compression = tab.compression if path == tab.path else compression_for_path(path)
+        return self._write_file(tab, path, enc, compression)
 
     def closeEvent(self, event: QtGui.QCloseEvent) -> None:
-        if self._maybe_save():
-            save_config(self.config)
-            event.accept()
-        else:
-            event.ignore()
+        # 先记录会话，询问保存时会切换当前标签
+        self._record_session()
+        self._closing = True
+        for tab in list(self._tabs):
+            self._wait_for_save(tab)
+            if tab.is_modified:
+                self._activate_tab(tab)
+                if not self._maybe_save(tab):
+                    self._closing = False
+                    event.ignore()
+                    return
+        self._disk_timer.stop()
+        if self._replace_task is not None:
+            self._replace_task.wait()
+        if self._find_in_files is not None:
+            self._find_in_files.stop(wait=True)
+        search = self._search_thread
+        self._clear_search()
+        if search is not None:
+            search.wait()
+        # 关闭过程中切换当前标签不应触发加载
+        self.tab_widget.blockSignals(True)
+        for tab in list(self._tabs):
+            self._dispose_tab(tab)
+        self._journal_writer.stop()
+        self.config_store.flush()
+        event.accept()
+
+    def show_diagnostics(self) -> None:
+        # 非模态，可以一边编辑一边看计时
+        if self._diagnostics is None:
+            self._diagnostics = DiagnosticsDialog(self)
+        self._diagnostics.show()
+        self._diagnostics.raise_()
+        self._diagnostics.activateWindow()
 
     def _show_about_dialog(self) -> None:
         QtWidgets.QMessageBox.information(self, "关于", f"{APP_NAME}\n稳定版修复若干崩溃点。")
@@ -386,7 +4084,11 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
     def _apply_config_to_widgets(self) -> None:
         try:
             font = QtGui.QFont(self.config.font_family, max(6, int(self.config.font_size)))
-            self.text_edit.setFont(font)
+            for tab in self._tabs:
+                tab.editor.setFont(font)
+                if tab.large_view is not None:
+                    tab.large_view.setFont(font)
+                    tab.large_view.update_range()
         except Exception as exc:
             print("_apply_config_to_widgets setFont error:", exc, file=sys.stderr)
         try:
@@ -407,9 +4109,9 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
         except Exception as exc:
             print("increase_font_size parse error:", exc, file=sys.stderr)
             self.config.font_size = 14
-        # 直接生效并保存
+        # 直接生效，稍后合并写盘
         self._apply_config_to_widgets()
-        save_config(self.config)
+        self.config_store.mark_dirty()
 
     def decrease_font_size(self) -> None:
         try:
@@ -419,7 +4121,7 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
             v = 13
         self.config.font_size = max(6, v)
         self._apply_config_to_widgets()
-        save_config(self.config)
+        self.config_store.mark_dirty()
 
     def choose_font_dialog(self) -> None:
         font, ok = QtWidgets.QFontDialog.getFont(QtGui.QFont(self.config.font_family, self.config.font_size), self, "选择字体")
@@ -433,14 +4135,14 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
             except Exception as exc:
                 print("choose_font_dialog error:", exc, file=sys.stderr)
             self._apply_config_to_widgets()
-            save_config(self.config)
+            self.config_store.mark_dirty()
     # 直接应用字体修改（不静默忽略异常）
     def _on_font_family_changed(self, qfont: QtGui.QFont) -> None:
         try:
             if qfont and qfont.family():
                 self.config.font_family = qfont.family()
                 self._apply_config_to_widgets()
-                save_config(self.config)
+                self.config_store.mark_dirty()
         except Exception as exc:
             print("_on_font_family_changed error:", exc, file=sys.stderr)
     def _on_font_size_changed(self, txt: str) -> None:
@@ -449,7 +4151,7 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
             if size >= 6 and size <= 200:
                 self.config.font_size = size
                 self._apply_config_to_widgets()
-                save_config(self.config)
+                self.config_store.mark_dirty()
         except Exception as exc:
             print("_on_font_size_changed error:", exc, file=sys.stderr)
     def toggle_theme(self) -> None:
@@ -461,29 +4163,45 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
                 QtWidgets.QApplication.setPalette(QtGui.QPalette())
         except Exception as exc:
             print("toggle_theme error:", exc, file=sys.stderr)
-        save_config(self.config)
+        self.config_store.mark_dirty()
     def choose_encoding_dialog(self) -> None:
         enc, ok = QtWidgets.QInputDialog.getItem(self, "选择默认编码", "默认编码：", FALLBACK_ENCODINGS, editable=True)
         if ok and enc:
             self.config.encoding = enc
-            self._current_encoding = enc
-            save_config(self.config)
+            self._tab.encoding = enc
+            self._tab.confidence = None
+            self.config_store.mark_dirty()
             self._update_status()
-    def _maybe_save(self) -> bool:
-        if not self._is_modified:
+    def _maybe_save(self, tab: DocumentTab) -> bool:
+        if not tab.is_modified:
             return True
         reply = QtWidgets.QMessageBox.question(
             self,
             "保存更改",
-            "文档已修改，是否保存更改？",
+            f"文档“{tab.display_name}”已修改，是否保存更改？",
             QtWidgets.QMessageBox.StandardButton.Save | QtWidgets.QMessageBox.StandardButton.Discard | QtWidgets.QMessageBox.StandardButton.Cancel,
             QtWidgets.QMessageBox.StandardButton.Save,
         )
         if reply == QtWidgets.QMessageBox.StandardButton.Save:
-            return self.file_save()
+            return self.file_save(tab) and self._wait_for_save(tab)
         if reply == QtWidgets.QMessageBox.StandardButton.Discard:
             return True
         return False
+    # 切回窗口时检查当前文件是否被其他程序改过
+    def changeEvent(self, event: QtCore.QEvent) -> None:
+        super().changeEvent(event)
+        if event.type() == QtCore.QEvent.ActivationChange and self.isActiveWindow() and self._tab is not None:
+            QtCore.QTimer.singleShot(0, lambda t=self._tab: t is self._tab and self._check_disk_change(t))
+    # 单实例：其他进程转交过来的文件
+    def open_from_instance(self, files: List[str]) -> None:
+        for name in files:
+            path = Path(name)
+            if path.is_file():
+                self.open_file(path)
+        self.setWindowState(self.windowState() & ~QtCore.Qt.WindowMinimized)
+        self.show()
+        self.raise_()
+        self.activateWindow()
     # 拖放
     def dragEnterEvent(self, e):
         try:
@@ -496,26 +4214,219 @@ class NotepadMainWindow(QtWidgets.QMainWindow):
             urls = e.mimeData().urls()
             if not urls:
                 return
-            path = Path(urls[0].toLocalFile())
-            if path.exists():
-                if not self._maybe_save():
-                    return
-                self._load_file_with_encoding(path, try_auto=True)
+            for url in urls:
+                path = Path(url.toLocalFile())
+                if path.is_file():
+                    self.open_file(path)
         except Exception as exc:
             print("dropEvent error:", exc, file=sys.stderr)
+class InstanceServer(QtCore.QObject):
+    files_received = QtCore.pyqtSignal(list)
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(parent)
+        self._network = None
+        self._server = None
+
+    def listen(self) -> bool:
+        # QtNetwork 只有服务端用到：导入和创建 QLocalServer 都放在这里，在首次绘制之后的 startup_finished 里执行
+        if self._server is None:
+            from PyQt5 import QtNetwork
+            self._network = QtNetwork
+            self._server = QtNetwork.QLocalServer(self)
+            self._server.setSocketOptions(QtNetwork.QLocalServer.UserAccessOption)
+            self._server.newConnection.connect(self._on_new_connection)
+        name = instance_server_name()
+        if self._server.listen(name):
+            return True
+        # 监听失败：若已有实例在运行就让出，否则是上次异常退出留下的套接字，删掉后重试
+        probe = self._network.QLocalSocket()
+        probe.connectToServer(name)
+        if probe.waitForConnected(200):
+            probe.abort()
+            return False
+        self._network.QLocalServer.removeServer(name)
+        if self._server.listen(name):
+            return True
+        print("InstanceServer listen error:", self._server.errorString(), file=sys.stderr)
+        return False
+
+    def _on_new_connection(self) -> None:
+        while self._server.hasPendingConnections():
+            conn = self._server.nextPendingConnection()
+            buf = bytearray()
+            conn.readyRead.connect(lambda c=conn, b=buf: self._on_ready_read(c, b))
+            conn.disconnected.connect(conn.deleteLater)
+
+    def _on_ready_read(self, conn, buf: bytearray) -> None:
+        buf += bytes(conn.readAll())
+        if b"\n" not in buf:
+            if len(buf) > 1024 * 1024:
+                conn.abort()
+            return
+        try:
+            files = json.loads(bytes(buf).split(b"\n", 1)[0].decode("utf-8"))["files"]
+            files = [str(f) for f in files]
+        except (ValueError, KeyError, TypeError) as exc:
+            print("InstanceServer message error:", exc, file=sys.stderr)
+            conn.abort()
+            return
+        buf.clear()
+        conn.write(b"ok\n")
+        conn.flush()
+        conn.disconnectFromServer()
+        self.files_received.emit(files)
+
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    # “帮助 → 性能诊断”：开关运行时计时，按总耗时列出各操作；窗口显示期间每半秒刷新一次
+    COLUMNS = ["操作", "次数", "总计 ms", "平均 ms", "p50 ms", "p99 ms", "最大 ms"]
+    KEYS = ["name", "count", "total_ms", "mean_ms", "p50_ms", "p99_ms", "max_ms"]
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("性能诊断")
+        self.resize(760, 420)
+        self.enable_box = QtWidgets.QCheckBox("记录各操作耗时（也可在启动前设置环境变量 NOTEPAD_PROFILE=1）", self)
+        self.enable_box.setChecked(PROFILER.enabled)
+        self.enable_box.toggled.connect(self._set_enabled)
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        clear = QtWidgets.QPushButton("清空", self)
+        clear.clicked.connect(self._clear)
+        copy = QtWidgets.QPushButton("复制 JSON", self)
+        copy.clicked.connect(self._copy_json)
+        close = QtWidgets.QPushButton("关闭", self)
+        close.clicked.connect(self.close)
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addStretch(1)
+        buttons.addWidget(clear)
+        buttons.addWidget(copy)
+        buttons.addWidget(close)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.enable_box)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(500)
+        self._timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event: QtGui.QShowEvent) -> None:
+        super().showEvent(event)
+        self.enable_box.setChecked(PROFILER.enabled)
+        self.refresh()
+        self._timer.start()
+
+    def hideEvent(self, event: QtGui.QHideEvent) -> None:
+        self._timer.stop()
+        super().hideEvent(event)
+
+    def _set_enabled(self, on: bool) -> None:
+        PROFILER.enabled = on
+
+    def _clear(self) -> None:
+        PROFILER.reset()
+        self.refresh()
+
+    def _copy_json(self) -> None:
+        QtWidgets.QApplication.clipboard().setText(json.dumps(PROFILER.summary(), ensure_ascii=False, indent=2))
+
+    def refresh(self) -> None:
+        rows = PROFILER.summary()
+        self.table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, key in enumerate(self.KEYS):
+                value = row[key]
+                item = QtWidgets.QTableWidgetItem(value if c == 0 else str(value) if c == 1 else f"{value:.2f}")
+                if c:
+                    item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(r, c, item)
+
+
+# --startup-timing：记录各阶段耗时，等待的阶段都结束后输出到 stderr
+class StartupTiming:
+    def __init__(self, start: float) -> None:
+        self._start = start
+        self._last = start
+        self._phases: List[Tuple[str, float, float]] = []
+        self._expected: Set[str] = set()
+        self._reported = False
+
+    def mark(self, phase: str) -> None:
+        if any(name == phase for name, _, _ in self._phases):
+            return
+        now = time.perf_counter()
+        self._phases.append((phase, now - self._last, now - self._start))
+        self._last = now
+        self._maybe_report()
+
+    def expect(self, *phases: str) -> None:
+        self._expected.update(phases)
+        self._maybe_report()
+
+    def _maybe_report(self) -> None:
+        done = {name for name, _, _ in self._phases}
+        if self._reported or not self._expected or not self._expected <= done:
+            return
+        self._reported = True
+        print("启动耗时（阶段 / 本阶段 / 累计）：", file=sys.stderr)
+        for name, delta, total in self._phases:
+            print(f"{delta * 1000:>10.1f} ms{total * 1000:>10.1f} ms  {name}", file=sys.stderr)
+
+
 def main(argv: Optional[list] = None) -> int:
     if argv is None:
         argv = sys.argv
+    parser = argparse.ArgumentParser(prog=Path(argv[0]).name if argv else "notepad", description=APP_NAME)
+    parser.add_argument("files", nargs="*", help="要打开的文件")
+    parser.add_argument("--startup-timing", action="store_true", help="输出启动各阶段的耗时（总是启动新实例）")
+    parser.add_argument("--new-instance", action="store_true", help="不把文件交给已在运行的窗口，启动新实例")
+    # Qt 选项的取值先分出来，否则会被当作要打开的文件
+    qt_args, rest = split_qt_args(argv[1:])
+    args, unknown = parser.parse_known_args(rest)
+    qt_args += unknown
+    timing = StartupTiming(_STARTUP_T0) if args.startup_timing else None
+    if timing is not None:
+        timing.mark("导入")
+    files = []
+    for name in args.files:
+        path = Path(name).expanduser().resolve()
+        if path.is_file():
+            files.append(path)
+        else:
+            print("main: file not found:", name, file=sys.stderr)
     QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
     QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps, True)
     cfg = load_config()
-    app = QtWidgets.QApplication(argv)
+    if timing is not None:
+        timing.mark("读取配置")
+    app = QtWidgets.QApplication(argv[:1] + qt_args)
     try:
         app.setFont(QtGui.QFont(cfg.font_family, cfg.font_size))
     except Exception as exc:
         print("app.setFont error:", exc, file=sys.stderr)
-    main_win = NotepadMainWindow(cfg)
+    if timing is not None:
+        timing.mark("QApplication")
+    main_win = NotepadMainWindow(cfg, files, timing)
     main_win.show()
+    if timing is not None:
+        timing.mark("构建窗口")
+        timing.expect("首次绘制", "延迟界面")
+        if main_win._tab.loader is not None:
+            timing.expect("文件首屏", "文件加载")
+        elif main_win._tab.path is not None:
+            timing.expect("文件加载")
+    # 恢复提示是模态对话框，等主窗口画出来、其余界面补建完再弹出
+    main_win.startup_finished.connect(main_win.offer_recovery)
+    if not args.new_instance:
+        server = InstanceServer(main_win)
+        server.files_received.connect(main_win.open_from_instance)
+        main_win.startup_finished.connect(server.listen)
     try:
         return app.exec_()
     except Exception as exc:
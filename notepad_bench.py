@@ -0,0 +1,826 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 简单记事本性能基准：python notepad_bench.py encoding --size-mb 300
+# 整体回归：python notepad_bench.py suite --output base.json，改动后再跑一次 new.json，
+# 用 python notepad_bench.py compare base.json new.json 对比
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+
+import notepad
+import notepad_io
+
+LINES = {
+    "utf-8": "第{0}行 mixed 中文 and ASCII text, 日志内容 value={0}\n",
+    "gb18030": "第{0}行 国标编码的中文日志内容，数值={0}\n",
+    "latin-1": "ligne {0}: café crème à la carte, déjà vu, naïve façade\n",
+    # 以 ASCII 为主、只在末尾出现中文的 GB18030 日志：旧方法要把整份文件按 UTF-8 解码失败后再重来
+    "gb18030-late": "2024-01-01 12:00:00 INFO request id={0} status=200 elapsed=12ms\n",
+}
+
+
+def generate_file(path: Path, encoding: str, size_mb: int) -> None:
+    target = size_mb * 1024 * 1024
+    template = LINES[encoding]
+    codec = encoding.split("-late")[0]
+    written = 0
+    i = 0
+    with path.open("wb") as f:
+        while written < target:
+            block = "".join(template.format(i + k) for k in range(10000)).encode(codec)
+            f.write(block)
+            written += len(block)
+            i += 10000
+        if codec != encoding:
+            f.write("末尾的中文内容\n".encode(codec))
+
+
+# 改动前的做法：每个候选编码都完整读取并解码一遍
+def legacy_read(path: Path):
+    for e in notepad_io.FALLBACK_ENCODINGS:
+        try:
+            with path.open("r", encoding=e, errors="strict") as f:
+                return f.read(), e
+        except Exception:
+            pass
+    with path.open("r", encoding="latin-1", errors="replace") as f:
+        return f.read(), "latin-1"
+
+
+def detected_read(path: Path):
+    # 与 FileLoadThread 相同：样本之后出现非法字节时，此前全是 ASCII 就地换编码，否则从头重读。
+    # 加载线程把解码出的块逐个交给界面追加，不拼接全文，这里也只数字符
+    with path.open("rb") as f:
+        sample = f.read(notepad_io.ENCODING_SAMPLE_SIZE)
+        candidates, confidence = notepad_io.detect_encoding(sample, len(sample) < notepad_io.ENCODING_SAMPLE_SIZE)
+        start = 0
+        while start < len(candidates):
+            decoder = notepad_io.FallbackDecoder(candidates[start:])
+            try:
+                chunks = notepad_io.decode_chunks(notepad_io.iter_byte_chunks(f, sample), decoder)
+                chars = sum(len(t) for t, _ in chunks)
+                return chars, decoder.encoding, confidence / 2 ** decoder.index
+            except UnicodeDecodeError:
+                f.seek(0)
+                sample = b""
+                start += decoder.index + 1
+                confidence /= 2 ** (decoder.index + 1)
+    raise IOError("无法读取文件")
+
+
+def timed(fn, *args):
+    t = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t, result
+
+
+def bench_encoding(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'编码':<10}{'大小MB':>8}{'旧方法s':>10}{'新方法s':>10}{'加速':>8}  结果")
+        for enc in args.encodings:
+            path = Path(tmp) / f"{enc}.txt"
+            generate_file(path, enc, args.size_mb)
+            size = path.stat().st_size / (1024 * 1024)
+            t_old, (text_old, enc_old) = timed(legacy_read, path)
+            chars_old = len(text_old)
+            del text_old
+            t_new, (chars_new, enc_new, conf) = timed(detected_read, path)
+            assert chars_new == chars_old, "解码结果长度不一致"
+            print(f"{enc:<10}{size:>8.0f}{t_old:>10.2f}{t_new:>10.2f}{t_old / t_new:>7.1f}x  {enc_old} -> {enc_new} ({conf:.0%})")
+            path.unlink()
+
+
+def qt_app():
+    # 基准在无界面环境下运行
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def make_document(text: str):
+    from PyQt5 import QtGui, QtWidgets
+    doc = QtGui.QTextDocument()
+    doc.setDocumentLayout(QtWidgets.QPlainTextDocumentLayout(doc))
+    doc.setPlainText(text)
+    return doc
+
+
+# 改动前的保存：整份 toPlainText() 后一次性编码写入（先截断目标文件）
+def legacy_save(doc, path: Path, encoding: str) -> None:
+    text = doc.toPlainText()
+    with path.open("w", encoding=encoding, newline="\n", errors="strict") as f:
+        f.write(text)
+
+
+# 现在的保存：界面线程取片段表的 O(1) 快照（与 DocumentTab.text_snapshot 相同），后台线程按片段逐块编码，
+# 原子写入后再算摘要（与 save_text_file 相同），全程不复制全文
+def snapshot_save(buf, path: Path, encoding: str) -> None:
+    notepad_io.save_text_file(path, buf.snapshot(), encoding)
+
+
+def mirror_buffer(text: str):
+    # 与加载时一样按批追加到片段表
+    import notepad_buffer
+    buf = notepad_buffer.PieceBuffer()
+    for i in range(0, len(text), notepad.LOAD_BATCH_CHARS):
+        buf.append(text[i:i + notepad.LOAD_BATCH_CHARS])
+    return buf
+
+
+def traced(fn, *args):
+    tracemalloc.start()
+    t = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_save(args) -> None:
+    app = qt_app()  # noqa: F841  保持引用，否则 QApplication 会被回收
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'编码':<10}{'大小MB':>8}{'旧方法s':>10}{'旧峰值MB':>10}{'新方法s':>10}{'新峰值MB':>10}")
+        for enc in args.encodings:
+            src = Path(tmp) / "src.txt"
+            generate_file(src, enc, args.size_mb)
+            codec = enc.split("-late")[0]
+            text = src.read_text(encoding=codec)
+            doc = make_document(text)
+            buf = mirror_buffer(text)
+            del text
+            src.unlink()
+            size = doc.characterCount() / (1024 * 1024)
+            out = Path(tmp) / "out.txt"
+            t_old, peak_old = traced(legacy_save, doc, out, codec)
+            old_bytes = out.read_bytes()
+            t_new, peak_new = traced(snapshot_save, buf, out, codec)
+            assert out.read_bytes() == old_bytes, "保存结果不一致"
+            del old_bytes
+            out.unlink()
+            mb = 1024 * 1024
+            print(f"{enc:<10}{size:>8.0f}{t_old:>10.2f}{peak_old / mb:>10.1f}{t_new:>10.2f}{peak_new / mb:>10.1f}")
+
+
+# 击键序列：连续输入字符，穿插换行、退格和上下移动光标
+def keystroke_sequence(count: int):
+    from PyQt5 import QtCore
+    keys = []
+    for i in range(count):
+        if i % 40 == 39:
+            keys.append(QtCore.Qt.Key_Return)
+        elif i % 17 == 16:
+            keys.append(QtCore.Qt.Key_Backspace)
+        elif i % 29 == 28:
+            keys.append(QtCore.Qt.Key_Down if i % 2 else QtCore.Qt.Key_Up)
+        else:
+            keys.append(QtCore.Qt.Key_A + i % 26)
+    return keys
+
+
+def drive_keys(app, editor, keys):
+    from PyQt5.QtTest import QTest
+    # 预热：首次击键要完成可见区域的布局，不计入结果
+    for key in keys[:20]:
+        QTest.keyClick(editor, key)
+        app.processEvents()
+    samples = []
+    for key in keys:
+        t = time.perf_counter()
+        QTest.keyClick(editor, key)
+        app.processEvents()
+        samples.append(time.perf_counter() - t)
+    # 收尾：让还在等待的合并刷新也计入总时间
+    t = time.perf_counter()
+    time.sleep(notepad.UI_UPDATE_INTERVAL_MS / 1000)
+    app.processEvents()
+    samples[-1] += time.perf_counter() - t
+    return samples
+
+
+def latency_row(name: str, samples) -> str:
+    ordered = sorted(samples)
+    us = 1e6
+    p50 = ordered[len(ordered) // 2] * us
+    p99 = ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * us
+    mean = sum(samples) / len(samples) * us
+    return f"{name:<14}{mean:>10.0f}{p50:>10.0f}{p99:>10.0f}{ordered[-1] * us:>12.0f}"
+
+
+def bench_keystroke(args) -> None:
+    import threading
+    from PyQt5 import QtGui, QtWidgets
+    app = qt_app()
+    text = "".join(LINES["utf-8"].format(i) for i in range(args.lines))
+    keys = keystroke_sequence(args.keys)
+    interval = notepad.UI_UPDATE_INTERVAL_MS
+    print(f"{args.lines} 行，{len(keys)} 次击键，光标位于文档中部（微秒/击键）")
+    print(f"{'方式':<14}{'平均':>10}{'p50':>10}{'p99':>10}{'最大':>12}")
+    # 基线：不接任何信号的裸编辑器
+    editor = QtWidgets.QPlainTextEdit()
+    editor.resize(1000, 700)
+    editor.show()
+    editor.setPlainText(text)
+    editor.setTextCursor(QtGui.QTextCursor(editor.document().findBlockByNumber(args.lines // 2)))
+    print(latency_row("裸编辑器", drive_keys(app, editor, keys)))
+    editor.deleteLater()
+    del editor
+    with tempfile.TemporaryDirectory() as tmp:
+        # 配置和日志写到临时目录，不碰用户自己的文件
+        notepad.CFG_FILENAME = Path(tmp) / "config.json"
+        notepad.JOURNAL_DIR = Path(tmp) / "journal"
+        for name, value in (("逐次刷新", 0), ("合并刷新", interval)):
+            notepad.UI_UPDATE_INTERVAL_MS = value
+            win = notepad.NotepadMainWindow(notepad.AppConfig())
+            win.show()
+            editor = win.text_edit
+            editor.setPlainText(text)
+            editor.setTextCursor(QtGui.QTextCursor(editor.document().findBlockByNumber(args.lines // 2)))
+            # 等日志线程写完初始内容，免得它和击键争抢
+            done = threading.Event()
+            win._journal_writer.submit(done.set)
+            done.wait()
+            app.processEvents()
+            print(latency_row(name, drive_keys(app, editor, keys)))
+            editor.document().setModified(False)
+            win.close()
+            win.deleteLater()
+            app.processEvents()
+        notepad.UI_UPDATE_INTERVAL_MS = interval
+
+
+def timing_row(name: str, samples, unit: float = 1e6) -> str:
+    ordered = sorted(samples)
+    mean = sum(samples) / len(samples) * unit
+    p50 = ordered[len(ordered) // 2] * unit
+    p99 = ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * unit
+    return f"{name:<22}{mean:>12.1f}{p50:>12.1f}{p99:>12.1f}"
+
+
+def bench_buffer(args) -> None:
+    import random
+    from PyQt5 import QtGui
+    app = qt_app()  # noqa: F841  保持引用，否则 QApplication 会被回收
+    text = "".join(LINES["utf-8"].format(i) for i in range(args.lines))
+    doc = make_document(text)
+    buf = mirror_buffer(text)
+    del text
+    rng = random.Random(1)
+    print(f"{args.lines} 行，{doc.characterCount() / 1e6:.1f} M 字符，{args.edits} 次随机位置编辑（微秒）")
+    print(f"{'操作':<22}{'平均':>12}{'p50':>12}{'p99':>12}")
+    edits = []
+    length = doc.characterCount() - 1
+    for _ in range(args.edits):
+        pos = rng.randrange(length)
+        if rng.random() < 0.5:
+            edits.append((pos, 0, "x"))
+            length += 1
+        else:
+            edits.append((pos, 1, ""))
+            length -= 1
+    samples = []
+    cursor = QtGui.QTextCursor(doc)
+    for pos, removed, new in edits:
+        t = time.perf_counter()
+        cursor.setPosition(pos)
+        cursor.setPosition(pos + removed, QtGui.QTextCursor.KeepAnchor)
+        cursor.insertText(new)
+        samples.append(time.perf_counter() - t)
+    print(timing_row("QTextDocument 编辑", samples))
+    samples = []
+    for pos, removed, new in edits:
+        t = time.perf_counter()
+        buf.replace(pos, removed, new)
+        samples.append(time.perf_counter() - t)
+    print(timing_row("片段表 replace", samples))
+    # 连续输入：同一位置逐字插入，新文本并入前一个片段
+    pos = buf.units // 2
+    samples = []
+    for i in range(args.edits):
+        t = time.perf_counter()
+        buf.replace(pos + i, 0, "y")
+        samples.append(time.perf_counter() - t)
+    print(timing_row("片段表 连续输入", samples))
+    cursor.setPosition(pos)
+    cursor.insertText("y" * args.edits)
+    # 快照：每次快照之后紧跟一次编辑，写时复制的开销算在编辑里
+    snap_samples = []
+    edit_samples = []
+    for i in range(args.snapshots):
+        t = time.perf_counter()
+        snap = buf.snapshot()
+        snap_samples.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        buf.replace(i, 0, "z")
+        edit_samples.append(time.perf_counter() - t)
+        cursor.setPosition(i)
+        cursor.insertText("z")
+    print(timing_row("片段表 snapshot", snap_samples))
+    print(timing_row("快照后首次编辑", edit_samples))
+    samples = []
+    for _ in range(args.snapshots):
+        t = time.perf_counter()
+        plain = doc.toPlainText()
+        samples.append(time.perf_counter() - t)
+        del plain
+    print(timing_row("toPlainText", samples))
+    snap = buf.snapshot()
+    pieces = sum(len(b) for b in snap._blocks)
+    samples = []
+    for _ in range(args.snapshots):
+        t = time.perf_counter()
+        joined = snap.text()
+        samples.append(time.perf_counter() - t)
+    print(timing_row("快照拼接全文", samples))
+    t = time.perf_counter()
+    streamed = sum(len(chunk) for chunk in snap.iter_chunks())
+    print(timing_row("快照逐块遍历", [time.perf_counter() - t]))
+    samples = []
+    for _ in range(1000):
+        line = rng.randrange(snap.line_count)
+        t = time.perf_counter()
+        snap.line_start(line)
+        samples.append(time.perf_counter() - t)
+    print(timing_row("快照 line_start", samples))
+    assert joined == doc.toPlainText() and streamed == len(joined), "片段表与文档内容不一致"
+    print(f"片段 {pieces} 个，块 {len(snap._blocks)} 个；内容与 toPlainText() 一致")
+
+
+def json_lines(count: int) -> str:
+    # 类 JSON 的文本，每一千行夹一段三行的块注释，让跨行状态参与进来
+    lines = []
+    for i in range(count):
+        if i % 1000 == 500:
+            lines.append("/* 注释开始")
+        elif i % 1000 == 502:
+            lines.append("注释结束 */")
+        else:
+            lines.append(f'  "key{i}": "value {i}", "n": {i}, "ok": true, "x": null,')
+    return "\n".join(lines) + "\n"
+
+
+def scroll_frames(app, editor, positions, bar=None):
+    # 每帧：滚动到下一个位置，处理挂起的事件（按需高亮在这里运行），再同步重绘视口
+    bar = bar or editor.verticalScrollBar()
+    samples = []
+    for value in positions:
+        t = time.perf_counter()
+        bar.setValue(value)
+        app.processEvents()
+        editor.viewport().repaint()
+        samples.append(time.perf_counter() - t)
+    return samples
+
+
+def bench_highlight(args) -> None:
+    import random
+    from PyQt5 import QtGui, QtWidgets
+    app = qt_app()
+    language = notepad.language_for_path(Path("x.json"))
+    formats = notepad.SyntaxHighlighter.formats()
+
+    # 对照：QSyntaxHighlighter 挂上时把整份文档高亮一遍，之后每次跨行状态变化都传播到底
+    class FullHighlighter(QtGui.QSyntaxHighlighter):
+        def highlightBlock(self, text: str) -> None:
+            spans, state = language.highlight(text, max(self.previousBlockState(), 0))
+            for start, end, kind in spans:
+                self.setFormat(start, end - start, formats[kind])
+            self.setCurrentBlockState(state)
+
+    text = json_lines(args.lines)
+    rng = random.Random(1)
+    keys = keystroke_sequence(args.keys)
+    print(f"{args.lines} 行 JSON，{args.frames} 帧逐页滚动，{args.jumps} 次随机跳转，{len(keys)} 次击键（毫秒）")
+    print(f"{'方式':<22}{'平均':>12}{'p50':>12}{'p99':>12}")
+    for name in ("关闭", "按需高亮", "QSyntaxHighlighter"):
+        if name == "QSyntaxHighlighter" and args.skip_full:
+            continue
+        editor = QtWidgets.QPlainTextEdit()
+        editor.resize(1000, 700)
+        editor.show()
+        editor.setPlainText(text)
+        app.processEvents()
+        t = time.perf_counter()
+        if name == "按需高亮":
+            highlighter = notepad.SyntaxHighlighter(editor, language)  # noqa: F841  保持引用，否则高亮器会被回收
+        elif name == "QSyntaxHighlighter":
+            highlighter = FullHighlighter(editor.document())  # noqa: F841  保持引用，否则高亮器会被回收
+        app.processEvents()
+        attach = time.perf_counter() - t
+        bar = editor.verticalScrollBar()
+        page = bar.pageStep()
+        pages = [min(bar.maximum(), (k + 1) * page) for k in range(args.frames)]
+        jumps = [rng.randrange(bar.maximum() + 1) for _ in range(args.jumps)]
+        print(timing_row(f"{name} 滚动", scroll_frames(app, editor, pages), 1e3))
+        print(timing_row(f"{name} 跳转", scroll_frames(app, editor, jumps), 1e3))
+        editor.setTextCursor(QtGui.QTextCursor(editor.document().findBlockByNumber(args.lines // 2)))
+        print(timing_row(f"{name} 击键", drive_keys(app, editor, keys), 1e3))
+        # 在顶部插入注释开头：跨行状态一直变到下一个注释结尾
+        cursor = QtGui.QTextCursor(editor.document().findBlockByNumber(1))
+        bar.setValue(0)
+        app.processEvents()
+        t = time.perf_counter()
+        cursor.insertText("/* ")
+        app.processEvents()
+        editor.viewport().repaint()
+        reopen = time.perf_counter() - t
+        print(f"{'':<4}挂上 {attach * 1000:.1f} ms，顶部插入注释开头 {reopen * 1000:.1f} ms")
+        if name != "关闭":
+            del highlighter
+        editor.deleteLater()
+        app.processEvents()
+
+
+def single_line_json(size_mb: int) -> str:
+    # 压缩成一行的 JSON 导出，夹带中文
+    target = size_mb * 1024 * 1024
+    parts = []
+    n = 0
+    i = 0
+    while n < target:
+        item = f'{{"id":{i},"name":"用户{i}","tags":["a","b"],"score":{i * 7 % 1000}.5}}'
+        parts.append(item)
+        n += len(item.encode("utf-8")) + 1
+        i += 1
+    return "[" + ",".join(parts) + "]\n"
+
+
+def cursor_moves(app, widget, keys):
+    from PyQt5.QtTest import QTest
+    # 每次移动都同步重绘，计入排版和绘制
+    samples = []
+    for key in keys:
+        t = time.perf_counter()
+        QTest.keyClick(widget, key)
+        app.processEvents()
+        widget.viewport().repaint()
+        samples.append(time.perf_counter() - t)
+    return samples
+
+
+def bench_longline(args) -> None:
+    import mmap
+    from PyQt5 import QtCore, QtWidgets
+    app = qt_app()
+    keys = [QtCore.Qt.Key_Right] * args.keys
+    print(f"单行 JSON，{args.keys} 次右移光标（毫秒）；编辑器为原来的自动折行 QPlainTextEdit，长行模式为分页视图")
+    print(f"{'方式':<22}{'平均':>12}{'p50':>12}{'p99':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes_mb:
+            text = single_line_json(size)
+            path = Path(tmp) / f"line{size}.json"
+            path.write_text(text, encoding="utf-8")
+            if size <= args.editor_max_mb:
+                editor = QtWidgets.QPlainTextEdit()
+                editor.setLineWrapMode(QtWidgets.QPlainTextEdit.WidgetWidth)
+                editor.resize(1000, 700)
+                editor.show()
+                t = time.perf_counter()
+                editor.setPlainText(text)
+                app.processEvents()
+                editor.viewport().repaint()
+                opened = time.perf_counter() - t
+                end, home = cursor_moves(app, editor, [QtCore.Qt.Key_End, QtCore.Qt.Key_Home])
+                print(timing_row(f"{size} MB 编辑器", cursor_moves(app, editor, keys), 1e3))
+                print(f"{'':<4}打开并首屏 {opened * 1000:.0f} ms，End {end * 1000:.1f} ms，Home {home * 1000:.1f} ms")
+                editor.deleteLater()
+                del editor
+                app.processEvents()
+            else:
+                print(f"{size} MB 编辑器：跳过（超过 --editor-max-mb）")
+            with path.open("rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                t = time.perf_counter()
+                index = notepad.LineIndex(mm, len(mm))
+                index.build(lambda: False)
+                view = notepad.LargeFileView(index, "utf-8")
+                view.resize(1000, 700)
+                view.show()
+                app.processEvents()
+                view.viewport().repaint()
+                opened = time.perf_counter() - t
+                end, home = cursor_moves(app, view, [QtCore.Qt.Key_End, QtCore.Qt.Key_Home])
+                print(timing_row(f"{size} MB 长行模式", cursor_moves(app, view, keys), 1e3))
+                print(f"{'':<4}打开并首屏 {opened * 1000:.0f} ms，End {end * 1000:.1f} ms，Home {home * 1000:.1f} ms")
+                view.deleteLater()
+                del view, index
+                app.processEvents()
+                mm.close()
+
+
+# 改动前的保存：每次调整都在界面线程上直接覆盖写配置文件
+def legacy_save_config(cfg) -> None:
+    with notepad.CFG_FILENAME.open("w", encoding="utf-8") as f:
+        json.dump(asdict(cfg), f, ensure_ascii=False, indent=2)
+
+
+def bench_config(args) -> None:
+    app = qt_app()
+    from PyQt5 import QtCore
+    with tempfile.TemporaryDirectory() as tmp:
+        notepad.CFG_FILENAME = Path(tmp) / "config.json"
+        print(f"按住 Ctrl+= {args.steps} 次，每 {args.repeat_ms} ms 一次")
+        print(f"{'方式':<10}{'请求':>8}{'写盘':>8}{'跳过':>8}{'界面线程ms':>12}")
+        cfg = notepad.AppConfig()
+        busy = 0.0
+        for i in range(args.steps):
+            cfg.font_size = 10 + i % 20
+            t = time.perf_counter()
+            legacy_save_config(cfg)
+            busy += time.perf_counter() - t
+            time.sleep(args.repeat_ms / 1000)
+        print(f"{'逐次写入':<10}{args.steps:>8}{args.steps:>8}{0:>8}{busy * 1000:>12.1f}")
+        cfg = notepad.AppConfig()
+        store = notepad.ConfigStore(cfg)
+        busy = 0.0
+        # 模拟连续两轮调整：中间停顿超过防抖间隔，最后一轮结束后退出
+        for round_ in range(2):
+            for i in range(args.steps // 2):
+                cfg.font_size = 10 + (i + round_) % 20
+                t = time.perf_counter()
+                store.mark_dirty()
+                app.processEvents()
+                busy += time.perf_counter() - t
+                time.sleep(args.repeat_ms / 1000)
+            if round_ == 0:
+                deadline = time.perf_counter() + notepad.CONFIG_SAVE_DELAY_MS / 1000 + 0.2
+                while time.perf_counter() < deadline:
+                    t = time.perf_counter()
+                    app.processEvents(QtCore.QEventLoop.AllEvents, 50)
+                    busy += time.perf_counter() - t
+                    time.sleep(0.01)
+        t = time.perf_counter()
+        store.flush()
+        # 退出时再次刷新：内容没变，应当跳过
+        store.flush()
+        busy += time.perf_counter() - t
+        print(f"{'合并写入':<10}{store.requests:>8}{store.flushes:>8}{store.skipped:>8}{busy * 1000:>12.1f}")
+
+
+# 整体回归套件：每种语料在单独的子进程里通过主窗口打开、滚动、输入和保存，峰值内存互不干扰
+SUITE_CASES = {
+    "utf-8": "UTF-8 中英混排日志",
+    "gb18030": "GB18030 中文日志",
+    "many-lines": "大量短行",
+    "huge-line": "单行 JSON（长行模式）",
+}
+
+
+def write_corpus(case: str, path: Path, size_mb: float) -> None:
+    if case in ("utf-8", "gb18030"):
+        generate_file(path, case, size_mb)
+    elif case == "many-lines":
+        target = size_mb * 1024 * 1024
+        written = 0
+        i = 0
+        with path.open("wb") as f:
+            while written < target:
+                block = "".join(f"{i + k:08d} ok\n" for k in range(10000)).encode("ascii")
+                f.write(block)
+                written += len(block)
+                i += 10000
+    else:
+        path.write_text(single_line_json(size_mb), encoding="utf-8")
+
+
+def count_lines(path: Path) -> int:
+    with path.open("rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1024 * 1024), b""))
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows 没有 resource 模块
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 计，macOS 以字节计
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def stats_ms(samples) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def run_case(args) -> dict:
+    from PyQt5 import QtCore, QtGui
+    app = qt_app()
+    notepad.PROFILER.enabled = args.profile
+    path = Path(args.path)
+    result = {"case": args.case}
+    with tempfile.TemporaryDirectory() as tmp:
+        notepad.CFG_FILENAME = Path(tmp) / "config.json"
+        notepad.JOURNAL_DIR = Path(tmp) / "journal"
+        win = notepad.NotepadMainWindow(notepad.AppConfig())
+        win.resize(1000, 700)
+        win.show()
+        app.processEvents()
+        # 打开：首屏为编辑器有了第一批内容或分页视图已建好并画出来；完成为加载线程或行索引结束
+        t = time.perf_counter()
+        win.open_file(path)
+        tab = win._tab
+        first_screen = None
+        while True:
+            if first_screen is None and (tab.large_view is not None or not tab.editor.document().isEmpty()):
+                tab.page.currentWidget().repaint()
+                first_screen = time.perf_counter() - t
+            index_thread = tab.large_index_thread
+            if tab.loader is None and tab.loaded and (index_thread is None or index_thread.isFinished()):
+                break
+            app.processEvents(QtCore.QEventLoop.WaitForMoreEvents)
+        app.processEvents()
+        opened = time.perf_counter() - t
+        mode = "long-line" if tab.long_line_mode else "large" if tab.large_view is not None else "editor"
+        result["mode"] = mode
+        result["open"] = {"first_screen_ms": (first_screen or opened) * 1000, "total_ms": opened * 1000}
+        if tab.large_view is None:
+            editor = tab.editor
+            bar = editor.verticalScrollBar()
+            page = bar.pageStep()
+            pages = [min(bar.maximum(), (k + 1) * page) for k in range(args.frames)]
+            result["scroll"] = stats_ms(scroll_frames(app, editor, pages))
+            editor.setTextCursor(QtGui.QTextCursor(editor.document().findBlockByNumber(editor.blockCount() // 2)))
+            result["typing"] = stats_ms(drive_keys(app, editor, keystroke_sequence(args.keys)))
+            t = time.perf_counter()
+            win.file_save(tab)
+            ui = time.perf_counter() - t
+            ok = win._wait_for_save(tab)
+            result["save"] = {"ui_ms": ui * 1000, "total_ms": (time.perf_counter() - t) * 1000, "ok": ok}
+        else:
+            # 分页视图只读：长行模式横向滚动，大文件纵向滚动；输入换成移动光标
+            view = tab.large_view
+            bar = view.horizontalScrollBar() if tab.long_line_mode else view.verticalScrollBar()
+            page = bar.pageStep()
+            pages = [min(bar.maximum(), (k + 1) * page) for k in range(args.frames)]
+            result["scroll"] = stats_ms(scroll_frames(app, view, pages, bar))
+            key = QtCore.Qt.Key_Right if tab.long_line_mode else QtCore.Qt.Key_Down
+            result["cursor"] = stats_ms(cursor_moves(app, view, [key] * args.keys))
+            result["save"] = None
+        result["peak_rss_mb"] = peak_rss_mb()
+        if args.profile:
+            result["profile"] = notepad.PROFILER.summary()
+        tab.editor.document().setModified(False)
+        tab.is_modified = False
+        win.close()
+        win.deleteLater()
+        app.processEvents()
+    return result
+
+
+def bench_suite(args) -> int:
+    if args.case:
+        # 子进程：只跑一种语料，结果作为最后一行输出
+        print(json.dumps(run_case(args), ensure_ascii=False))
+        return 0
+    from PyQt5 import QtCore
+    cases = []
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in args.cases:
+            path = Path(tmp) / f"{case}.txt"
+            print(f"{SUITE_CASES[case]}：生成 {args.size_mb:g} MB ...", file=sys.stderr)
+            write_corpus(case, path, args.size_mb)
+            info = {"file_mb": path.stat().st_size / (1024 * 1024), "lines": count_lines(path)}
+            cmd = [sys.executable, os.path.abspath(__file__), "suite", "--case", case, "--path", str(path),
+                   "--keys", str(args.keys), "--frames", str(args.frames)]
+            if args.profile:
+                cmd.append("--profile")
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+            path.unlink()
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode or not lines:
+                failed = True
+                cases.append({"case": case, **info, "error": f"子进程退出码 {proc.returncode}"})
+                print(f"{SUITE_CASES[case]}：失败（退出码 {proc.returncode}）", file=sys.stderr)
+                continue
+            result = json.loads(lines[-1])
+            cases.append({"case": case, **info, **result})
+            print(f"{SUITE_CASES[case]}：打开 {result['open']['total_ms']:.0f} ms，"
+                  f"峰值内存 {result['peak_rss_mb'] or 0:.0f} MB", file=sys.stderr)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "qt": QtCore.QT_VERSION_STR,
+        "pyqt": QtCore.PYQT_VERSION_STR,
+        "platform": platform.platform(),
+        "args": {"size_mb": args.size_mb, "keys": args.keys, "frames": args.frames, "profile": args.profile},
+        "cases": cases,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 1 if failed else 0
+
+
+def flatten_metrics(value, prefix: str = ""):
+    # 只取耗时（*_ms）和峰值内存，越小越好；profile 列表按操作名展开
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten_metrics(item, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict) and "name" in item:
+                yield from flatten_metrics({k: v for k, v in item.items() if k != "name"}, f"{prefix}.{item['name']}")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if prefix.endswith("_ms") or prefix.endswith("peak_rss_mb"):
+            yield prefix, value
+
+
+def bench_compare(args) -> int:
+    base, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (args.base, args.new))
+    base_cases = {c["case"]: c for c in base["cases"]}
+    print(f"{'指标':<48}{'基准':>12}{'本次':>12}{'变化':>10}")
+    regressions = 0
+    for case in new["cases"]:
+        old = base_cases.get(case["case"])
+        if old is None:
+            continue
+        old_metrics = dict(flatten_metrics(old, case["case"]))
+        for name, value in flatten_metrics(case, case["case"]):
+            if name not in old_metrics:
+                continue
+            before = old_metrics[name]
+            change = (value - before) / before if before else 0.0
+            # 绝对差很小的不算回退，免得零点几毫秒的抖动刷屏
+            worse = change > args.threshold and value - before > args.min_delta
+            regressions += worse
+            print(f"{name:<48}{before:>12.2f}{value:>12.2f}{change:>+9.1%}{'  回退' if worse else ''}")
+    print(f"{regressions} 项回退（阈值 {args.threshold:.0%}）")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="简单记事本性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("encoding", help="编码探测与加载：旧的多次完整解码 vs 单次探测")
+    p.add_argument("--size-mb", type=int, default=300)
+    p.add_argument("--encodings", nargs="+", default=list(LINES))
+    p.set_defaults(func=bench_encoding)
+    p = sub.add_parser("save", help="保存：toPlainText() 后整份编码写入 vs 片段表快照逐块编码原子写入")
+    p.add_argument("--size-mb", type=int, default=100)
+    p.add_argument("--encodings", nargs="+", default=["utf-8", "gb18030"])
+    p.set_defaults(func=bench_save)
+    p = sub.add_parser("keystroke", help="击键延迟：标题/状态栏逐次刷新 vs 合并刷新")
+    p.add_argument("--lines", type=int, default=1000000)
+    p.add_argument("--keys", type=int, default=2000)
+    p.set_defaults(func=bench_keystroke)
+    p = sub.add_parser("config", help="配置保存：每次调整都写盘 vs 防抖合并后原子写入")
+    p.add_argument("--steps", type=int, default=100)
+    p.add_argument("--repeat-ms", type=int, default=30)
+    p.set_defaults(func=bench_config)
+    p = sub.add_parser("buffer", help="片段表：编辑、快照和读取的开销 vs toPlainText()")
+    p.add_argument("--lines", type=int, default=1000000)
+    p.add_argument("--edits", type=int, default=5000)
+    p.add_argument("--snapshots", type=int, default=20)
+    p.set_defaults(func=bench_buffer)
+    p = sub.add_parser("highlight", help="语法高亮：滚动帧耗时，关闭 vs 按需高亮 vs QSyntaxHighlighter 全量高亮")
+    p.add_argument("--lines", type=int, default=200000)
+    p.add_argument("--frames", type=int, default=200)
+    p.add_argument("--jumps", type=int, default=50)
+    p.add_argument("--keys", type=int, default=500)
+    p.add_argument("--skip-full", action="store_true", help="不测 QSyntaxHighlighter（大文档上挂上就要很久）")
+    p.set_defaults(func=bench_highlight)
+    p = sub.add_parser("longline", help="超长单行文件：自动折行的编辑器 vs 长行模式的分页视图")
+    p.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--keys", type=int, default=200)
+    p.add_argument("--editor-max-mb", type=int, default=4, help="更大的文件不测编辑器（折行排版可能要几分钟）")
+    p.set_defaults(func=bench_longline)
+    p = sub.add_parser("suite", help="整体回归：各种语料的打开、滚动、输入、保存耗时和峰值内存，输出 JSON")
+    p.add_argument("--size-mb", type=float, default=20)
+    p.add_argument("--cases", nargs="+", choices=list(SUITE_CASES), default=list(SUITE_CASES))
+    p.add_argument("--keys", type=int, default=300)
+    p.add_argument("--frames", type=int, default=100)
+    p.add_argument("--profile", action="store_true", help="同时打开运行时计时，结果附带各操作的耗时分布")
+    p.add_argument("--output", help="写入这个文件，默认输出到标准输出")
+    p.add_argument("--case", help=argparse.SUPPRESS)
+    p.add_argument("--path", help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_suite)
+    p = sub.add_parser("compare", help="对比两次 suite 的结果，有回退时退出码为 1")
+    p.add_argument("base")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.1, help="变慢超过这个比例算回退")
+    p.add_argument("--min-delta", type=float, default=1.0, help="绝对差小于这个值（毫秒或 MB）不算回退")
+    p.set_defaults(func=bench_compare)
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
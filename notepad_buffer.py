@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 文档内容的片段表（piece table）镜像，不依赖 PyQt5。界面线程把 QTextDocument 的每次改动
+# (位置, 删除长度, 插入文本) 同步过来；保存、查找等后台任务拿 O(1) 的只读快照按块或按行读取，
+# 不必再用 toPlainText() 在界面线程上复制全文。位置和长度都以 UTF-16 单元计，与 Qt 一致
+import bisect
+import itertools
+import re
+from typing import Iterator, List, Optional, Tuple
+
+# 每个块最多容纳的片段数；一次编辑只重建受影响的一两个块
+BLOCK_PIECES = 64
+# 连续输入时新文本并入前一个插入片段，直到这么多字符，避免每次击键都多出一个片段
+ADD_PIECE_CHARS = 4096
+# 大段插入（加载、粘贴）按这个长度切成多个片段，都引用同一个源字符串；拆分片段时数换行的开销就有了上限
+PIECE_CHARS = 64 * 1024
+_ASTRAL_RE = re.compile("[\U00010000-\U0010ffff]")
+
+# 片段：(源字符串, 起点, 终点, UTF-16 长度, 换行数)。源字符串不可变，可被多个片段和快照共享
+Piece = Tuple[str, int, int, int, int]
+
+
+def utf16_length(text: str, start: int = 0, end: Optional[int] = None) -> int:
+    if end is None:
+        end = len(text)
+    # BMP 以外的字符在 UTF-16 中占两个单位；isascii 是 O(1) 的
+    if text.isascii():
+        return end - start
+    return end - start + len(_ASTRAL_RE.findall(text, start, end))
+
+
+def _unit_index(piece: Piece, k: int) -> int:
+    # 片段内第 k 个 UTF-16 单元对应的源字符串下标
+    src, s, e, u, _ = piece
+    if u == e - s:
+        return s + k
+    idx = s
+    units = 0
+    for m in _ASTRAL_RE.finditer(src, s, e):
+        p = m.start()
+        if units + (p - idx) >= k:
+            return idx + (k - units)
+        units += p - idx + 2
+        idx = p + 1
+        if units == k:
+            return idx
+        if units > k:
+            # Qt 允许把光标放在代理对中间，片段表表示不了半个字符，由调用方停用镜像
+            raise ValueError("position splits a surrogate pair")
+    return idx + (k - units)
+
+
+def make_pieces(text: str) -> List[Piece]:
+    pieces = []
+    for i in range(0, len(text), PIECE_CHARS):
+        j = min(len(text), i + PIECE_CHARS)
+        pieces.append((text, i, j, utf16_length(text, i, j), text.count("\n", i, j)))
+    return pieces
+
+
+def _split(piece: Piece, k: int) -> Tuple[Piece, Piece]:
+    src, s, e, u, nl = piece
+    i = _unit_index(piece, k)
+    # 换行只数较短的一侧
+    if i - s <= e - i:
+        head_nl = src.count("\n", s, i)
+    else:
+        head_nl = nl - src.count("\n", i, e)
+    return (src, s, i, k, head_nl), (src, i, e, u - k, nl - head_nl)
+
+
+class PieceBuffer:
+    # 片段按块存放，块是不可变的元组；拍快照后的第一次编辑先复制块列表（写时复制），
+    # 之后直到下一次快照都原地修改，所以快照本身是 O(1)
+    def __init__(self) -> None:
+        self._blocks: List[Tuple[Piece, ...]] = []
+        self._units: List[int] = []
+        self._lines: List[int] = []
+        self._shared = False
+        # 编辑大多集中在光标附近，从上次编辑的块开始找
+        self._hint = 0
+        self._hint_start = 0
+        self.units = 0
+        self.newlines = 0
+
+    def append(self, text: str) -> None:
+        self.replace(self.units, 0, text)
+
+    def _locate(self, pos: int) -> Tuple[int, int]:
+        # 返回包含 pos 的块及其起点；恰好落在块边界时取前一块的末尾，便于与前面的片段合并
+        i, start = self._hint, self._hint_start
+        if i >= len(self._blocks):
+            i, start = 0, 0
+        while i > 0 and pos <= start:
+            i -= 1
+            start -= self._units[i]
+        while i < len(self._blocks) - 1 and pos > start + self._units[i]:
+            start += self._units[i]
+            i += 1
+        return i, start
+
+    def replace(self, pos: int, removed: int, text: str) -> None:
+        if pos < 0 or removed < 0 or pos + removed > self.units:
+            raise ValueError(f"replace out of range: {pos}+{removed} > {self.units}")
+        if not removed and not text:
+            return
+        if self._shared:
+            self._blocks = list(self._blocks)
+            self._units = list(self._units)
+            self._lines = list(self._lines)
+            self._shared = False
+        new = make_pieces(text)
+        added = sum(p[3] for p in new)
+        added_nl = sum(p[4] for p in new)
+        if not self._blocks:
+            self._blocks = [tuple(new[i:i + BLOCK_PIECES]) for i in range(0, len(new), BLOCK_PIECES)]
+            self._units = [sum(p[3] for p in b) for b in self._blocks]
+            self._lines = [sum(p[4] for p in b) for b in self._blocks]
+            self._hint, self._hint_start = 0, 0
+            self.units, self.newlines = added, added_nl
+            return
+        bi, start = self._locate(pos)
+        end = pos + removed
+        bj, start_j = bi, start
+        while bj < len(self._blocks) - 1 and end > start_j + self._units[bj]:
+            start_j += self._units[bj]
+            bj += 1
+        # 首尾两块拼成一个片段列表；中间的块整块删除，不必展开
+        pieces = self._blocks[bi] if bj == bi else self._blocks[bi] + self._blocks[bj]
+        skipped = start_j - start - self._units[bi] if bj > bi else 0
+        rel = pos - start
+        rel_end = end - start - skipped
+        left: List[Piece] = []
+        right: List[Piece] = []
+        cur = 0
+        for p in pieces:
+            nxt = cur + p[3]
+            if nxt <= rel:
+                left.append(p)
+            elif cur >= rel_end:
+                right.append(p)
+            else:
+                if cur < rel:
+                    left.append(_split(p, rel - cur)[0])
+                if nxt > rel_end:
+                    right.append(_split(p, rel_end - cur)[1])
+            cur = nxt
+        last = left[-1] if left else None
+        mergeable = (last is not None and len(new) == 1 and last[1] == 0 and last[2] == len(last[0])
+                     and len(last[0]) + len(text) <= ADD_PIECE_CHARS)
+        if mergeable:
+            src = last[0] + text
+            left[-1] = (src, 0, len(src), last[3] + added, last[4] + added_nl)
+        else:
+            left.extend(new)
+        merged = left + right
+        # 超出上限时平均分成几块，而不是切出一个满块加一个很小的零头
+        size = -(-len(merged) // -(-len(merged) // BLOCK_PIECES)) if merged else 1
+        blocks = [tuple(merged[i:i + size]) for i in range(0, len(merged), size)]
+        units = [sum(p[3] for p in b) for b in blocks]
+        lines = [sum(p[4] for p in b) for b in blocks]
+        self.newlines += sum(lines) - sum(self._lines[bi:bj + 1])
+        self.units += added - removed
+        self._blocks[bi:bj + 1] = blocks
+        self._units[bi:bj + 1] = units
+        self._lines[bi:bj + 1] = lines
+        if not blocks and bi > 0 and bi >= len(self._blocks):
+            bi -= 1
+            start -= self._units[bi]
+        self._hint, self._hint_start = bi, start
+
+    def snapshot(self) -> "BufferSnapshot":
+        self._shared = True
+        return BufferSnapshot(self._blocks, self._units, self._lines, self.units, self.newlines)
+
+
+class BufferSnapshot:
+    # 只读快照，可以交给任何线程；与之后的编辑互不影响
+    def __init__(self, blocks, units, lines, total_units: int, newlines: int) -> None:
+        self._blocks = blocks
+        self._units = units
+        self._lines = lines
+        self.units = total_units
+        self.newlines = newlines
+        self._unit_starts: Optional[List[int]] = None
+        self._line_starts: Optional[List[int]] = None
+
+    @property
+    def line_count(self) -> int:
+        return self.newlines + 1
+
+    def _starts(self) -> Tuple[List[int], List[int]]:
+        if self._unit_starts is None:
+            self._unit_starts = list(itertools.accumulate(self._units, initial=0))
+            self._line_starts = list(itertools.accumulate(self._lines, initial=0))
+        return self._unit_starts, self._line_starts
+
+    def iter_chunks(self, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+        # 按片段依次给出 [start, end) 范围内的文本；整段引用源字符串的片段不复制
+        end = self.units if end is None else min(end, self.units)
+        if start >= end:
+            return
+        unit_starts, _ = self._starts()
+        b = min(bisect.bisect_right(unit_starts, start) - 1, len(self._blocks) - 1)
+        cur = unit_starts[b]
+        for block in itertools.islice(self._blocks, b, None):
+            for p in block:
+                src, s, e, u, _ = p
+                if cur + u <= start:
+                    cur += u
+                    continue
+                lo = start - cur if cur < start else 0
+                hi = end - cur if cur + u > end else u
+                if lo == 0 and hi == u:
+                    yield src if s == 0 and e == len(src) else src[s:e]
+                else:
+                    yield src[_unit_index(p, lo):_unit_index(p, hi)]
+                cur += u
+                if cur >= end:
+                    return
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        return "".join(self.iter_chunks(start, end))
+
+    def line_start(self, line: int) -> int:
+        # 第 line 行（从 0 起）开头的 UTF-16 位置
+        if line <= 0:
+            return 0
+        if line > self.newlines:
+            return self.units
+        unit_starts, line_starts = self._starts()
+        b = bisect.bisect_left(line_starts, line) - 1
+        need = line - line_starts[b]
+        cur = unit_starts[b]
+        for p in self._blocks[b]:
+            src, s, e, u, nl = p
+            if nl >= need:
+                i = s - 1
+                for _ in range(need):
+                    i = src.index("\n", i + 1, e)
+                return cur + utf16_length(src, s, i + 1)
+            need -= nl
+            cur += u
+        return self.units
+
+    def iter_lines(self, first: int = 0, last: Optional[int] = None) -> Iterator[str]:
+        # 逐行给出 [first, last) 行的内容（不含换行符），只在内存里保留当前一块
+        last = self.line_count if last is None else min(last, self.line_count)
+        remaining = last - first
+        if remaining <= 0:
+            return
+        carry = ""
+        for chunk in self.iter_chunks(self.line_start(first)):
+            parts = (carry + chunk).split("\n")
+            carry = parts.pop()
+            for line in parts:
+                yield line
+                remaining -= 1
+                if not remaining:
+                    return
+        yield carry
+
+
+def snapshot_text(source) -> str:
+    # 后台任务的输入可以是字符串，也可以是快照；快照在调用方所在的线程里拼接成字符串
+    return source if isinstance(source, str) else source.text()
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 文件读写层：编码探测、压缩文件的解压与压缩、分块解码、原子写入和批量转换。不依赖 PyQt5，
+# 记事本界面和命令行批处理（notepad.py --convert）共用
+import argparse
+import bz2
+import codecs
+import concurrent.futures
+import fnmatch
+import gzip
+import hashlib
+import io
+import lzma
+import multiprocessing
+import os
+import re
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+# zstd 需要第三方模块，没有安装时只是不能打开和保存 .zst 文件
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ENCODING = "utf-8"
+FALLBACK_ENCODINGS = ["utf-8", "gb18030", "gbk", "latin-1"]
+# 后台加载：首块较小以便尽快显示第一屏，之后按大块读取
+LOAD_FIRST_CHUNK = 64 * 1024
+LOAD_CHUNK_SIZE = 1024 * 1024
+# 编码探测只看文件开头的一段样本
+ENCODING_SAMPLE_SIZE = 1024 * 1024
+# UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，必须先判断
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+# 保存时每次从文档取出、编码并写入的字符数
+SAVE_BATCH_CHARS = 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+# 批量转换：每批交给工作进程的文件数/字节数上限
+CONVERT_BATCH_FILES = 64
+CONVERT_BATCH_BYTES = 16 * 1024 * 1024
+NEWLINES = {"keep": None, "lf": "\n", "crlf": "\r\n", "cr": "\r"}
+# 压缩文件：按文件开头的魔数识别格式，另存为时按扩展名决定是否压缩
+COMPRESSION_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+COMPRESSION_MAGIC_BYTES = 6
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+GZIP_LEVEL = 6
+# 最近打开的压缩文件解压后的内容在内存里保留的总字节数
+DECOMPRESS_CACHE_MB = 256
+_CJK_RE = re.compile("[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def detect_encoding(sample: bytes, at_eof: bool, candidates: Optional[List[str]] = None) -> Tuple[List[str], float]:
+    # 单次探测：先看 BOM，再把同一份样本并行喂给各候选编码的增量解码器，
+    # 返回仍然可用的编码（按优先级，首个即选中）以及对首个编码的置信度
+    for bom, enc in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return [enc], 1.0
+    if candidates is None:
+        candidates = FALLBACK_ENCODINGS
+    decoders = [(enc, codecs.getincrementaldecoder(enc)(errors="strict")) for enc in candidates]
+    survivors = []
+    first_text = ""
+    for enc, dec in decoders:
+        try:
+            text = dec.decode(sample, final=at_eof)
+        except UnicodeDecodeError:
+            continue
+        if not survivors:
+            first_text = text
+        survivors.append(enc)
+    if not survivors:
+        return [], 0.0
+    return survivors, _encoding_confidence(survivors[0], sample, first_text)
+
+
+def is_binary_sample(sample: bytes) -> bool:
+    # 只看开头几 KB 是否有 NUL 字节；带 BOM 的 UTF-16/32 文本除外
+    for bom, _ in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return False
+    return b"\0" in sample[:BINARY_SNIFF_BYTES]
+
+
+def _encoding_confidence(encoding: str, sample: bytes, text: str) -> float:
+    if sample.isascii():
+        return 1.0
+    name = codecs.lookup(encoding).name
+    if name == "utf-8":
+        # 非 ASCII 的随机字节几乎不可能是合法 UTF-8
+        return 0.99
+    if name in ("gb18030", "gbk", "gb2312"):
+        # 非 ASCII 字符里中日韩字符和全角标点占比越高越可信；只统计开头一段即可
+        text = text[:65536]
+        non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+        cjk = len(_CJK_RE.findall(text))
+        return 0.5 + 0.45 * (cjk / non_ascii if non_ascii else 0.0)
+    return 0.3
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    for magic, fmt in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+
+def file_compression(path: Path) -> Optional[str]:
+    try:
+        with path.open("rb") as f:
+            return detect_compression(f.read(COMPRESSION_MAGIC_BYTES))
+    except OSError:
+        return None
+
+
+def compression_for_path(path: Path) -> Optional[str]:
+    return COMPRESSION_SUFFIXES.get(path.suffix.lower())
+
+
+def _zstd():
+    if zstandard is None:
+        raise OSError("读写 zstd 压缩文件需要安装 zstandard 模块")
+    return zstandard
+
+
+def decompressing_reader(f, compression: Optional[str]):
+    # 返回读取解压后内容的流；未压缩时就是 f 本身
+    if compression is None:
+        return f
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(f, "rb")
+    if compression == "xz":
+        return lzma.LZMAFile(f, "rb")
+    return _zstd().ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=False)
+
+
+def compressing_writer(f, compression: str, name: str):
+    # 关闭返回的流只写出压缩格式的结尾，不关闭 f
+    if compression == "gzip":
+        # gzip 头里记录目标文件名，而不是临时文件名
+        return gzip.GzipFile(filename=name, mode="wb", fileobj=f, compresslevel=GZIP_LEVEL)
+    if compression == "bz2":
+        return bz2.BZ2File(f, "wb")
+    if compression == "xz":
+        return lzma.LZMAFile(f, "wb")
+    return _zstd().ZstdCompressor().stream_writer(f, closefd=False)
+
+
+class RawReadCounter:
+    # 夹在压缩文件和解压流之间：记录读过的原始字节数并计算摘要，进度和外部修改检测都按磁盘上的字节算
+    def __init__(self, f) -> None:
+        self.f = f
+        self.bytes_read = 0
+        self.digest = new_digest()
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        self.digest.update(data)
+        return data
+
+    def drain(self) -> None:
+        # 解压流读到结尾时可能没读完文件末尾的填充，摘要要覆盖整个文件
+        while self.read(LOAD_CHUNK_SIZE):
+            pass
+
+
+class DecompressedCache:
+    # 最近打开的压缩文件解压后的字节及原始文件摘要；键里带文件状态，文件一变就不再命中。
+    # 超出字节预算时丢弃最久未用的。加载线程和界面线程都会访问
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self._items: "OrderedDict[tuple, Tuple[bytes, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: Path, state: dict) -> tuple:
+        return str(path), state["size"], state["mtime_ns"], state["dev"], state["ino"]
+
+    def get(self, key: tuple) -> Optional[Tuple[bytes, bytes]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key: tuple, data: bytes, digest: bytes) -> None:
+        if len(data) > self.budget:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._items[key] = (data, digest)
+            self._size += len(data)
+            while self._size > self.budget:
+                _, (dropped, _) = self._items.popitem(last=False)
+                self._size -= len(dropped)
+
+
+def iter_byte_chunks(f, prefix: bytes = b"", first_size: int = LOAD_FIRST_CHUNK, size: int = LOAD_CHUNK_SIZE):
+    # 已读入的探测样本按小块吐出（首屏更快），之后继续顺序读文件，不重复读取
+    n = first_size
+    pos = 0
+    while pos < len(prefix):
+        yield prefix[pos:pos + n]
+        pos += n
+        n = size
+    while True:
+        data = f.read(n)
+        n = size
+        if not data:
+            break
+        yield data
+
+
+class FallbackDecoder:
+    # 按候选编码的优先级增量解码。当前编码在某块遇到非法字节时，如果此前各块全是 ASCII（在各候选编码里含义相同，
+    # 已给出的文本仍然有效，解码器里也没有未完成的多字节字符），就换下一个候选编码从这一块接着解码，不必重读；
+    # 否则抛出 UnicodeDecodeError，由调用方从头重读。换行在编码之外单独转换，换编码时不会丢掉挂起的 \r
+    def __init__(self, candidates: List[str], errors: str = "strict", translate: bool = True) -> None:
+        self.candidates = candidates
+        self.index = 0
+        self.errors = errors
+        self.ascii_so_far = True
+        self._decoder = codecs.getincrementaldecoder(candidates[0])(errors=errors)
+        self._newlines = io.IncrementalNewlineDecoder(None, translate=True) if translate else None
+
+    @property
+    def encoding(self) -> str:
+        return self.candidates[self.index]
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        while True:
+            try:
+                text = self._decoder.decode(data, final)
+                break
+            except UnicodeDecodeError:
+                if not self.ascii_so_far or self.index + 1 >= len(self.candidates):
+                    raise
+                self.index += 1
+                self._decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+        if self.ascii_so_far and not data.isascii():
+            self.ascii_so_far = False
+        if self._newlines is not None:
+            text = self._newlines.decode(text, final)
+        return text
+
+
+def decode_chunks(byte_chunks, decoder: FallbackDecoder):
+    for data in byte_chunks:
+        yield decoder.decode(data), len(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail, 0
+
+
+def iter_decoded_chunks(byte_chunks, encoding: str, errors: str = "strict", translate: bool = True):
+    # 增量解码：多字节字符和 \r\n 跨块时也能正确处理，换行统一为 \n（与文本模式读取一致）；
+    # translate 为 False 时保留原有换行
+    return decode_chunks(byte_chunks, FallbackDecoder([encoding], errors, translate))
+
+
+def iter_text_chunks(text, size: int = SAVE_BATCH_CHARS):
+    # text 也可以是文档快照（见 notepad_buffer），按片段逐块取出，不拼接全文
+    if not isinstance(text, str):
+        yield from text.iter_chunks()
+        return
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def atomic_write_chunks(path: Path, chunks, encoding: str, errors: str = "strict",
+                        compression: Optional[str] = None) -> None:
+    # 先写同目录下的临时文件并 fsync，再原子替换目标文件；中途崩溃或编码失败都不会破坏原文件。
+    # compression 不为 None 时边编码边压缩
+    target = Path(os.path.realpath(path))
+    encoder = codecs.getincrementalencoder(encoding)(errors=errors)
+    fd, tmp = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=str(target.parent))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            out = f if compression is None else compressing_writer(f, compression, target.name)
+            for chunk in chunks:
+                out.write(encoder.encode(chunk))
+            out.write(encoder.encode("", final=True))
+            if out is not f:
+                out.close()
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = stat.S_IMODE(target.stat().st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp, mode)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    # 目录也要落盘，重命名才算持久化（Windows 不支持打开目录，忽略）
+    try:
+        dir_fd = os.open(str(target.parent), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def write_text_file(path: Path, text: str, encoding: str, compression: Optional[str] = None) -> str:
+    # 返回实际写入的编码：目标编码无法表示全部字符时退回 UTF-8（替换无法编码的字符）
+    try:
+        atomic_write_chunks(path, iter_text_chunks(text), encoding, compression=compression)
+        return encoding
+    except (UnicodeEncodeError, LookupError) as exc:
+        print("write_text_file primary error:", exc, file=sys.stderr)
+    atomic_write_chunks(path, iter_text_chunks(text), "utf-8", errors="replace", compression=compression)
+    return "utf-8"
+
+
+def file_fingerprint(path: Path) -> dict:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+# 外部修改检测：先比较 stat 信息，只有大小相同而时间戳或 inode 变了时才读全文件算摘要确认
+def disk_state(st: os.stat_result) -> dict:
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "dev": st.st_dev, "ino": st.st_ino}
+
+
+def new_digest():
+    return hashlib.blake2b(digest_size=16)
+
+
+def file_digest(path: Path) -> bytes:
+    h = new_digest()
+    with path.open("rb") as f:
+        for data in iter(lambda: f.read(LOAD_CHUNK_SIZE), b""):
+            h.update(data)
+    return h.digest()
+
+
+def save_text_file(path: Path, text: str, encoding: str, compression: Optional[str] = None) -> Tuple[str, dict, bytes]:
+    # 保存线程里顺便记下写入后的文件状态和摘要（压缩文件按压缩后的字节算），之后据此分辨外部修改
+    enc = write_text_file(path, text, encoding, compression)
+    st = path.stat()
+    return enc, disk_state(st), file_digest(path)
+
+
+def iter_search_files(root: Path, globs: List[str], should_stop):
+    # 遍历目录树，跳过隐藏目录，不跟随符号链接
+    stack = [str(root)]
+    while stack:
+        if should_stop():
+            return
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError as exc:
+            print("iter_search_files error:", exc, file=sys.stderr)
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and any(fnmatch.fnmatch(entry.name, g) for g in globs):
+                    yield entry.path, entry.stat(follow_symlinks=False).st_size
+            except OSError as exc:
+                print("iter_search_files entry error:", exc, file=sys.stderr)
+
+
+def _converted_chunks(f, chunks, newline: Optional[str]):
+    for text, _ in chunks:
+        yield text if newline in (None, "\n") else text.replace("\n", newline)
+    # 读完就关闭源文件：Windows 上仍打开着的文件不能被替换
+    f.close()
+
+
+def convert_file(path: str, target: str, source: Optional[str] = None,
+                 newline: Optional[str] = None) -> Tuple[str, Optional[str], int]:
+    # 返回 (状态, 源编码, 字节数)，状态为 converted/unchanged/binary。编码探测与 FileLoadThread 相同；
+    # 已经是目标编码又不改换行时只校验能否完整解码，不重写文件
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+        if source is not None:
+            candidates = [source]
+        elif is_binary_sample(sample):
+            return "binary", None, size
+        else:
+            candidates, _ = detect_encoding(sample, len(sample) < ENCODING_SAMPLE_SIZE)
+        for enc in candidates:
+            chunks = iter_decoded_chunks(iter_byte_chunks(f, sample), enc, translate=newline is not None)
+            try:
+                if newline is None and codecs.lookup(enc).name == codecs.lookup(target).name:
+                    for _ in chunks:
+                        pass
+                    return "unchanged", enc, size
+                atomic_write_chunks(Path(path), _converted_chunks(f, chunks, newline), target)
+                return "converted", enc, size
+            except UnicodeDecodeError:
+                if source is not None:
+                    raise
+                f.seek(0)
+                sample = b""
+    raise UnicodeError("无法识别编码")
+
+
+def convert_files(paths: List[str], target: str, source: Optional[str], newline: Optional[str]) -> list:
+    # 进程池中执行：一批文件一次往返；单个文件失败不影响同批其余文件
+    out = []
+    for path in paths:
+        try:
+            out.append((path,) + convert_file(path, target, source, newline) + (None,))
+        except (OSError, UnicodeError) as exc:
+            out.append((path, "failed", None, 0, str(exc)))
+    return out
+
+
+def iter_convert_files(targets: List[str], globs: List[str]):
+    # 命令行给出的文件直接处理，目录按 globs 递归查找
+    for name in targets:
+        if os.path.isdir(name):
+            yield from iter_search_files(Path(name), globs, lambda: False)
+        elif os.path.isfile(name):
+            yield name, os.path.getsize(name)
+        else:
+            print("convert error: not found:", name, file=sys.stderr)
+
+
+def _convert_batches(files):
+    batch = []
+    size = 0
+    for path, n in files:
+        batch.append(path)
+        size += n
+        if len(batch) >= CONVERT_BATCH_FILES or size >= CONVERT_BATCH_BYTES:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+class ConvertStats:
+    def __init__(self) -> None:
+        self.counts = {"converted": 0, "unchanged": 0, "binary": 0, "failed": 0}
+        self.bytes = 0
+        self.sources = {}
+
+    def add(self, results: list, verbose: bool) -> None:
+        for path, status, enc, size, error in results:
+            self.counts[status] += 1
+            self.bytes += size
+            if enc is not None:
+                self.sources[enc] = self.sources.get(enc, 0) + 1
+            if error is not None:
+                print("convert error:", path, error, file=sys.stderr)
+            elif verbose:
+                print(f"{status}\t{enc or '-'}\t{path}")
+
+    def report(self, elapsed: float, out=sys.stdout) -> None:
+        files = sum(self.counts.values())
+        mb = self.bytes / 1e6
+        rate = max(elapsed, 1e-9)
+        print(f"{files} 个文件，{mb:.1f} MB，用时 {elapsed:.2f} s（{files / rate:.0f} 文件/s，{mb / rate:.1f} MB/s）", file=out)
+        print("  " + "，".join(f"{k} {v}" for k, v in self.counts.items()), file=out)
+        if self.sources:
+            print("  源编码：" + "，".join(f"{k} {v}" for k, v in sorted(self.sources.items())), file=out)
+
+
+def convert_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="notepad.py --convert", description="批量检测并转换文本文件的编码和换行")
+    parser.add_argument("--convert", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="+", help="文件或目录（目录递归处理，跳过隐藏目录）")
+    parser.add_argument("--to", default=DEFAULT_ENCODING, help="目标编码，默认 utf-8")
+    parser.add_argument("--from", dest="source", help="源编码；不指定时逐个文件自动探测")
+    parser.add_argument("--newline", choices=sorted(NEWLINES), default="keep", help="换行规范化，默认保持不变")
+    parser.add_argument("--glob", action="append", help="目录中要处理的文件名模式，可重复，默认 *")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("-v", "--verbose", action="store_true", help="逐个文件输出结果")
+    args = parser.parse_args(argv)
+    for enc in (args.to, args.source):
+        if enc is not None:
+            try:
+                codecs.lookup(enc)
+            except LookupError as exc:
+                parser.error(str(exc))
+    newline = NEWLINES[args.newline]
+    stats = ConvertStats()
+    t0 = time.perf_counter()
+    # 这个进程从不导入 Qt，可以直接 fork；没有 fork 的平台用 spawn
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    workers = max(1, args.jobs)
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        pending = set()
+        # 控制在途任务数：遍历不会远远跑在转换前面
+        for batch in _convert_batches(iter_convert_files(args.paths, args.glob or ["*"])):
+            pending.add(pool.submit(convert_files, batch, args.to, args.source, newline))
+            while len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    stats.add(fut.result(), args.verbose)
+        for fut in concurrent.futures.as_completed(pending):
+            stats.add(fut.result(), args.verbose)
+    stats.report(time.perf_counter() - t0)
+    return 1 if stats.counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(convert_main(sys.argv[1:]))
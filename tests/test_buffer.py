@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 片段表镜像：位置按 UTF-16 单元计，与逐字符串拼接的结果逐一对照
+import random
+
+import pytest
+
+from notepad_buffer import BLOCK_PIECES, PIECE_CHARS, PieceBuffer, utf16_length
+
+
+def to_units(text: str, index: int) -> int:
+    return utf16_length(text, 0, index)
+
+
+def apply(buf: PieceBuffer, text: str, start: int, end: int, insert: str) -> str:
+    # 按字符下标编辑参照字符串，同一编辑换算成 UTF-16 位置交给片段表
+    buf.replace(to_units(text, start), utf16_length(text, start, end), insert)
+    return text[:start] + insert + text[end:]
+
+
+def check(buf: PieceBuffer, text: str) -> None:
+    snap = buf.snapshot()
+    assert snap.text() == text
+    assert snap.units == utf16_length(text)
+    assert snap.newlines == text.count("\n")
+    assert list(snap.iter_lines()) == text.split("\n")
+
+
+def test_astral_characters() -> None:
+    buf = PieceBuffer()
+    text = "a😀b\n𝄞c\n"
+    buf.append(text)
+    check(buf, text)
+    # 在代理对前后插入、删除整个 BMP 以外的字符
+    text = apply(buf, text, 2, 2, "🎉")
+    text = apply(buf, text, 1, 2, "x")
+    text = apply(buf, text, 4, 5, "")
+    check(buf, text)
+    snap = buf.snapshot()
+    assert text == "ax🎉b𝄞c\n"
+    assert snap.text(1, 5) == "x🎉b"
+    assert snap.text(5, 7) == "𝄞"
+    # 片段表表示不了半个字符
+    with pytest.raises(ValueError):
+        buf.replace(3, 0, "y")
+
+
+def test_edits_across_block_boundaries() -> None:
+    rng = random.Random(1234)
+    buf = PieceBuffer()
+    text = ""
+    # 在不同位置插入，片段不能并入前一个插入片段，块很快写满并拆分
+    for i in range(BLOCK_PIECES * 6):
+        pos = rng.randint(0, len(text))
+        text = apply(buf, text, pos, pos, f"{i}{'😀' if i % 7 == 0 else ''}\n")
+    assert len(buf._blocks) > 2
+    check(buf, text)
+    # 跨越多个块的替换和删除，起止落在块边界上和块中间
+    for _ in range(200):
+        starts = [0]
+        for units in buf._units[:-1]:
+            starts.append(starts[-1] + units)
+        unit = rng.choice(starts) if rng.random() < 0.5 else rng.randint(0, buf.units)
+        start = next((i for i in range(len(text) + 1) if to_units(text, i) >= unit), len(text))
+        end = min(len(text), start + rng.randint(0, len(text) // 3))
+        text = apply(buf, text, start, end, rng.choice(["", "x", "新\n", "🎉\n" * 3]))
+    check(buf, text)
+
+
+def test_large_insert_is_split_into_pieces() -> None:
+    buf = PieceBuffer()
+    text = ("行" * 100 + "😀\n") * (PIECE_CHARS // 50)
+    buf.append(text)
+    check(buf, text)
+    text = apply(buf, text, PIECE_CHARS - 1, PIECE_CHARS + 1, "|")
+    check(buf, text)
+    snap = buf.snapshot()
+    for line in (0, 1, 500, snap.newlines):
+        assert snap.line_start(line) == to_units(text, sum(len(x) + 1 for x in text.split("\n")[:line]))
+
+
+def test_snapshot_unchanged_by_later_edits() -> None:
+    buf = PieceBuffer()
+    text = "".join(f"第 {i} 行 😀\n" for i in range(BLOCK_PIECES * 3))
+    buf.append(text)
+    old = buf.snapshot()
+    old_lines = list(old.iter_lines())
+    rng = random.Random(5)
+    for _ in range(100):
+        start = rng.randint(0, len(text))
+        end = min(len(text), start + rng.randint(0, 20))
+        text = apply(buf, text, start, end, rng.choice(["", "改", "🎉\n"]))
+    mid = buf.snapshot()
+    mid_text = text
+    text = apply(buf, text, 0, len(text) // 2, "")
+    # 两个快照都停留在拍摄时的内容
+    assert old.text() == "".join(f"第 {i} 行 😀\n" for i in range(BLOCK_PIECES * 3))
+    assert list(old.iter_lines()) == old_lines
+    assert old.line_start(2) == to_units(old.text(), old.text().index("第 2 行"))
+    assert mid.text() == mid_text
+    check(buf, text)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# notepad.py --convert 是纯命令行模式：主进程和工作进程都不应导入 PyQt5
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 强制用 spawn 启动工作进程（Windows 上的默认方式），再按命令行的方式运行 notepad.py
+RUNNER = """
+import multiprocessing, runpy, sys
+multiprocessing.get_all_start_methods = lambda: ["spawn"]
+sys.argv = [sys.argv[1]] + sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def test_convert_spawn_workers_do_not_import_qt(tmp_path: Path) -> None:
+    # 假的 PyQt5：谁导入它就留下记号并失败
+    fake = tmp_path / "fake"
+    (fake / "PyQt5").mkdir(parents=True)
+    marker = tmp_path / "qt_imported"
+    (fake / "PyQt5" / "__init__.py").write_text(
+        "import os\n"
+        f"open({str(marker)!r}, 'a').write(str(os.getpid()) + '\\n')\n"
+        "raise ImportError('PyQt5 imported by --convert')\n",
+        encoding="utf-8",
+    )
+    data = tmp_path / "data"
+    data.mkdir()
+    for i in range(4):
+        (data / f"f{i}.txt").write_bytes(f"第{i}行 中文内容\r\n".encode("gb18030") * 100)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(fake), str(ROOT)]))
+    proc = subprocess.run(
+        [sys.executable, "-c", RUNNER, str(ROOT / "notepad.py"), "--convert", str(data),
+         "--to", "utf-8", "--newline", "lf", "-j", "2"],
+        env=env, cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=120,
+    )
+    assert not marker.exists(), marker.read_text()
+    assert proc.returncode == 0, proc.stderr
+    for i in range(4):
+        assert (data / f"f{i}.txt").read_text(encoding="utf-8") == f"第{i}行 中文内容\n" * 100
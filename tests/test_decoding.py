@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# 多个候选编码的增量解码：前面全是 ASCII 时就地换编码，不重读
+import pytest
+
+from notepad_io import FallbackDecoder, FALLBACK_ENCODINGS, decode_chunks
+
+
+def decode_all(chunks, candidates=FALLBACK_ENCODINGS, translate=True):
+    decoder = FallbackDecoder(list(candidates), translate=translate)
+    return "".join(t for t, _ in decode_chunks(chunks, decoder)), decoder.encoding
+
+
+def test_switches_in_place_after_ascii_prefix() -> None:
+    tail = "末尾的中文内容\n".encode("gb18030")
+    chunks = [b"ascii line\n" * 100] * 5 + [b"more ascii " + tail]
+    text, enc = decode_all(chunks)
+    assert enc == "gb18030"
+    assert text == b"".join(chunks).decode("gb18030")
+
+
+def test_pending_cr_survives_switch() -> None:
+    # \r 在块末尾挂起，下一块换了编码，\r\n 仍然合成一个换行
+    text, enc = decode_all([b"a\r", b"\nb\x80\n"])
+    assert enc == "latin-1"
+    assert text == "a\nb\x80\n"
+
+
+def test_raises_when_prefix_is_not_ascii() -> None:
+    # 已给出的 UTF-8 中文在 GB18030 下含义不同，只能由调用方从头重读
+    decoder = FallbackDecoder(["utf-8", "gb18030"])
+    assert decoder.decode("中文\n".encode("utf-8")) == "中文\n"
+    with pytest.raises(UnicodeDecodeError):
+        decoder.decode("中文".encode("gb18030"))
+    assert decoder.encoding == "utf-8"
+
+
+def test_keeps_newlines_without_translate() -> None:
+    text, enc = decode_all([b"a\r\nb\r\n"], ["utf-8"], translate=False)
+    assert (text, enc) == ("a\r\nb\r\n", "utf-8")
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# 在文件中查找：逐行结果与按行 search 的结果一致，与解码块怎么切分无关
+import random
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+import notepad  # noqa: E402
+from notepad import SearchOptions, compile_search, grep_chunks, grep_file  # noqa: E402
+
+
+def expected(text: str, pattern):
+    out = []
+    for no, line in enumerate(text.split("\n"), 1):
+        m = pattern.search(line)
+        if m is not None:
+            out.append((no, m.start() + 1, line[:notepad.FIND_IN_FILES_LINE_CHARS]))
+    return out
+
+
+def random_chunks(text: str, rng: random.Random):
+    chunks = []
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 50)
+        chunks.append(text[i:i + n])
+        i += n
+    return chunks
+
+
+TEXT = "".join(f"第{i}行 {'😀' * (i % 3)}foo foo{'𝄞' if i % 5 == 0 else ''}\n" for i in range(300)) + "尾 foo"
+
+
+@pytest.mark.parametrize("source", ["foo", "😀foo", r"(o)\1", r"^第\d+0行", r"𝄞$"])
+def test_chunk_boundaries(source: str) -> None:
+    pattern = compile_search(SearchOptions(source, regex=True))
+    rng = random.Random(source)
+    for _ in range(5):
+        results, truncated = grep_chunks(random_chunks(TEXT, rng), pattern, False, 10 ** 6)
+        assert not truncated
+        assert results == expected(TEXT, pattern)
+
+
+def test_spanning_pattern() -> None:
+    pattern = compile_search(SearchOptions(r"foo\n第", regex=True))
+    results, _ = grep_chunks(random_chunks(TEXT, random.Random(1)), pattern, True, 10 ** 6)
+    assert [r[0] for r in results] == [i + 1 for i in range(299) if i % 5]
+
+
+def test_limit_sets_truncated() -> None:
+    pattern = compile_search(SearchOptions("foo"))
+    results, truncated = grep_chunks([TEXT], pattern, False, 10)
+    assert truncated and len(results) == 10
+
+
+def test_overlong_line(monkeypatch) -> None:
+    # 超长单行按 FIND_IN_FILES_MAX_CARRY 分段：列号从行首算起，同一行只报一次，后面的行号不受影响
+    monkeypatch.setattr(notepad, "FIND_IN_FILES_MAX_CARRY", 64)
+    text = "短行\n" + "x" * 100 + "foo" + "y" * 200 + "foo\n末行 foo\n"
+    pattern = compile_search(SearchOptions("foo"))
+    results, _ = grep_chunks(random_chunks(text, random.Random(2)), pattern, False, 10 ** 6)
+    assert [(no, col) for no, col, _ in results] == [(2, 101), (3, 4)]
+    # 跨越分段处的匹配找不到（已知限制）
+    text = "x" * 63 + "foo\n"
+    results, _ = grep_chunks(list(text), pattern, False, 10 ** 6)
+    assert results == []
+
+
+def test_grep_file_encoding(tmp_path: Path) -> None:
+    path = tmp_path / "gb.txt"
+    path.write_bytes(("ascii\n" * 5000 + "中文 foo\n").encode("gb18030"))
+    _, size, encoding, results, truncated = grep_file(str(path), SearchOptions("foo"))
+    assert size == path.stat().st_size and encoding == "gb18030" and not truncated
+    assert results == [(5001, 4, "中文 foo")]
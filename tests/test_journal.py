@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# 崩溃恢复日志：写入记录后回放，结果应与编辑后的文本一致；最后一条写了一半时丢弃它
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+import notepad  # noqa: E402
+from notepad import AutosaveJournal, JournalBaseChanged, JournalWriter, replay_journal  # noqa: E402
+from notepad_buffer import utf16_length  # noqa: E402
+
+
+@pytest.fixture
+def writer(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(notepad, "JOURNAL_DIR", tmp_path / "journal")
+    w = JournalWriter()
+    w.start()
+    yield w
+    w.stop()
+
+
+def sync(journal: AutosaveJournal) -> None:
+    # 等写入线程处理完已提交的操作并写到磁盘
+    done = threading.Event()
+    journal.writer.submit(journal._w_flush)
+    journal.writer.submit(done.set)
+    assert done.wait(10)
+
+
+def edit(journal: AutosaveJournal, text: str, start: int, end: int, insert: str) -> str:
+    # 按字符下标编辑，记录里的位置和长度换算成 UTF-16 单元
+    journal.record(utf16_length(text, 0, start), utf16_length(text, start, end), insert)
+    return text[:start] + insert + text[end:]
+
+
+def make_edits(journal: AutosaveJournal, text: str) -> str:
+    text = edit(journal, text, 0, 0, "第一行 😀\n")
+    text = edit(journal, text, len(text), len(text), "末尾 🎉\n")
+    text = edit(journal, text, 2, 4, "")
+    text = edit(journal, text, 3, 3, "\n中间\n")
+    return text
+
+
+def test_replay_empty_base(writer) -> None:
+    journal = AutosaveJournal(writer, None, "utf-8", {"kind": "empty"}, 0)
+    text = make_edits(journal, "")
+    # Qt 文档里可能有落单的代理项，日志按 surrogatepass 原样保存
+    text = edit(journal, text, 1, 1, "\ud800")
+    sync(journal)
+    header, replayed = replay_journal(journal.file)
+    assert header["base"] == {"kind": "empty"}
+    assert replayed == text
+
+
+def test_truncated_last_record_is_dropped(writer) -> None:
+    journal = AutosaveJournal(writer, None, "utf-8", {"kind": "empty"}, 0)
+    text = make_edits(journal, "")
+    before_last = text
+    text = edit(journal, text, 1, 1, "最后一条记录")
+    sync(journal)
+    data = journal.file.read_bytes()
+    assert data.endswith(b"\n")
+    # 从最后一条记录中间截断：前面的记录照常回放
+    for cut in (1, 5, len("最后一条记录".encode("utf-8"))):
+        journal.file.write_bytes(data[:-cut])
+        assert replay_journal(journal.file)[1] == before_last
+    journal.file.write_bytes(data)
+    assert replay_journal(journal.file)[1] == text
+
+
+def test_file_base_and_compaction(writer, tmp_path: Path) -> None:
+    doc = tmp_path / "doc.txt"
+    doc.write_text("原始内容\n第二行\n", encoding="utf-8")
+    fp = notepad.file_fingerprint(doc)
+    journal = AutosaveJournal(writer, doc, "utf-8", {"kind": "file", "fingerprint": fp}, fp["size"])
+    text = make_edits(journal, "原始内容\n第二行\n")
+    sync(journal)
+    assert replay_journal(journal.file)[1] == text
+    # 压缩：回放成快照，之后的记录在快照上继续
+    writer.submit(journal._w_compact)
+    sync(journal)
+    header, replayed = replay_journal(journal.file)
+    assert header["base"]["kind"] == "snapshot"
+    assert (journal.file.parent / header["base"]["file"]).exists()
+    assert replayed == text
+    text = edit(journal, text, 0, 1, "替换")
+    sync(journal)
+    assert replay_journal(journal.file)[1] == text
+    # 快照不依赖原文件
+    doc.write_text("外部修改", encoding="utf-8")
+    assert replay_journal(journal.file)[1] == text
+
+
+def test_base_changed(writer, tmp_path: Path) -> None:
+    doc = tmp_path / "doc.txt"
+    doc.write_text("abc\n", encoding="utf-8")
+    fp = notepad.file_fingerprint(doc)
+    journal = AutosaveJournal(writer, doc, "utf-8", {"kind": "file", "fingerprint": fp}, fp["size"])
+    edit(journal, "abc\n", 1, 2, "X")
+    sync(journal)
+    doc.write_text("abcd\n", encoding="utf-8")
+    with pytest.raises(JournalBaseChanged):
+        replay_journal(journal.file)
+    # 原文件变了就不能压缩，日志保持原样
+    writer.submit(journal._w_compact)
+    sync(journal)
+    assert journal.header["base"]["kind"] == "file"
+    doc.write_text("abc\n", encoding="utf-8")
+    os.utime(doc, ns=(fp["mtime_ns"], fp["mtime_ns"]))
+    assert replay_journal(journal.file)[1] == "aXc\n"
+
+
+def test_rebase_to_file_drops_saved_records(writer, tmp_path: Path) -> None:
+    journal = AutosaveJournal(writer, None, "utf-8", {"kind": "empty"}, 0)
+    text = make_edits(journal, "")
+    mark = journal.checkpoint()
+    # 保存期间的编辑留在日志里，保存完成后接在新的文件基准之后
+    after = edit(journal, text, 0, 0, "保存期间\n")
+    doc = tmp_path / "saved.txt"
+    doc.write_text(text, encoding="utf-8", newline="")
+    journal.rebase_to_file(doc, "utf-8", notepad.file_fingerprint(doc), mark)
+    sync(journal)
+    header, replayed = replay_journal(journal.file)
+    assert header["base"]["kind"] == "file" and header["path"] == str(doc)
+    assert replayed == after
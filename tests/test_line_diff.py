@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# 重新加载时的行级差异：把操作依次套到旧文本上必须得到新文本，且只替换真正变化的行
+import random
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from notepad import RELOAD_DIFF_SMALL_LINES, _split_lines, line_diff  # noqa: E402
+
+
+def apply_ops(old: str, ops) -> str:
+    # 与界面线程一致：从后往前替换，前面的行号不受影响
+    lines = _split_lines(old)
+    for start, end, text in reversed(ops):
+        lines[start:end] = [text]
+    return "".join(lines)
+
+
+def check(old: str, new: str):
+    ops = line_diff(old, new)
+    assert [op[0] for op in ops] == sorted(op[0] for op in ops)
+    assert apply_ops(old, ops) == new
+    return ops
+
+
+BASE = "".join(f"line {i}\n" for i in range(10))
+
+
+@pytest.mark.parametrize("at", [0, 5, 10])
+def test_insert(at: int) -> None:
+    lines = _split_lines(BASE)
+    new = "".join(lines[:at] + ["new\n"] + lines[at:])
+    assert check(BASE, new) == [(at, at, "new\n")]
+
+
+@pytest.mark.parametrize("at", [0, 5, 9])
+def test_delete(at: int) -> None:
+    lines = _split_lines(BASE)
+    new = "".join(lines[:at] + lines[at + 1:])
+    assert check(BASE, new) == [(at, at + 1, "")]
+
+
+def test_replace_middle_line() -> None:
+    new = BASE.replace("line 4\n", "changed\n")
+    assert check(BASE, new) == [(4, 5, "changed\n")]
+
+
+def test_empty_files() -> None:
+    assert check("", "") == []
+    assert check("", "a\nb\n") == [(0, 0, "a\nb\n")]
+    assert check("a\nb\n", "") == [(0, 2, "")]
+
+
+def test_no_trailing_newline() -> None:
+    # 最后一行没有换行符：追加内容要替换最后一行，而不是在它后面插入
+    assert check("a\nb", "a\nb\nc") == [(1, 2, "b\nc")]
+    check("a\nb\n", "a\nb")
+    assert check("a\nb", "a\nbc") == [(1, 2, "bc")]
+
+
+def test_repeated_lines_use_unique_anchors() -> None:
+    # 超过小范围阈值后按只出现一次的行分段（patience diff），大量重复的行不会让差异退化成整段替换
+    rng = random.Random(7)
+    old_lines = []
+    for i in range(RELOAD_DIFF_SMALL_LINES):
+        old_lines.append(f"unique {i}\n")
+        old_lines.extend(["}\n", "\n"])
+    new_lines = list(old_lines)
+    for k in sorted(rng.sample(range(len(new_lines)), 20), reverse=True):
+        new_lines.insert(k, f"inserted {k}\n")
+    del new_lines[100:103]
+    old, new = "".join(old_lines), "".join(new_lines)
+    ops = check(old, new)
+    changed = sum(end - start for start, end, _ in ops)
+    assert changed <= 3
+    assert len(ops) <= 21
+
+
+def test_random_edits() -> None:
+    rng = random.Random(3)
+    words = ["a\n", "b\n", "c\n", "}\n", "\n", "x"]
+    for _ in range(200):
+        old = "".join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+        new = "".join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+        check(old, new)
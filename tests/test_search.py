@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# 查找与全部替换：位置按 UTF-16 单元计，分块扫描的结果与整段 finditer/sub 一致
+import random
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from notepad import (  # noqa: E402
+    SearchOptions, _utf16_to_index, compile_search, find_matches, replace_all_text, search_spans_lines, utf16_offset,
+)
+
+
+def expected_spans(text: str, pattern):
+    return [(utf16_offset(text, m.start()), utf16_offset(text, m.end()) - utf16_offset(text, m.start()))
+            for m in pattern.finditer(text)]
+
+
+def found_spans(text: str, pattern, spanning: bool, chunk_chars: int):
+    spans = []
+    for starts, lengths in find_matches(text, pattern, spanning, chunk_chars=chunk_chars):
+        spans.extend(zip(starts, lengths))
+    return spans
+
+
+def apply_replace(text: str, result) -> str:
+    # 与界面线程一致：在 UTF-16 坐标里把 [起点, 终点) 换成新文本
+    start, end, new, _ = result
+    units = text.encode("utf-16-le", "surrogatepass")
+    return (units[:2 * start] + new.encode("utf-16-le", "surrogatepass") + units[2 * end:]).decode(
+        "utf-16-le", "surrogatepass")
+
+
+TEXT = "".join(f"第{i}行 foo😀bar {'𝄞' * (i % 3)}foo\n" for i in range(200)) + "末尾foo"
+
+
+@pytest.mark.parametrize("chunk_chars", [1, 7, 64, 1 << 20])
+@pytest.mark.parametrize("opts", [
+    SearchOptions("foo"),
+    SearchOptions("😀bar"),
+    SearchOptions(r"^第\d+", regex=True),
+    SearchOptions(r"o$", regex=True),
+    SearchOptions(r"(o)\1", regex=True),
+    SearchOptions("FOO", whole_word=True),
+])
+def test_find_matches_across_chunks(opts: SearchOptions, chunk_chars: int) -> None:
+    pattern = compile_search(opts)
+    assert not search_spans_lines(opts)
+    assert found_spans(TEXT, pattern, False, chunk_chars) == expected_spans(TEXT, pattern)
+
+
+def test_find_matches_spanning_lines() -> None:
+    opts = SearchOptions(r"foo\n第", regex=True)
+    assert search_spans_lines(opts)
+    pattern = compile_search(opts)
+    spans = found_spans(TEXT, pattern, True, 7)
+    assert len(spans) == 199 and spans == expected_spans(TEXT, pattern)
+
+
+def test_astral_offsets() -> None:
+    text = "😀a😀\n𝄞a"
+    pattern = compile_search(SearchOptions("a"))
+    assert found_spans(text, pattern, False, 1) == [(2, 1), (8, 1)]
+    assert _utf16_to_index(text, 2) == 1
+    assert _utf16_to_index(text, 8) == 5
+    assert _utf16_to_index("abc", 2) == 2
+
+
+@pytest.mark.parametrize("opts, replacement, expected", [
+    (SearchOptions("foo"), "X", "X"),
+    # 非正则模式下替换文本里的反斜杠原样保留
+    (SearchOptions("foo"), r"\1\n", r"\1\n"),
+    (SearchOptions(r"(f)(o+)", regex=True), r"\2\1", "oof"),
+    (SearchOptions(r"(?P<w>bar)", regex=True), r"<\g<w>>", "<bar>"),
+])
+def test_replace_all(opts: SearchOptions, replacement: str, expected: str) -> None:
+    pattern = compile_search(opts)
+    result = replace_all_text(TEXT, pattern, replacement, opts.regex, search_spans_lines(opts))
+    template = replacement if opts.regex else replacement.replace("\\", "\\\\")
+    assert apply_replace(TEXT, result) == pattern.sub(template, TEXT)
+    assert result[3] == len(pattern.findall(TEXT))
+    assert expected in result[2]
+
+
+def test_replace_all_keeps_line_context() -> None:
+    # 从首个匹配所在行的行首开始替换，^ 和后顾断言看到的上下文与整段替换相同
+    text = "😀 keep\nab ab\n𝄞ab\n"
+    for source in (r"^ab", r"(?<=b )ab", r"\bab"):
+        pattern = compile_search(SearchOptions(source, case_sensitive=True, regex=True))
+        result = replace_all_text(text, pattern, "Z", True, False)
+        assert apply_replace(text, result) == pattern.sub("Z", text)
+        # 首尾不变的部分不在替换范围内
+        assert result[0] == utf16_offset(text, text.index("\n") + 1)
+
+
+def test_replace_all_random() -> None:
+    rng = random.Random(11)
+    pattern = compile_search(SearchOptions(r"a(b?)", regex=True))
+    for _ in range(200):
+        text = "".join(rng.choice(["a", "b", "😀", "\n", "中"]) for _ in range(rng.randint(0, 40)))
+        result = replace_all_text(text, pattern, r"[\1]", True, False)
+        if result is None:
+            assert pattern.search(text) is None
+        else:
+            assert apply_replace(text, result) == pattern.sub(r"[\1]", text)